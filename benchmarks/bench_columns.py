@@ -0,0 +1,98 @@
+"""Benchmark of the in-memory representation of a scraped playlist, comparing the typed column buffers with the
+previous representation: nested per-page lists flattened into Python lists, full URL strings and a float year
+column. Reports the memory retained by the collected records, the peak while collecting them and the time to turn
+them into dataframes.
+
+Run from the repository root with: python -m benchmarks.bench_columns"""
+import gc
+import time
+import itertools
+import tracemalloc
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from utils.letterboxd_scraping_functions import collect_ids_ratings_and_urls, collect_remaining_film_data
+from utils.data_wrangling_utils import get_ratings_dataframe, get_film_data_dataframe
+
+SIZES = (10_000, 100_000)
+FILMS_PER_PAGE = 72
+N_DIRECTORS = 2_000
+COUNTRIES = ("USA", "France", "Italy", "Japan", "UK;USA", "France;Italy")
+
+
+def get_page_records(n_films: int) -> list[tuple]:
+    """Returns the (ids, ratings, slugs) record of every page of a playlist, as the extractors return them"""
+    ids = list(range(n_films))
+    return [(ids[start:start + FILMS_PER_PAGE],
+             [film_id % 10 + 1 for film_id in ids[start:start + FILMS_PER_PAGE]],
+             [f"/film/film-{film_id}/" for film_id in ids[start:start + FILMS_PER_PAGE]])
+            for start in range(0, n_films, FILMS_PER_PAGE)]
+
+
+def get_film_records(n_films: int) -> list[tuple]:
+    """Returns one record per film, with names built per page like the JSON-LD decoder does, so that equal names
+    are distinct string objects. Directors and countries repeat across films, joined casts do not"""
+    return [(film_id, f"Film {film_id}", np.nan if film_id % 50 == 0 else 1950 + film_id % 70,
+             "".join(("Director ", str(film_id % N_DIRECTORS))),
+             ", ".join(f"Actor {film_id + billing}" for billing in range(3)),
+             "".join(COUNTRIES[film_id % len(COUNTRIES)])) for film_id in range(n_films)]
+
+
+def collect_ids_ratings_and_urls_as_lists(page_records: list[tuple]) -> dict:
+    """The previous collect_ids_ratings_and_urls, which also built every full URL while extracting"""
+    ids_ratings_urls_dict = defaultdict()
+    ids_ratings_urls_dict["ids"] = list(itertools.chain(*[record[0] for record in page_records]))
+    ids_ratings_urls_dict["ratings"] = list(itertools.chain(*[record[1] for record in page_records]))
+    ids_ratings_urls_dict["urls"] = list(itertools.chain(*[["https://letterboxd.com" + slug for slug in record[2]]
+                                                           for record in page_records]))
+    return ids_ratings_urls_dict
+
+
+def collect_remaining_film_data_as_lists(film_records: list[tuple]) -> dict:
+    """The previous collect_remaining_film_data"""
+    columns = [list(column) for column in zip(*film_records)]
+    return dict(zip(("film_ids", "titles", "years", "directors", "actors", "countries"), columns))
+
+
+def measure(collect, get_records, n_films: int) -> tuple[dict, float, float]:
+    """Returns the collected records with the memory they retain once the extracted records are dropped, as they
+    are after each page in a run, and the peak while collecting them, in MiB"""
+    gc.collect()
+    tracemalloc.start()
+    records = get_records(n_films)
+    collected = collect(records)
+    del records
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return collected, retained / 2 ** 20, peak / 2 ** 20
+
+
+def time_dataframe(to_dataframe, collected: dict) -> float:
+    start = time.perf_counter()
+    to_dataframe(collected)
+    return time.perf_counter() - start
+
+
+def to_ratings_dataframe_as_before(ids_ratings_urls_dict: dict) -> pd.DataFrame:
+    return pd.DataFrame(ids_ratings_urls_dict).rename(columns={'ids': 'id', 'ratings': 'rating'}).drop(columns='urls')
+
+
+def main():
+    for n_films in SIZES:
+        print(f"{n_films} films")
+        for name, get_records, before, after, to_dataframe_before, to_dataframe_after in (
+                ("playlist pages", get_page_records, collect_ids_ratings_and_urls_as_lists,
+                 collect_ids_ratings_and_urls, to_ratings_dataframe_as_before, get_ratings_dataframe),
+                ("film pages", get_film_records, collect_remaining_film_data_as_lists,
+                 collect_remaining_film_data, get_film_data_dataframe, get_film_data_dataframe)):
+            collected_before, retained_before, peak_before = measure(before, get_records, n_films)
+            collected_after, retained_after, peak_after = measure(after, get_records, n_films)
+            print(f"  {name:<15} retained {retained_before:7.2f} -> {retained_after:7.2f} MiB, "
+                  f"peak {peak_before:7.2f} -> {peak_after:7.2f} MiB, dataframe "
+                  f"{time_dataframe(to_dataframe_before, collected_before) * 1e3:7.1f} -> "
+                  f"{time_dataframe(to_dataframe_after, collected_after) * 1e3:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Benchmark of the reconciliation of a scraped playlist against the stored one, comparing the vectorized change
+report with the previous diff, which looped in Python and tested each film ID for membership in a NumPy array.
+
+Run from the repository root with: python -m benchmarks.bench_diff"""
+import time
+import numpy as np
+import pandas as pd
+from utils.data_wrangling_utils import get_change_report
+
+SIZES = (10_000, 100_000)
+CHANGED_FRACTION = 0.01
+
+
+def get_new_records_per_film(current_film_ids: np.ndarray, ids_ratings_urls_dict: dict) -> list[str]:
+    """The previous get_new_records: a linear scan of current_film_ids for every scraped film"""
+    new_entries = []
+    for film_id, url in zip(ids_ratings_urls_dict["ids"], ids_ratings_urls_dict["urls"]):
+        if film_id not in current_film_ids:
+            new_entries.append(url)
+    return new_entries
+
+
+def get_playlists(n_films: int) -> tuple[pd.DataFrame, dict]:
+    """Returns a stored playlist and a scraped version of it in which 1% of the films were added, removed or
+    re-rated"""
+    rng = np.random.default_rng(0)
+    n_changed = int(n_films * CHANGED_FRACTION)
+    current_df = pd.DataFrame({"id": np.arange(n_films), "rating": rng.integers(1, 11, n_films)})
+    scraped_df = current_df.iloc[n_changed:].copy()
+    scraped_df.iloc[:n_changed, 1] = scraped_df.iloc[:n_changed, 1] % 10 + 1
+    added_df = pd.DataFrame({"id": np.arange(n_films, n_films + n_changed), "rating": rng.integers(1, 11, n_changed)})
+    scraped_df = pd.concat([scraped_df, added_df]).sample(frac=1, random_state=0)
+    return current_df, {"ids": scraped_df["id"].tolist(),
+                        "ratings": scraped_df["rating"].tolist(),
+                        "urls": [f"https://letterboxd.com/film/film-{film_id}/" for film_id in scraped_df["id"]]}
+
+
+def main():
+    for n_films in SIZES:
+        current_df, ids_ratings_urls_dict = get_playlists(n_films)
+
+        start = time.perf_counter()
+        report = get_change_report(current_df=current_df, ids_ratings_urls_dict=ids_ratings_urls_dict)
+        vectorized_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new_records = get_new_records_per_film(current_film_ids=current_df["id"].unique(),
+                                               ids_ratings_urls_dict=ids_ratings_urls_dict)
+        per_film_time = time.perf_counter() - start
+        assert sorted(new_records) == sorted(report.new_urls), "the two diffs disagree"
+
+        print(f"{n_films:>7} films: per-film membership tests {per_film_time * 1e3:9.1f} ms (new films only), "
+              f"vectorized change report {vectorized_time * 1e3:7.1f} ms "
+              f"({len(report.added)} added, {len(report.removed)} removed, {len(report.rerated)} re-rated), "
+              f"speed-up {per_film_time / vectorized_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Micro-benchmark of the per-film extraction cost of FilmSoup, comparing the current single-pass JSON-LD decoding
+with the previous approach that searched and decoded the JSON-LD block once per field.
+
+Run from the repository root with: python -m benchmarks.bench_film_soup"""
+import json
+import timeit
+import numpy as np
+from utils.generic_scraping_functions import get_soup_object_out_of_parsed_html
+from utils.letterboxd_scraping_functions import FilmSoup, get_film_record
+from benchmarks.html_fixtures import get_film_page_html
+
+N_FILMS = 50
+REPEATS = 5
+
+
+def decode_structured_data_per_field(soup) -> dict:
+    s = soup.find("script", {"type": "application/ld+json"}).string
+    s = s.replace('\n/* <![CDATA[ */\n', '').replace('\n/* ]]> */\n', '')
+    return json.loads(s)
+
+
+def get_names_per_field(soup, key: str):
+    try:
+        return ';'.join([item['name'] for item in decode_structured_data_per_field(soup)[key]])
+    except KeyError:
+        return np.nan
+
+
+def get_year_per_field(soup):
+    try:
+        return int(decode_structured_data_per_field(soup)['releasedEvent'][0]['startDate'])
+    except KeyError:
+        return np.nan
+
+
+def get_film_record_per_field(soup) -> tuple:
+    """The previous FilmSoup behaviour: five independent searches and decodes of the JSON-LD block"""
+    return (int(soup.find("div", class_="really-lazy-load").get("data-film-id")),
+            decode_structured_data_per_field(soup)['name'],
+            get_year_per_field(soup),
+            get_names_per_field(soup, 'director'),
+            get_names_per_field(soup, 'actors'),
+            get_names_per_field(soup, 'countryOfOrigin'))
+
+
+def main():
+    soups = [get_soup_object_out_of_parsed_html(get_film_page_html(film_id)) for film_id in range(1, N_FILMS + 1)]
+
+    single_pass = [get_film_record(FilmSoup(soup)) for soup in soups]
+    per_field = [get_film_record_per_field(soup) for soup in soups]
+    assert str(single_pass) == str(per_field), "the two extraction strategies disagree"
+
+    single_pass_time = min(timeit.repeat(lambda: [get_film_record(FilmSoup(soup)) for soup in soups],
+                                         number=1, repeat=REPEATS)) / N_FILMS
+    per_field_time = min(timeit.repeat(lambda: [get_film_record_per_field(soup) for soup in soups],
+                                       number=1, repeat=REPEATS)) / N_FILMS
+
+    print(f"per-field JSON-LD decoding:  {per_field_time * 1e6:10.1f} us/film")
+    print(f"single-pass JSON-LD decoding: {single_pass_time * 1e6:9.1f} us/film")
+    print(f"speed-up: {per_field_time / single_pass_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
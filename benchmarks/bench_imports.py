@@ -0,0 +1,54 @@
+"""Measures the start-up cost of the CLI: the wall time of `main.py --help`, the time to import main and which heavy
+dependencies that import loads, next to the import time of each dependency on its own. Every measurement runs in a
+fresh interpreter, so nothing is served from an already populated sys.modules.
+
+Run from the repository root with: python -m benchmarks.bench_imports"""
+import sys
+import json
+import time
+import subprocess
+
+REPEATS = 5
+HEAVY_MODULES = ("pandas", "pyarrow", "aiohttp", "bs4", "requests", "boto3", "botocore", "sqlalchemy")
+IMPORT_SNIPPET = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - start,
+                  "loaded": [m for m in {heavy_modules!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module: str) -> dict:
+    """Returns the fastest of REPEATS imports of a module in a fresh interpreter, with the heavy modules it loaded"""
+    runs = []
+    for _ in range(REPEATS):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET.format(module=module,
+                                                                             heavy_modules=HEAVY_MODULES)],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return min(runs, key=lambda run: run["seconds"])
+
+
+def time_help() -> float:
+    """Returns the fastest wall time of a `main.py --help` process"""
+    durations = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "main.py", "--help"], capture_output=True, check=True)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    print(f"main.py --help: {time_help() * 1e3:8.1f} ms")
+    result = time_import("main")
+    print(f"import main:    {result['seconds'] * 1e3:8.1f} ms, loads {', '.join(result['loaded'])}")
+    not_loaded = [module for module in HEAVY_MODULES if module not in result["loaded"]]
+    print(f"  deferred until a stage needs them: {', '.join(not_loaded)}")
+    for module in HEAVY_MODULES:
+        print(f"  import {module:<12} {time_import(module)['seconds'] * 1e3:8.1f} ms on its own")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compares the CPU time and peak memory needed to scrape one page with BeautifulSoup and with the lightweight lxml
+engine selected by --soupification lightweight. Memory is measured with tracemalloc, which sees the Python objects of
+a BeautifulSoup tree but not the C allocations of an lxml tree, so the lightweight figure is a lower bound.
+
+Run from the repository root with: python -m benchmarks.bench_parsers"""
+import timeit
+import tracemalloc
+from utils import letterboxd_scraping_functions, lightweight_scraping_functions
+from benchmarks.html_fixtures import get_playlist_page_html, get_film_page_html
+
+REPEATS = 10
+
+
+def get_peak_memory(func, html_page) -> int:
+    """Returns the peak number of bytes allocated while scraping a page"""
+    tracemalloc.start()
+    func(html_page)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def compare(name: str, html_page: str, soup_func, lightweight_func) -> None:
+    assert str(soup_func(html_page)) == str(lightweight_func(html_page)), f"the two engines disagree on {name}"
+    soup_time = min(timeit.repeat(lambda: soup_func(html_page), number=1, repeat=REPEATS))
+    lightweight_time = min(timeit.repeat(lambda: lightweight_func(html_page), number=1, repeat=REPEATS))
+    soup_memory = get_peak_memory(soup_func, html_page)
+    lightweight_memory = get_peak_memory(lightweight_func, html_page)
+    print(f"{name} ({len(html_page) / 1024:.0f} KiB)")
+    print(f"  beautifulsoup: {soup_time * 1e3:8.2f} ms  {soup_memory / 1024:9.0f} KiB peak")
+    print(f"  lightweight:   {lightweight_time * 1e3:8.2f} ms  {lightweight_memory / 1024:9.0f} KiB peak")
+    print(f"  {soup_time / lightweight_time:.1f}x faster, {soup_memory / lightweight_memory:.1f}x less memory")
+
+
+def main():
+    compare(name="playlist page",
+            html_page=get_playlist_page_html(first_film_id=1, n_films=72, n_pages=100),
+            soup_func=letterboxd_scraping_functions.extract_ids_ratings_and_urls,
+            lightweight_func=lightweight_scraping_functions.extract_ids_ratings_and_urls)
+    compare(name="film page",
+            html_page=get_film_page_html(film_id=1),
+            soup_func=letterboxd_scraping_functions.extract_film_data,
+            lightweight_func=lightweight_scraping_functions.extract_film_data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Offline benchmark of every stage of the pipeline at several playlist sizes. Playlist and film pages are served by a
+local stand-in for Letterboxd out of a fixture corpus, S3 writes go to a moto stand-in and database writes go to the
+Postgres at BENCHMARK_DATABASE_URL, if one is set. Each stage is run once to time it and once more under tracemalloc
+to measure its peak Python memory, which leaves out the memory of worker processes and of lxml trees.
+
+Results can be saved with --output and compared against a previous run with --baseline.
+
+Run from the repository root with: python -m benchmarks.bench_pipeline --sizes 50,300"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import resource
+import itertools
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Any, Callable
+import boto3
+import sqlalchemy
+from utils import lightweight_scraping_functions
+from utils.enums_classes import ParallelTechnique, StorageFormat
+from utils.http_utils import FetchConfig, HttpClient
+from utils.generic_scraping_functions import parse_all_urls_asynchronously, get_soup_objects_synchronously,\
+    get_soup_objects_multithreading, extract_records_multiprocessing, stream_all_urls, get_process_pool
+from utils.letterboxd_scraping_functions import scrape_ids_ratings_and_urls, scrape_remaining_film_data,\
+    extract_ids_ratings_and_urls, extract_film_data, collect_remaining_film_data
+from utils.data_wrangling_utils import get_ratings_dataframe, get_film_data_dataframe,\
+    inner_join_two_dataframes_on_film_id, sort_dataframe_by_year_and_title
+from utils.s3_utils import write_dataframe_to_s3
+from utils.database_utils import write_to_database, upsert_to_database
+from benchmarks.fixture_corpus import write_corpus, get_playlist_page_paths, get_film_path
+from benchmarks.fixture_server import FixtureServer
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+BUCKET = "benchmark"
+DEFAULT_SIZES = "50,300"
+SOUPIFICATION_MODES = (ParallelTechnique.SYNCHRONOUS,
+                       ParallelTechnique.MULTITHREADING,
+                       ParallelTechnique.MULTIPROCESSING,
+                       ParallelTechnique.LIGHTWEIGHT)
+
+
+@dataclass
+class StageResult:
+    size: int
+    stage: str
+    items: int
+    seconds: float
+    peak_memory: int
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds else float("inf")
+
+
+def get_peak_memory(func: Callable[[], Any]) -> int:
+    """Returns the peak number of bytes allocated by Python while running func"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(size: int, stage: str, items: int, func: Callable[[], Any]) -> tuple[StageResult, Any]:
+    """Times func, then runs it again to measure its peak memory. Returns the result of the timed run"""
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    stage_result = StageResult(size=size, stage=stage, items=items, seconds=seconds, peak_memory=get_peak_memory(func))
+    print(f"{size:>7} {stage:<52} {items:>7} {seconds:9.3f}s {stage_result.throughput:10.1f}/s "
+          f"{stage_result.peak_memory / 2 ** 20:9.1f} MiB", flush=True)
+    return stage_result, result
+
+
+def get_soup_objects(html_pages: list[str], parallel_technique: ParallelTechnique) -> list:
+    if parallel_technique == ParallelTechnique.MULTITHREADING:
+        return get_soup_objects_multithreading(html_pages=html_pages)
+    return get_soup_objects_synchronously(html_pages=html_pages)
+
+
+def benchmark_soupification(size: int,
+                            parallel_technique: ParallelTechnique,
+                            playlist_pages: list[str],
+                            film_pages: list[str],
+                            executor) -> list[StageResult]:
+    """Times the scraping of the downloaded playlist and film pages the way a --soupification mode does it, timing
+    scrape_remaining_film_data apart from the soupification for the BeautifulSoup modes"""
+    mode = parallel_technique.value
+    results = []
+    if parallel_technique == ParallelTechnique.LIGHTWEIGHT:
+        results.append(measure(size, f"scrape_ids_ratings_and_urls[{mode}]", len(playlist_pages),
+                               lambda: lightweight_scraping_functions.scrape_ids_ratings_and_urls(playlist_pages))[0])
+        results.append(measure(size, f"scrape_remaining_film_data[{mode}]", len(film_pages),
+                               lambda: lightweight_scraping_functions.scrape_remaining_film_data(film_pages))[0])
+    elif parallel_technique == ParallelTechnique.MULTIPROCESSING:
+        results.append(measure(size, f"scrape_ids_ratings_and_urls[{mode}]", len(playlist_pages),
+                               lambda: extract_records_multiprocessing(playlist_pages, extract_ids_ratings_and_urls,
+                                                                       executor))[0])
+        results.append(measure(size, f"scrape_remaining_film_data[{mode}]", len(film_pages),
+                               lambda: collect_remaining_film_data(
+                                   extract_records_multiprocessing(film_pages, extract_film_data, executor)))[0])
+    else:
+        results.append(measure(size, f"scrape_ids_ratings_and_urls[{mode}]", len(playlist_pages),
+                               lambda: scrape_ids_ratings_and_urls(get_soup_objects(playlist_pages,
+                                                                                       parallel_technique)))[0])
+        soup_result, film_soups = measure(size, f"soupification[{mode}]", len(film_pages),
+                                          lambda: get_soup_objects(film_pages, parallel_technique))
+        results.append(soup_result)
+        results.append(measure(size, f"scrape_remaining_film_data[{mode}]", len(film_pages),
+                               lambda: scrape_remaining_film_data(film_soups))[0])
+    return results
+
+
+def benchmark_streaming(size: int,
+                        parallel_technique: ParallelTechnique,
+                        film_urls: list[str],
+                        http_client: HttpClient,
+                        executor) -> StageResult:
+    """Times fetching, parsing and scraping the film pages through the streaming pipeline"""
+    extract_func = lightweight_scraping_functions.extract_film_data \
+        if parallel_technique == ParallelTechnique.LIGHTWEIGHT else extract_film_data
+    return measure(size, f"stream_all_urls[{parallel_technique.value}]", len(film_urls),
+                   lambda: stream_all_urls(urls=film_urls,
+                                           extract_func=extract_func,
+                                           parallel_technique=parallel_technique,
+                                           queue_size=16,
+                                           executor=executor,
+                                           http_client=http_client))[0]
+
+
+def benchmark_s3_write(size: int, df) -> list[StageResult]:
+    """Times writing the playlist to a moto stand-in for S3 in every storage format"""
+    if mock_aws is None:
+        print("moto is not installed, skipping the S3 writes")
+        return []
+    results = []
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket=BUCKET)
+        for storage_format in StorageFormat:
+            results.append(measure(size, f"write_dataframe_to_s3[{storage_format.value}]", len(df),
+                                   lambda: write_dataframe_to_s3(bucket=BUCKET,
+                                                                 s3_client=s3_client,
+                                                                 filename=f"playlist-{size}.{storage_format.value}",
+                                                                 df=df,
+                                                                 storage_format=storage_format))[0])
+    return results
+
+
+def benchmark_database_write(size: int, df, database_url: str or None) -> list[StageResult]:
+    """Times replacing and upserting the playlist table. Every run writes to a new table, so that each upsert
+    inserts every row"""
+    if database_url is None:
+        print("BENCHMARK_DATABASE_URL is not set, skipping the database writes")
+        return []
+    engine = sqlalchemy.create_engine(database_url)
+    table_names = []
+    counter = itertools.count()
+
+    def get_new_table_name() -> str:
+        table_names.append(f"benchmark_{size}_{next(counter)}")
+        return table_names[-1]
+
+    try:
+        return [measure(size, "write_to_database", len(df),
+                        lambda: write_to_database(engine=engine, df=df, table_name=get_new_table_name()))[0],
+                measure(size, "upsert_to_database", len(df),
+                        lambda: upsert_to_database(engine=engine, df=df, table_name=get_new_table_name()))[0]]
+    finally:
+        with engine.begin() as connection:
+            for table_name in table_names:
+                connection.execute(sqlalchemy.text(f'DROP TABLE IF EXISTS "{table_name}"'))
+        engine.dispose()
+
+
+def benchmark_size(size: int, corpus_dir: str, streaming: bool, database_url: str or None) -> list[StageResult]:
+    """Runs every stage on a playlist of size films"""
+    write_corpus(directory=corpus_dir, n_films=size)
+    results = []
+    with FixtureServer(directory=corpus_dir) as server:
+        http_client = HttpClient(config=FetchConfig(rate_limit=0))
+        executor = get_process_pool(parallel_technique=ParallelTechnique.MULTIPROCESSING)
+        try:
+            playlist_urls = [server.get_url(path) for path in get_playlist_page_paths(size)]
+            film_urls = [server.get_url(get_film_path(film_id)) for film_id in range(1, size + 1)]
+            result, playlist_pages = measure(size, "parse_all_urls_asynchronously[playlist pages]", len(playlist_urls),
+                                             lambda: parse_all_urls_asynchronously(playlist_urls,
+                                                                                   http_client=http_client))
+            results.append(result)
+            result, film_pages = measure(size, "parse_all_urls_asynchronously[film pages]", len(film_urls),
+                                         lambda: parse_all_urls_asynchronously(film_urls, http_client=http_client))
+            results.append(result)
+
+            for parallel_technique in SOUPIFICATION_MODES:
+                results += benchmark_soupification(size=size,
+                                                   parallel_technique=parallel_technique,
+                                                   playlist_pages=playlist_pages,
+                                                   film_pages=film_pages,
+                                                   executor=executor)
+            if streaming:
+                for parallel_technique in SOUPIFICATION_MODES:
+                    results.append(benchmark_streaming(size=size,
+                                                       parallel_technique=parallel_technique,
+                                                       film_urls=film_urls,
+                                                       http_client=http_client,
+                                                       executor=executor if parallel_technique ==
+                                                       ParallelTechnique.MULTIPROCESSING else None))
+        finally:
+            executor.shutdown()
+            http_client.close()
+
+    ratings_df = get_ratings_dataframe(lightweight_scraping_functions.scrape_ids_ratings_and_urls(playlist_pages))
+    film_data_df = get_film_data_dataframe(lightweight_scraping_functions.scrape_remaining_film_data(film_pages))
+    df = sort_dataframe_by_year_and_title(inner_join_two_dataframes_on_film_id(ratings_df, film_data_df))
+    results += benchmark_s3_write(size=size, df=df)
+    results += benchmark_database_write(size=size, df=df, database_url=database_url)
+    return results
+
+
+def compare_with_baseline(results: list[StageResult], baseline_path: str) -> None:
+    """Prints how much faster or slower each stage ran than in the baseline results"""
+    with open(baseline_path) as f:
+        baseline = {(r["size"], r["stage"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}")
+    for result in results:
+        previous = baseline.get((result.size, result.stage))
+        if previous is not None:
+            print(f"{result.size:>7} {result.stage:<52} {previous['seconds'] / result.seconds:6.2f}x speed "
+                  f"{previous['peak_memory'] / max(result.peak_memory, 1):6.2f}x memory")
+
+
+def write_results(results: list[StageResult], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump({"created_at": time.time(),
+                   "cpu_count": os.cpu_count(),
+                   "results": [{**asdict(result), "throughput": result.throughput} for result in results]},
+                  f,
+                  indent=2)
+
+
+def get_peak_rss() -> int:
+    """Returns the peak resident memory, in bytes, of this process and of its largest worker process"""
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the scraping pipeline")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated numbers of films per playlist")
+    parser.add_argument("--corpus-dir", default=None, help="Where the fixture corpus is kept between runs")
+    parser.add_argument("--streaming", action="store_true", help="Also benchmark the streaming pipeline")
+    parser.add_argument("--output", default=None, help="JSON file the results are written to")
+    parser.add_argument("--baseline", default=None, help="JSON results of a previous run to compare against")
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus_dir or os.path.join(tempfile.gettempdir(), "letterboxd-benchmark-corpus")
+    database_url = os.environ.get("BENCHMARK_DATABASE_URL")
+    print(f"{'films':>7} {'stage':<52} {'items':>7} {'time':>10} {'throughput':>12} {'peak':>13}")
+    results = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        results += benchmark_size(size=size, corpus_dir=corpus_dir, streaming=args.streaming,
+                                  database_url=database_url)
+    print(f"\nPeak resident memory: {get_peak_rss() / 2 ** 20:.1f} MiB")
+
+    if args.output is not None:
+        write_results(results=results, path=args.output)
+    if args.baseline is not None:
+        compare_with_baseline(results=results, baseline_path=args.baseline)
+
+
+if __name__ == "__main__":
+    main()
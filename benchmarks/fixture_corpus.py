@@ -0,0 +1,70 @@
+"""Corpus of saved playlist and film pages for the offline benchmarks. Pages are stored on disk mirroring the path of
+their URL, as <directory>/<url path>/index.html, so that the fixture server can serve synthetic pages and pages
+recorded from the live site alike."""
+import os
+from urllib.parse import urlsplit
+from utils.generic_scraping_functions import parse_all_urls_asynchronously
+from benchmarks.html_fixtures import get_film_page_html, get_playlist_page_html
+
+FILMS_PER_PAGE = 72
+USERNAME = "benchmark"
+PLAYLIST_TYPE = "list"
+
+
+def get_playlist_title(n_films: int) -> str:
+    return f"playlist-{n_films}"
+
+
+def get_playlist_path(n_films: int) -> str:
+    return f"/{USERNAME}/{PLAYLIST_TYPE}/{get_playlist_title(n_films)}"
+
+
+def get_number_of_playlist_pages(n_films: int) -> int:
+    return max(1, -(-n_films // FILMS_PER_PAGE))
+
+
+def get_playlist_page_paths(n_films: int) -> list[str]:
+    """Returns the URL path of every page of a synthetic playlist"""
+    return [f"{get_playlist_path(n_films)}/page/{page}/" for page in range(1, get_number_of_playlist_pages(n_films) + 1)]
+
+
+def get_film_path(film_id: int) -> str:
+    return f"/film/film-{film_id}/"
+
+
+def get_file_path(directory: str, url: str) -> str:
+    """Returns where the page of a URL, or of a bare URL path, is saved in the corpus"""
+    path = urlsplit(url).path.strip("/")
+    return os.path.join(directory, *path.split("/"), "index.html") if path else os.path.join(directory, "index.html")
+
+
+def save_page(directory: str, url: str, html_page: str) -> None:
+    file_path = get_file_path(directory=directory, url=url)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(html_page)
+
+
+def write_corpus(directory: str, n_films: int) -> None:
+    """Saves a playlist of n_films films and the page of each of its films, skipping the pages already saved"""
+    n_pages = get_number_of_playlist_pages(n_films)
+    for page, path in enumerate(get_playlist_page_paths(n_films)):
+        if not os.path.exists(get_file_path(directory=directory, url=path)):
+            first_film_id = page * FILMS_PER_PAGE + 1
+            html_page = get_playlist_page_html(first_film_id=first_film_id,
+                                               n_films=min(FILMS_PER_PAGE, n_films - page * FILMS_PER_PAGE),
+                                               n_pages=n_pages)
+            save_page(directory=directory, url=path, html_page=html_page)
+    for film_id in range(1, n_films + 1):
+        if not os.path.exists(get_file_path(directory=directory, url=get_film_path(film_id))):
+            save_page(directory=directory, url=get_film_path(film_id), html_page=get_film_page_html(film_id))
+
+
+def record_pages(directory: str, urls: list[str]) -> int:
+    """Downloads pages from the live site into the corpus, so that benchmarks can also run on real pages. Returns
+    how many pages were saved"""
+    html_pages = parse_all_urls_asynchronously(urls=urls)
+    for url, html_page in zip(urls, html_pages):
+        if html_page is not None:
+            save_page(directory=directory, url=url, html_page=html_page)
+    return sum(html_page is not None for html_page in html_pages)
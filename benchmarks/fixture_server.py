@@ -0,0 +1,51 @@
+"""Local HTTP stand-in for Letterboxd, serving the pages of a fixture corpus from a background event loop"""
+import os
+import asyncio
+import threading
+from aiohttp import web
+from benchmarks.fixture_corpus import get_file_path
+
+
+class FixtureServer:
+    """Serves <directory>/<url path>/index.html for every GET and answers 404 for pages missing from the corpus.
+    Listens on an ephemeral port of 127.0.0.1, exposed through base_url"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="fixture-server", daemon=True)
+        self.thread.start()
+        self.runner = asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+        host, port = self.runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        file_path = get_file_path(directory=self.directory, url=request.path)
+        if not os.path.exists(file_path):
+            raise web.HTTPNotFound()
+        with open(file_path, "rb") as f:
+            return web.Response(body=f.read(), content_type="text/html", charset="utf-8")
+
+    async def start(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host="127.0.0.1", port=0).start()
+        return runner
+
+    def get_url(self, url: str) -> str:
+        """Points a Letterboxd URL, or a bare URL path, at the fixture server"""
+        return self.base_url + url.removeprefix("https://letterboxd.com")
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self) -> "FixtureServer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,54 @@
+import json
+
+FILLER_PARAGRAPHS = 600
+
+
+def get_film_structured_data(film_id: int) -> dict:
+    """Returns the JSON-LD block of a synthetic film page"""
+    structured_data = {"@type": "Movie",
+                       "name": f"Film {film_id}",
+                       "releasedEvent": [{"@type": "PublicationEvent", "startDate": str(1920 + film_id % 100)}],
+                       "director": [{"@type": "Person", "name": f"Director {film_id % 97}"}],
+                       "actors": [{"@type": "Person", "name": f"Actor {(film_id + i) % 1009}"} for i in range(25)],
+                       "countryOfOrigin": [{"@type": "Country", "name": "Italy"},
+                                           {"@type": "Country", "name": "France"}]}
+    if film_id % 50 == 0:
+        del structured_data["releasedEvent"]
+    return structured_data
+
+
+def get_film_page_html(film_id: int) -> str:
+    """Returns a synthetic film page shaped like a Letterboxd one: a large body, the poster div carrying the film ID
+    and the JSON-LD block near the end of the document"""
+    filler = "".join(f'<div class="review"><p class="body-text">Review {i} of film {film_id}</p>'
+                     f'<a href="/film/film-{film_id}/reviews/{i}/">more</a></div>' for i in range(FILLER_PARAGRAPHS))
+    structured_data = json.dumps(get_film_structured_data(film_id))
+    return (f'<html><head><title>Film {film_id}</title></head><body>'
+            f'<section class="poster-list"><div class="really-lazy-load poster film-poster" data-film-id="{film_id}" '
+            f'data-film-slug="/film/film-{film_id}/"></div></section>{filler}'
+            f'<script type="application/ld+json">\n/* <![CDATA[ */\n{structured_data}\n/* ]]> */\n</script>'
+            f'</body></html>')
+
+
+def get_rating(film_id: int) -> int:
+    """Returns the rating given to a synthetic film"""
+    return film_id % 10 + 1
+
+
+def get_owner_rating_attribute(film_id: int, rated: bool) -> str:
+    """Returns the data-owner-rating attribute of a poster, which some playlist pages do not carry"""
+    return f' data-owner-rating="{get_rating(film_id)}"' if rated else ""
+
+
+def get_playlist_page_html(first_film_id: int, n_films: int, n_pages: int, rated: bool = True) -> str:
+    """Returns a synthetic playlist page listing n_films posters and pagination links up to n_pages"""
+    posters = "".join(
+        f'<li class="poster-container"{get_owner_rating_attribute(film_id, rated)}>'
+        f'<div class="really-lazy-load poster film-poster" data-film-id="{film_id}" '
+        f'data-film-slug="/film/film-{film_id}/"><img alt="Film {film_id}"/></div>'
+        f'<p class="poster-viewingdata"><span class="rating -tiny -darker rated-{get_rating(film_id)}"></span></p></li>'
+        for film_id in range(first_film_id, first_film_id + n_films))
+    pagination = "".join(f'<li class="paginate-page"><a href="page/{page}/">{page}</a></li>'
+                         for page in range(1, n_pages + 1))
+    return (f'<html><head><title>Playlist</title></head><body><ul class="poster-list">{posters}</ul>'
+            f'<div class="paginate-pages"><ul>{pagination}</ul></div></body></html>')
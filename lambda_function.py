@@ -0,0 +1,185 @@
+import gc
+import os
+import sys
+import json
+import ctypes
+import logging
+import argparse
+import multiprocessing
+from utils.config import config_dict
+from utils.logging_utils import Logger
+from utils.metrics_utils import metrics, get_last_runtime, export_metrics
+from utils.enums_classes import ParallelTechnique
+from utils.generic_scraping_functions import ESTIMATED_PAGE_SIZE
+from utils.argparse_utils import get_scraping_options, get_playlist_urls, format_metrics_format_argument
+from utils.scraping_context import ScrapingOptions, ScrapingResources, get_scraping_resources
+from main import get_argument_parser, scrape_playlists
+
+info_log = Logger(name=__name__, level=logging.INFO).return_logger()
+
+DEFAULT_MEMORY_BUDGET_MB = 1024
+MEMORY_BUDGET_FRACTION = 0.8
+QUEUE_MEMORY_FRACTION = 0.25
+PARSED_PAGE_MEMORY_FACTOR = 10
+
+warm_resources: dict = {}
+
+
+def get_memory_budget(event: dict) -> int:
+    """Returns the memory budget in bytes: the one in the event, else the memory_budget_mb environment variable, else a
+    fraction of the memory configured for the function, leaving room for the interpreter and native allocations"""
+    if event.get("memory_budget_mb") is not None:
+        return int(event["memory_budget_mb"]) * 1024 * 1024
+    if os.environ.get("memory_budget_mb"):
+        return int(os.environ["memory_budget_mb"]) * 1024 * 1024
+    if os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE"):
+        return int(int(os.environ["AWS_LAMBDA_FUNCTION_MEMORY_SIZE"]) * MEMORY_BUDGET_FRACTION) * 1024 * 1024
+    return DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024
+
+
+def get_resident_memory() -> int:
+    """Returns the current resident set size of the process in bytes, or its peak where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def release_memory() -> None:
+    """Collects garbage and asks glibc to hand the freed heap pages back to the operating system"""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def get_event_arguments(event: dict) -> list[str]:
+    """Turns the event into the command line arguments of main.py, so that it is validated exactly like the CLI"""
+    arguments = list(event.get("urls", []))
+    for name, value in event.get("arguments", {}).items():
+        arguments += [f"--{name.replace('_', '-')}", str(value)]
+    return arguments
+
+
+def supports_multiprocessing() -> bool:
+    """Lambda has no /dev/shm, so the semaphores process pools rely on cannot be created there"""
+    try:
+        multiprocessing.Lock()
+    except OSError:
+        return False
+    return True
+
+
+def fit_options_to_memory_budget(options: ScrapingOptions, memory_budget: int) -> ScrapingOptions:
+    """Bounds how many downloaded pages may wait to be parsed to a share of the memory budget, and falls back to
+    synchronous parsing where process pools are not supported. Batch runs hold every page of a playlist in memory
+    at once, so they are switched to streaming, the only mode the bound applies to"""
+    max_queue_size = max(1, int(memory_budget * QUEUE_MEMORY_FRACTION) // (ESTIMATED_PAGE_SIZE *
+                                                                          PARSED_PAGE_MEMORY_FACTOR))
+    if options.queue_size > max_queue_size:
+        info_log.info(f"Lowered the queue size from {options.queue_size} to {max_queue_size} to fit the memory budget")
+        options.queue_size = max_queue_size
+    if not options.streaming:
+        info_log.info("Streaming pages instead of downloading them in batches, so that memory stays within the budget")
+        options.streaming = True
+    if options.parallel_technique in (ParallelTechnique.MULTIPROCESSING, ParallelTechnique.AUTO) and \
+            not supports_multiprocessing():
+        info_log.info(f"Process pools are not supported here, parsing synchronously instead of with "
+                      f"{options.parallel_technique.value}")
+        options.parallel_technique = ParallelTechnique.SYNCHRONOUS
+    return options
+
+
+def get_resources_key(options: ScrapingOptions) -> tuple:
+    """Returns the options the shared clients and pools are built from, which decide whether warm ones can be
+    reused"""
+    return (options.parallel_technique, options.fetch_config, options.cache_dir, options.work_dir, options.cache_ttl,
+            options.cache_max_size, options.film_store_path, options.output_dir, options.write_to_local_db)
+
+
+def get_warm_resources(options: ScrapingOptions) -> tuple[ScrapingResources, bool]:
+    """Returns the resources of this container and whether they were reused from a previous invocation. They are
+    rebuilt when the options they depend on changed"""
+    key = get_resources_key(options)
+    if warm_resources.get("key") == key:
+        return warm_resources["resources"], True
+    drop_warm_resources()
+    warm_resources.update(key=key, resources=get_scraping_resources(options=options, config=config_dict))
+    return warm_resources["resources"], False
+
+
+def drop_warm_resources() -> None:
+    """Closes the resources of this container, so that the next invocation starts from fresh ones"""
+    if "resources" in warm_resources:
+        warm_resources.pop("resources").close()
+        warm_resources.clear()
+        release_memory()
+
+
+def lambda_handler(event: dict, context) -> dict:
+    """Scrapes the playlists in the event, reusing the clients and pools of previous invocations of this container.
+    Resources are dropped after an invocation that leaves the process above its memory budget"""
+    args = get_argument_parser().parse_args(get_event_arguments(event))
+    memory_budget = get_memory_budget(event)
+    options = fit_options_to_memory_budget(options=get_scraping_options(args), memory_budget=memory_budget)
+    urls = get_playlist_urls(args)
+
+    metrics.reset()
+    resources, reused = get_warm_resources(options)
+    info_log.info(f"{'Reusing' if reused else 'Created'} the clients and pools of this container for "
+                  f"{getattr(context, 'aws_request_id', 'a local invocation')}")
+    try:
+        scraping_results = scrape_playlists(urls=urls,
+                                            options=options,
+                                            max_playlists=args.max_playlists,
+                                            resources=resources)
+    except BaseException:
+        drop_warm_resources()
+        raise
+    finally:
+        export_metrics(path=args.metrics_file, metrics_format=format_metrics_format_argument(args.metrics_format))
+    runtime = get_last_runtime()
+
+    release_memory()
+    resident_memory = get_resident_memory()
+    if resident_memory > memory_budget:
+        info_log.info(f"{resident_memory / 2 ** 20:.0f} MB resident is above the {memory_budget / 2 ** 20:.0f} MB "
+                      f"budget, dropping the clients and pools of this container")
+        drop_warm_resources()
+
+    failed_urls = {url: repr(exception) for url, exception in scraping_results.items() if exception is not None}
+    info_log.info(f"Scraped {len(urls) - len(failed_urls)} of {len(urls)} playlists in {runtime}")
+    return {"scraped": [url for url in urls if url not in failed_urls],
+            "failed": failed_urls,
+            "runtime": runtime,
+            "resources_reused": reused,
+            "resident_memory_mb": round(resident_memory / 2 ** 20, 1)}
+
+
+def get_local_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Invokes the Lambda handler locally with an event read from a file")
+    parser.add_argument("event", help="Path of the JSON event")
+    parser.add_argument("--output-dir",
+                        default=None,
+                        help="Directory standing in for the S3 bucket, overriding output_dir in the event")
+    parser.add_argument("--invocations",
+                        default=1,
+                        type=int,
+                        help="How many times to invoke the handler in this process, to exercise warm reuse")
+    return parser
+
+
+if __name__ == "__main__":
+    local_args = get_local_argument_parser().parse_args()
+    with open(local_args.event) as f:
+        local_event = json.load(f)
+    if local_args.output_dir is not None:
+        local_event.setdefault("arguments", {})["output_dir"] = local_args.output_dir
+    try:
+        for _ in range(local_args.invocations):
+            print(json.dumps(lambda_handler(event=local_event, context=None), indent=2))
+    finally:
+        drop_warm_resources()
@@ -1,190 +1,291 @@
 # IMPROVEMENTS/NICE TO HAVE
 # 1. Solve encoding issue
-# 3. AWS Lambda
 # 4. Add docstrings + type declarations
 # 5. Unit testing
 
+import sys
 import logging
 import argparse
-from distutils.util import strtobool
+import concurrent.futures
 from utils.config import config_dict
-from utils.playlist_metadata import Playlist
-from utils.generic_scraping_functions import set_windows_event_loop_policy, parse_all_urls_asynchronously,\
-    get_soup_objects_multiprocessing, get_soup_objects_multithreading, get_soup_objects_synchronously
-from utils.letterboxd_scraping_functions import get_url_for_each_page, scrape_ids_ratings_and_urls,\
-    scrape_remaining_film_data
-from utils.s3_utils import get_s3_key, get_boto_session, get_s3_client, read_csv_from_s3, get_s3_resource,\
-    write_csv_to_s3
-from utils.data_wrangling_utils import cast_id_and_year_as_numeric, get_film_ids_in_current_df, get_new_records,\
-    get_ratings_dataframe, get_film_data_dataframe, inner_join_two_dataframes_on_film_id,\
-    sort_dataframe_by_year_and_title, get_all_columns_except_ratings_from_current_dataframe,\
-    append_new_records_to_current_dataframe
 from utils.logging_utils import Logger
-from utils.time_utils import time_it
-from utils.enums_classes import ParallelTechnique
-from utils.argparse_utils import format_soupification_argument
-from utils.database_utils import get_engine, get_table_name, write_to_database
+from utils.metrics_utils import timed, get_last_runtime, export_metrics
+from utils.argparse_utils import get_scraping_options, get_playlist_urls, format_metrics_format_argument,\
+    format_bool_argument
+from utils.scraping_context import ScrapingOptions, ScrapingResources, get_scraping_resources
 
 info_log = Logger(name=__name__, level=logging.INFO).return_logger()
 
 
-@time_it
-def main(url: str,
-         parallel_technique: ParallelTechnique,
-         over_write: bool,
-         write_to_local_db: bool):
-
-    playlist = Playlist(url=url)
-    metadata = playlist.get_playlist_metadata()
-
-    info_log.info(f"Started scraping playlist {metadata['title'].upper()} from user {metadata['user'].upper()}")
-
-    playlist_pages_urls = get_url_for_each_page(metadata=metadata)
-
+@timed("main")
+def main(url: str, options: ScrapingOptions, resources: ScrapingResources = None):
+    """Scrapes a single playlist. Clients and pools are created for this run unless existing ones are supplied"""
+    from utils.playlist_scraping_functions import scrape_playlist
+    if resources is not None:
+        scrape_playlist(url=url, options=options, resources=resources)
+        consolidate_ratings_matrix(options=options, resources=resources)
+        return
+
+    resources = get_scraping_resources(options=options, config=config_dict)
+    try:
+        scrape_playlist(url=url, options=options, resources=resources)
+        consolidate_ratings_matrix(options=options, resources=resources)
+    finally:
+        resources.close()
+
+
+@timed("scrape_playlists")
+def scrape_playlists(urls: list[str],
+                     options: ScrapingOptions,
+                     max_playlists: int,
+                     resources: ScrapingResources = None) -> dict:
+    """Scrapes many playlists concurrently, sharing a single HTTP session, process pool and S3 client between them.
+    Returns None for every playlist that was scraped successfully and the exception raised for every one that
+    failed. Clients and pools are created for this run unless existing ones are supplied"""
+    if resources is not None:
+        return scrape_playlists_with_resources(urls=urls,
+                                               options=options,
+                                               max_playlists=max_playlists,
+                                               resources=resources)
+
+    resources = get_scraping_resources(options=options, config=config_dict)
+    try:
+        return scrape_playlists_with_resources(urls=urls,
+                                               options=options,
+                                               max_playlists=max_playlists,
+                                               resources=resources)
+    finally:
+        resources.close()
+
+
+def scrape_playlists_with_resources(urls: list[str],
+                                    options: ScrapingOptions,
+                                    max_playlists: int,
+                                    resources: ScrapingResources) -> dict:
+    """Scrapes the playlists on a pool of at most max_playlists threads sharing the supplied resources, then updates
+    the ratings matrix once. Returns the exception raised for each playlist, None if it was scraped"""
+    from utils.playlist_scraping_functions import scrape_playlist
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_playlists) as executor:
+        futures = {executor.submit(scrape_playlist, url=url, options=options, resources=resources): url
+                   for url in urls}
+        for future in concurrent.futures.as_completed(futures):
+            url = futures[future]
+            results[url] = future.exception()
+            if results[url] is None:
+                info_log.info(f"Scraped {url}")
+            else:
+                info_log.error(f"Failed to scrape {url}: {results[url]!r}")
+    consolidate_ratings_matrix(options=options, resources=resources)
+    return results
+
+
+def consolidate_ratings_matrix(options: ScrapingOptions, resources: ScrapingResources):
+    """Brings the ratings matrix of all stored ratings playlists up to date once every playlist of the run is stored,
+    if asked to"""
+    if not options.ratings_matrix:
+        return
+    from utils.ratings_matrix_utils import update_ratings_matrix
+    update_ratings_matrix(bucket=resources.bucket,
+                          s3_client=resources.s3_client,
+                          storage_format=options.storage_format,
+                          partition_by_year=options.partition_by_year)
+    info_log.info(f"Updated the ratings matrix in {get_last_runtime()}")
+
+
+def get_argument_parser() -> argparse.ArgumentParser:
+    """Returns the parser of the command line arguments"""
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("urls",
+                        help="URLs of the playlists to scrape",
+                        type=str,
+                        nargs="*")
+    parser.add_argument("--url-file",
+                        help="File listing the URLs of the playlists to scrape, one per line",
+                        type=str,
+                        default=None)
+    parser.add_argument("--max-playlists",
+                        help="Maximum number of playlists scraped at the same time",
+                        type=int,
+                        default=4)
+    parser.add_argument("-s",
+                        "--soupification",
+                        help="Allows user to decide how to turn HTML pages into BeautifulSoup objects. 'lightweight' "
+                             "skips BeautifulSoup and scrapes the pages with lxml, 'auto' picks between parsing "
+                             "synchronously and in worker processes from the number and size of the pages and the "
+                             "available CPUs",
+                        type=str,
+                        default="synchronous",
+                        choices=("multiprocessing", "multithreading", "synchronous", "lightweight", "auto"))
+    parser.add_argument("-o",
+                        "--overwrite",
+                        help="If True it scrapes the entire playlist and overwrites the existing csv file in S3",
+                        type=format_bool_argument,
+                        default=False)
+    parser.add_argument("-d",
+                        "--database",
+                        help="If True it stores the dataframe to a local Postgres database",
+                        type=format_bool_argument,
+                        default=False)
+    parser.add_argument("--database-mode",
+                        help="upsert only writes the films added, re-rated or removed since the last run, replace "
+                             "drops and rewrites the whole table",
+                        type=str,
+                        default="upsert",
+                        choices=("upsert", "replace"))
+    parser.add_argument("--change-log",
+                        help="If True every run also appends the films added, removed and re-rated since the previous "
+                             "run, with a timestamp, to the playlist's changes/ prefix in S3 and to the local "
+                             "database. With --overwrite every film is logged as added",
+                        type=format_bool_argument,
+                        default=True)
+    parser.add_argument("--database-schema",
+                        help="flat stores each playlist in its own {user}_{title} table, normalized stores films, "
+                             "people, countries and ratings in indexed tables shared by every playlist",
+                        type=str,
+                        default="flat",
+                        choices=("flat", "normalized"))
+    parser.add_argument("--streaming",
+                        help="If True each page flows through fetching, parsing and scraping as soon as it is "
+                             "downloaded",
+                        type=format_bool_argument,
+                        default=False)
+    parser.add_argument("--queue-size",
+                        help="Maximum number of downloaded pages waiting to be parsed when streaming",
+                        type=int,
+                        default=16)
+    parser.add_argument("--max-in-flight",
+                        help="Maximum number of HTTP requests in flight at the same time",
+                        type=int,
+                        default=32)
+    parser.add_argument("--rate-limit",
+                        help="Maximum number of requests per second sent to each host (0 disables rate limiting)",
+                        type=float,
+                        default=10.0)
+    parser.add_argument("--burst",
+                        help="Number of requests that can be sent to a host in a burst before rate limiting kicks in",
+                        type=int,
+                        default=10)
+    parser.add_argument("--max-retries",
+                        help="Number of times a request is retried on 429, 5xx and connection errors",
+                        type=int,
+                        default=5)
+    parser.add_argument("--backoff-base",
+                        help="Base delay in seconds of the exponential backoff between retries",
+                        type=float,
+                        default=0.5)
+    parser.add_argument("--timeout",
+                        help="Total timeout in seconds of a single request",
+                        type=float,
+                        default=30.0)
+    parser.add_argument("--pool-size",
+                        help="Maximum number of open connections in the HTTP connection pool",
+                        type=int,
+                        default=100)
+    parser.add_argument("--cache-dir",
+                        help="Directory of the on-disk HTTP response cache. Caching is disabled if not supplied",
+                        type=str,
+                        default=None)
+    parser.add_argument("--cache-ttl",
+                        help="Hours during which a cached film page is used without being revalidated",
+                        type=float,
+                        default=168.0)
+    parser.add_argument("--cache-max-size",
+                        help="Maximum size in MB of the compressed responses kept in the cache",
+                        type=int,
+                        default=512)
+    parser.add_argument("--film-store",
+                        help="Path of the SQLite film store shared by all playlists. Film pages of films already in "
+                             "the store are not scraped again",
+                        type=str,
+                        default=None)
+    parser.add_argument("--work-dir",
+                        help="Directory where the progress of every playlist is checkpointed until it is stored. Also "
+                             "holds the HTTP response cache if --cache-dir is not supplied",
+                        type=str,
+                        default=None)
+    parser.add_argument("--resume",
+                        help="If True it picks up the checkpoints left in --work-dir by a run that failed, only "
+                             "scraping the pages that run did not get to",
+                        type=format_bool_argument,
+                        default=False)
+    parser.add_argument("-i",
+                        "--incremental",
+                        help="If True it scrapes the playlist newest first and stops at the first page that is already "
+                             "stored, falling back to a full pass on the --full-refresh-days schedule. Removed films "
+                             "are only detected by a full pass, which also runs when they change the number of pages",
+                        type=format_bool_argument,
+                        default=False)
+    parser.add_argument("--incremental-sort",
+                        help="Letterboxd sort order listing the most recently changed films first. Defaults to "
+                             "'rated-date' for ratings playlists and 'added' for lists",
+                        type=str,
+                        default=None)
+    parser.add_argument("--full-refresh-days",
+                        help="Number of days after which an incremental run falls back to a full pass",
+                        type=float,
+                        default=7.0)
+    parser.add_argument("-f",
+                        "--storage-format",
+                        help="Format of the dataset stored in S3. Existing CSV datasets are migrated to Parquet the "
+                             "first time they are read with --storage-format parquet",
+                        type=str,
+                        default="csv",
+                        choices=("csv", "parquet"))
+    parser.add_argument("--output-dir",
+                        help="Directory the playlists are written to instead of S3, in the same layout as the bucket. "
+                             "Neither boto3 nor AWS credentials are needed",
+                        type=str,
+                        default=None)
+    parser.add_argument("--partition-by-year",
+                        help="If True the Parquet dataset is stored as one file per year under a Hive-style prefix",
+                        type=format_bool_argument,
+                        default=False)
+    parser.add_argument("--ratings-matrix",
+                        help="If True it updates the sparse user x film matrix of all the ratings playlists stored in "
+                             "the bucket after scraping, only re-reading the playlists that changed",
+                        type=format_bool_argument,
+                        default=False)
+    parser.add_argument("--metrics-file",
+                        help="File the stage timings, trace spans and counters of the run are exported to",
+                        type=str,
+                        default=None)
+    parser.add_argument("--metrics-format",
+                        help="jsonl appends one JSON line per metric and span, prometheus writes a node exporter "
+                             "textfile",
+                        type=str,
+                        default="jsonl",
+                        choices=("jsonl", "prometheus"))
+    return parser
+
+
+def cli(argv: list[str] = None) -> None:
+    """Parses the command line arguments and scrapes the playlists they list"""
+    args = get_argument_parser().parse_args(argv)
+    playlist_urls = get_playlist_urls(args)
+    scraping_options = get_scraping_options(args)
+
+    from utils.generic_scraping_functions import set_windows_event_loop_policy
     set_windows_event_loop_policy()
-
-    playlist_pages_html, runtime = parse_all_urls_asynchronously(urls=playlist_pages_urls)
-
-    info_log.info(f"Asynchronously parsed playlist pages as HTML code in {runtime}")
-
-    if parallel_technique == ParallelTechnique.MULTIPROCESSING:
-        playlist_pages_soups, runtime = get_soup_objects_multiprocessing(html_pages=playlist_pages_html)
-        info_log.info(f"Got BeautifulSoup objects out of playlist pages with multiprocessing in {runtime}")
-    elif parallel_technique == ParallelTechnique.MULTITHREADING:
-        playlist_pages_soups, runtime = get_soup_objects_multithreading(html_pages=playlist_pages_html)
-        info_log.info(f"Got BeautifulSoup objects out of playlist pages with multithreading in {runtime}")
-    else:
-        playlist_pages_soups, runtime = get_soup_objects_synchronously(html_pages=playlist_pages_html)
-        info_log.info(f"Synchronously got BeautifulSoup objects out of playlist pages in {runtime}")
-
-    ids_ratings_urls_dict, runtime = scrape_ids_ratings_and_urls(pages_soups=playlist_pages_soups)
-    info_log.info(f"Scraped film IDs, ratings and URLs from playlist pages in {runtime}")
-
-    df_key = get_s3_key(metadata=metadata)
-
-    session = get_boto_session(config=config_dict)
-
-    if over_write:
-        current_df = None
-        info_log.info(f"Overwriting object {df_key} in {config_dict['s3_bucket']}")
-    else:
-        s3_client = get_s3_client(session=session)
-        current_df, runtime = read_csv_from_s3(bucket=config_dict['s3_bucket'], s3_client=s3_client, key=df_key)
-        info_log.info(f"Read the current dataframe from S3 in {runtime}")
-
-    if current_df is not None:
-        current_df = cast_id_and_year_as_numeric(current_df=current_df)
-        current_film_ids = get_film_ids_in_current_df(current_df=current_df)
-        new_records = get_new_records(current_film_ids=current_film_ids,
-                                      ids_ratings_urls_dict=ids_ratings_urls_dict)
-        if new_records:
-            info_log.info(f"N. of new films to be added to the playlist: {len(new_records)}")
-        else:
-            info_log.info(f"No new films to be added to the playlist")
-    else:
-        new_records = None
-
-    if new_records:
-        film_pages_html, runtime = parse_all_urls_asynchronously(new_records)
-        info_log.info(f"Asynchronously parsed newly added films as HTML code in {runtime}")
-    elif current_df is None:
-        film_pages_html, runtime = parse_all_urls_asynchronously(ids_ratings_urls_dict["urls"])
-        info_log.info(f"Asynchronously parsed all film pages as HTML code in {runtime}")
-    else:
-        film_pages_html = None
-
-    if current_df is None or new_records:
-        if parallel_technique == ParallelTechnique.MULTIPROCESSING:
-            film_pages_soups, runtime = get_soup_objects_multiprocessing(html_pages=film_pages_html)
-            info_log.info(f"Got BeautifulSoup objects out of film pages with multiprocessing in {runtime}")
-        elif parallel_technique == ParallelTechnique.MULTITHREADING:
-            film_pages_soups, runtime = get_soup_objects_multithreading(html_pages=film_pages_html)
-            info_log.info(f"Got BeautifulSoup objects out of film pages with multithreading in {runtime}")
+    try:
+        if len(playlist_urls) == 1:
+            main(url=playlist_urls[0], options=scraping_options)
+            info_log.info(f"Total runtime: {get_last_runtime()}")
         else:
-            film_pages_soups, runtime = get_soup_objects_synchronously(html_pages=film_pages_html)
-            info_log.info(f"Synchronously got BeautifulSoup objects out of film pages in {runtime}")
-
-    else:
-        film_pages_soups = None
-
-    if current_df is None or new_records:
-        more_film_data, runtime = scrape_remaining_film_data(film_soups=film_pages_soups)
-        info_log.info(f"Scraped all other film data in {runtime}")
-    else:
-        more_film_data = None
-
-    ratings_df = get_ratings_dataframe(ids_ratings_urls_dict=ids_ratings_urls_dict)
-
-    if current_df is None:
-        film_data_df = get_film_data_dataframe(additional_film_data=more_film_data)
-        joined_df = inner_join_two_dataframes_on_film_id(left_dataframe=ratings_df,
-                                                         right_dataframe=film_data_df)
-        info_log.info("Created final dataframe from scratch")
-
-    else:
-        if new_records:
-            new_records_dataframe = get_film_data_dataframe(additional_film_data=more_film_data)
-            current_df_no_ratings = get_all_columns_except_ratings_from_current_dataframe(current_df=current_df)
-            appended_df = append_new_records_to_current_dataframe(current_df_no_ratings=current_df_no_ratings,
-                                                                  new_records_dataframe=new_records_dataframe)
-            joined_df = inner_join_two_dataframes_on_film_id(left_dataframe=ratings_df,
-                                                             right_dataframe=appended_df)
-            info_log.info(f"Created final dataframe by adding new films and updating all results")
-        else:
-            current_df_no_ratings = get_all_columns_except_ratings_from_current_dataframe(current_df=current_df)
-            joined_df = inner_join_two_dataframes_on_film_id(left_dataframe=ratings_df,
-                                                             right_dataframe=current_df_no_ratings)
-            info_log.info(f"Created final dataframe by updating all ratings")
-
-    final_df = sort_dataframe_by_year_and_title(final_dataframe=joined_df)
-
-    s3_resource = get_s3_resource(session=session)
-
-    _none, runtime = write_csv_to_s3(bucket=config_dict['s3_bucket'],
-                                     s3_resource=s3_resource,
-                                     filename=df_key,
-                                     df=final_df)
-    info_log.info(f"Dataframe in S3 bucket will have {len(final_df)} records")
-    info_log.info(f"Wrote final dataframe to S3 bucket in {runtime}")
-
-    if write_to_local_db:
-        engine = get_engine(config=config_dict)
-        table_name = get_table_name(playlist_metadata=metadata)
-        _none, runtime = write_to_database(engine=engine, df=final_df, table_name=table_name)
-        info_log.info(f"Wrote dataframe to local Postgres database in {runtime}")
-
-
-parser = argparse.ArgumentParser()
-
-parser.add_argument("url",
-                    help="URL of the playlist to scrape",
-                    type=str)
-parser.add_argument("-s",
-                    "--soupification",
-                    help="Allows user to decide how to turn HTML pages into BeautifulSoup objects",
-                    type=str,
-                    default="synchronous",
-                    choices=("multiprocessing", "multithreading", "synchronous"))
-parser.add_argument("-o",
-                    "--overwrite",
-                    help="If True it scrapes the entire playlist and overwrites the existing csv file in S3",
-                    type=lambda x: bool(strtobool(x)),
-                    default=False)
-parser.add_argument("-d",
-                    "--database",
-                    help="If True it stores the dataframe to a local Postgres database",
-                    type=lambda x: bool(strtobool(x)),
-                    default=False)
-
-args = parser.parse_args()
-playlist_url = args.url
-soupification = format_soupification_argument(args.soupification)
-overwrite = args.overwrite
-write_to_local_database = args.database
+            scraping_results = scrape_playlists(urls=playlist_urls,
+                                                options=scraping_options,
+                                                max_playlists=args.max_playlists)
+            failed_urls = [url for url, exception in scraping_results.items() if exception is not None]
+            info_log.info(f"Scraped {len(playlist_urls) - len(failed_urls)} of {len(playlist_urls)} playlists "
+                          f"in {get_last_runtime()}")
+            for url in failed_urls:
+                info_log.error(f"Failed: {url} ({scraping_results[url]!r})")
+            if failed_urls:
+                sys.exit(1)
+    finally:
+        export_metrics(path=args.metrics_file, metrics_format=format_metrics_format_argument(args.metrics_format))
+
 
 if __name__ == "__main__":
-    test, total_execution_time = main(url=playlist_url,
-                                      parallel_technique=soupification,
-                                      over_write=overwrite,
-                                      write_to_local_db=write_to_local_database)
-    info_log.info(f"Total runtime: {total_execution_time}")
+    cli()
@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+import subprocess
+from main import get_argument_parser
+from utils.argparse_utils import get_fetch_config, get_scraping_options
+
+
+class TestFetchConfigArguments(unittest.TestCase):
+
+    def get_fetch_config(self, *arguments: str):
+        return get_fetch_config(get_argument_parser().parse_args(["https://letterboxd.com/user/list/title/",
+                                                                  *arguments]))
+
+    def test_defaults(self) -> None:
+        fetch_config = self.get_fetch_config()
+        self.assertEqual(fetch_config.burst, 10)
+        self.assertEqual(fetch_config.rate_limit, 10.0)
+
+    def test_empty_burst_is_rejected(self) -> None:
+        self.assertRaises(ValueError, self.get_fetch_config, "--burst", "0", "--rate-limit", "5")
+
+    def test_negative_rate_limit_is_rejected(self) -> None:
+        self.assertRaises(ValueError, self.get_fetch_config, "--rate-limit", "-1")
+
+    def test_no_requests_in_flight_is_rejected(self) -> None:
+        self.assertRaises(ValueError, self.get_fetch_config, "--max-in-flight", "0")
+
+    def test_negative_max_retries_is_rejected(self) -> None:
+        self.assertRaises(ValueError, self.get_fetch_config, "--max-retries", "-1")
+        self.assertEqual(self.get_fetch_config("--max-retries", "0").max_retries, 0)
+
+    def test_non_positive_timeout_is_rejected(self) -> None:
+        self.assertRaises(ValueError, self.get_fetch_config, "--timeout", "0")
+        self.assertRaises(ValueError, self.get_fetch_config, "--timeout", "-5")
+
+    def test_rate_limiting_can_be_disabled(self) -> None:
+        self.assertEqual(self.get_fetch_config("--rate-limit", "0").rate_limit, 0)
+
+
+class TestScrapingOptionsArguments(unittest.TestCase):
+
+    def get_scraping_options(self, *arguments: str):
+        return get_scraping_options(get_argument_parser().parse_args(["https://letterboxd.com/user/list/title/",
+                                                                      *arguments]))
+
+    def test_unbounded_queue_is_rejected(self) -> None:
+        self.assertRaises(ValueError, self.get_scraping_options, "--queue-size", "0")
+        self.assertRaises(ValueError, self.get_scraping_options, "--queue-size", "-1")
+        self.assertEqual(self.get_scraping_options("--queue-size", "1").queue_size, 1)
+
+    def test_boolean_values(self) -> None:
+        self.assertTrue(self.get_scraping_options("--streaming", "yes").streaming)
+        self.assertTrue(self.get_scraping_options("--streaming", "True").streaming)
+        self.assertFalse(self.get_scraping_options("--streaming", "0").streaming)
+        with self.assertRaises(SystemExit):
+            get_argument_parser().parse_args(["--streaming", "maybe"])
+
+
+class TestArgumentParserImports(unittest.TestCase):
+
+    def test_pipeline_modules_are_not_imported(self) -> None:
+        code = "import sys, main; main.get_argument_parser(); " \
+               "print(sorted({'pandas', 'pyarrow', 'aiohttp', 'bs4', 'lxml'} & set(sys.modules)))"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from utils.cache_utils import ResponseCache, get_conditional_headers
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(path=os.path.join(self.directory.name, "responses.sqlite3"),
+                                   ttl=3600,
+                                   max_size=7_000)
+
+    def tearDown(self) -> None:
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_round_trip(self) -> None:
+        self.cache.put(url="https://letterboxd.com/film/x/", body="<html>x</html>", etag='"abc"', last_modified=None)
+        cached = self.cache.get("https://letterboxd.com/film/x/")
+        self.assertEqual(cached.body, "<html>x</html>")
+        self.assertTrue(self.cache.is_fresh(cached))
+        self.assertFalse(self.cache.with_ttl(0).is_fresh(cached))
+        self.assertEqual(get_conditional_headers(cached), {"If-None-Match": '"abc"'})
+        self.assertIsNone(self.cache.get("https://letterboxd.com/film/y/"))
+
+    def test_evicts_least_recently_used(self) -> None:
+        for i in range(3):
+            self.cache.put(url=f"url-{i}", body=os.urandom(2_000).hex(), etag=None, last_modified=None)
+        self.cache.get("url-0")
+        self.cache.put(url="url-3", body=os.urandom(2_000).hex(), etag=None, last_modified=None)
+        self.assertLessEqual(self.cache.size[0], self.cache.max_size)
+        self.assertIsNotNone(self.cache.get("url-0"))
+        self.assertIsNotNone(self.cache.get("url-3"))
+        self.assertIsNone(self.cache.get("url-1"))
+
+    def test_reads_are_not_committed_until_the_next_write(self) -> None:
+        with mock.patch("utils.cache_utils.time.time", return_value=100.0):
+            self.cache.put(url="url-0", body="<html>0</html>", etag=None, last_modified=None)
+        with mock.patch("utils.cache_utils.time.time", return_value=200.0):
+            self.cache.get("url-0")
+        reader = sqlite3.connect(self.cache.path)
+        self.assertEqual(reader.execute("SELECT accessed_at FROM responses").fetchone(), (100.0,))
+        self.cache.put(url="url-1", body="<html>1</html>", etag=None, last_modified=None)
+        self.assertEqual(reader.execute("SELECT accessed_at FROM responses WHERE url = 'url-0'").fetchone(), (200.0,))
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from utils.checkpoint_utils import open_checkpoint
+from utils.incremental_utils import merge_incremental_records
+
+METADATA = {"user": "someone", "title": "my_list"}
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def fail_after_checkpointing(self) -> None:
+        with open_checkpoint(work_dir=self.directory.name, metadata=METADATA, resume=False) as checkpoint:
+            checkpoint.put_ids_ratings_urls({"ids": [2, 1], "ratings": [8, 10], "urls": ["/film/b/", "/film/a/"]})
+            checkpoint.film_store.put_records([(2, "B", 2001, "Director", "Actor", "Italy")])
+            raise RuntimeError("network blip")
+
+    def test_checkpoint_is_kept_on_failure_and_resumed(self) -> None:
+        self.assertRaises(RuntimeError, self.fail_after_checkpointing)
+        with open_checkpoint(work_dir=self.directory.name, metadata=METADATA, resume=True) as checkpoint:
+            self.assertEqual(checkpoint.get_ids_ratings_urls(),
+                             {"ids": [2, 1], "ratings": [8, 10], "urls": ["/film/b/", "/film/a/"]})
+            self.assertEqual(checkpoint.film_store.get_records([1, 2]), [(2, "B", 2001, "Director", "Actor", "Italy")])
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, "someone", "my_list")))
+
+    def test_checkpoint_is_discarded_without_resume(self) -> None:
+        self.assertRaises(RuntimeError, self.fail_after_checkpointing)
+        with open_checkpoint(work_dir=self.directory.name, metadata=METADATA, resume=False) as checkpoint:
+            self.assertIsNone(checkpoint.get_ids_ratings_urls())
+            self.assertEqual(checkpoint.film_store.get_records([2]), [])
+
+    def test_merged_incremental_records_are_checkpointed(self) -> None:
+        merged = merge_incremental_records(page_records=[([3], [6], ["/film/c/"])],
+                                           current_df=pd.DataFrame({"id": [1, 3], "rating": [8, 4]}))
+        with open_checkpoint(work_dir=self.directory.name, metadata=METADATA, resume=False) as checkpoint:
+            checkpoint.put_ids_ratings_urls(merged)
+            self.assertEqual(checkpoint.get_ids_ratings_urls(),
+                             {"ids": [3, 1], "ratings": [6, 8], "urls": ["https://letterboxd.com/film/c/", None]})
+
+    def test_no_checkpoint_without_work_dir(self) -> None:
+        with open_checkpoint(work_dir=None, metadata=METADATA, resume=False) as checkpoint:
+            self.assertIsNone(checkpoint)
+
+
+if __name__ == '__main__':
+    unittest.main()
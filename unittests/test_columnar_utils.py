@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+from utils.columnar_utils import FilmUrls
+from utils.letterboxd_scraping_functions import collect_ids_ratings_and_urls, collect_remaining_film_data,\
+    get_film_records
+from utils.data_wrangling_utils import get_ratings_dataframe, get_film_data_dataframe, get_change_report
+
+
+class TestColumnarUtils(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.page_records = [([1, 2], [8, 6], ["/film/a/", "/film/b/"]), None, ([3], [10], ["/film/c/"])]
+        self.film_records = [(1, "A", 1999, "Director", "Actor", "Italy"),
+                             (2, "B", np.nan, np.nan, "Actor", "Italy")]
+
+    def test_playlist_columns(self) -> None:
+        ids_ratings_urls_dict = collect_ids_ratings_and_urls(page_records=self.page_records)
+        self.assertEqual(ids_ratings_urls_dict["ids"].dtype, np.int64)
+        self.assertEqual(ids_ratings_urls_dict["ratings"].tolist(), [8, 6, 10])
+        self.assertEqual(list(ids_ratings_urls_dict["urls"]), ["https://letterboxd.com/film/a/",
+                                                               "https://letterboxd.com/film/b/",
+                                                               "https://letterboxd.com/film/c/"])
+        self.assertEqual(ids_ratings_urls_dict["urls"][1:].slugs, ["/film/b/", "/film/c/"])
+
+    def test_ratings_dataframe_does_not_copy(self) -> None:
+        ids_ratings_urls_dict = collect_ids_ratings_and_urls(page_records=self.page_records)
+        ratings_df = get_ratings_dataframe(ids_ratings_urls_dict=ids_ratings_urls_dict)
+        self.assertTrue(np.shares_memory(ratings_df["id"].to_numpy(), ids_ratings_urls_dict["ids"]))
+
+    def test_film_columns(self) -> None:
+        remaining_film_data = collect_remaining_film_data(film_records=self.film_records)
+        film_data_df = get_film_data_dataframe(additional_film_data=remaining_film_data)
+        self.assertEqual(str(film_data_df["year"].dtype), "Int64")
+        self.assertEqual(film_data_df["year"].isna().tolist(), [False, True])
+        records = get_film_records(remaining_film_data=remaining_film_data)
+        self.assertEqual(records[0], self.film_records[0])
+        self.assertIs(records[1][2], np.nan)
+
+    def test_change_report_only_builds_new_urls(self) -> None:
+        urls = FilmUrls(slugs=["/film/a/", None])
+        report = get_change_report(current_df=None, ids_ratings_urls_dict={"ids": np.array([1, 1]),
+                                                                           "ratings": np.array([5, 5]),
+                                                                           "urls": urls})
+        self.assertEqual(report.new_urls, ["https://letterboxd.com/film/a/"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import io
+import unittest
+import numpy as np
+import pandas as pd
+from utils.data_wrangling_utils import get_content_hash, get_change_report, get_change_log
+
+
+class TestGetContentHash(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.df = pd.DataFrame({"id": [2, 1],
+                                "rating": [8, 10],
+                                "title": ["b", "a"],
+                                "year": [np.nan, 1950.0],
+                                "director": [np.nan, "Director"]})
+
+    def test_ignores_row_order_and_storage_format(self) -> None:
+        content_hash = get_content_hash(self.df)
+        self.assertEqual(get_content_hash(self.df.iloc[::-1]), content_hash)
+        csv_df = pd.read_csv(io.StringIO(self.df.to_csv(index=False)))
+        self.assertEqual(get_content_hash(csv_df), content_hash)
+
+    def test_detects_changed_ratings(self) -> None:
+        changed_df = self.df.copy()
+        changed_df.loc[0, "rating"] = 6
+        self.assertNotEqual(get_content_hash(changed_df), get_content_hash(self.df))
+
+
+class TestGetChangeReport(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.current_df = pd.DataFrame({"id": [1, 2, 3], "rating": [5, 6, 7]})
+        self.ids_ratings_urls_dict = {"ids": [2, 3, 4, 4],
+                                      "ratings": [6, 9, 1, 1],
+                                      "urls": ["url-2", "url-3", "url-4", "url-4"]}
+
+    def test_reports_added_removed_and_rerated_films(self) -> None:
+        report = get_change_report(current_df=self.current_df, ids_ratings_urls_dict=self.ids_ratings_urls_dict)
+        self.assertEqual(report.added.values.tolist(), [[4, 1]])
+        self.assertEqual(report.removed.values.tolist(), [[1, 5]])
+        self.assertEqual(report.rerated.values.tolist(), [[3, 7, 9]])
+        self.assertEqual(report.new_urls, ["url-4"])
+        self.assertTrue(report.has_changes)
+
+    def test_empty_stored_playlist(self) -> None:
+        report = get_change_report(current_df=self.current_df.head(0), ids_ratings_urls_dict=self.ids_ratings_urls_dict)
+        self.assertEqual(report.added["id"].tolist(), [2, 3, 4])
+        self.assertTrue(report.removed.empty and report.rerated.empty)
+
+    def test_unchanged_playlist(self) -> None:
+        report = get_change_report(current_df=self.current_df,
+                                   ids_ratings_urls_dict={"ids": [1, 2, 3], "ratings": [5, 6, 7], "urls": [None] * 3})
+        self.assertFalse(report.has_changes)
+
+
+class TestGetChangeLog(unittest.TestCase):
+
+    def test_logs_changes_of_films_in_the_final_dataframe(self) -> None:
+        current_df = pd.DataFrame({"id": [1, 2, 3], "rating": [5, 6, 7]})
+        change_report = get_change_report(current_df=current_df,
+                                          ids_ratings_urls_dict={"ids": [2, 3, 4, 5],
+                                                                 "ratings": [6, 9, 1, 2],
+                                                                 "urls": [None, None, "url-4", "url-5"]})
+        changed_at = pd.Timestamp("2024-01-01", tz="UTC")
+        change_log = get_change_log(change_report=change_report,
+                                    final_df=pd.DataFrame({"id": [2, 3, 4]}),
+                                    changed_at=changed_at)
+        self.assertEqual(change_log["change"].tolist(), ["added", "removed", "rerated"])
+        self.assertEqual(change_log["id"].tolist(), [4, 1, 3])
+        self.assertEqual(change_log["previous_rating"].tolist(), [pd.NA, 5, 7])
+        self.assertEqual(change_log["rating"].tolist(), [1, pd.NA, 9])
+        self.assertTrue((change_log["changed_at"] == changed_at).all())
+
+    def test_empty_change_log(self) -> None:
+        current_df = pd.DataFrame({"id": [1], "rating": [5]})
+        change_report = get_change_report(current_df=current_df,
+                                          ids_ratings_urls_dict={"ids": [1], "ratings": [5], "urls": [None]})
+        change_log = get_change_log(change_report=change_report, final_df=current_df,
+                                    changed_at=pd.Timestamp("2024-01-01", tz="UTC"))
+        self.assertTrue(change_log.empty)
+        self.assertEqual(list(change_log.columns), ["changed_at", "change", "id", "previous_rating", "rating"])
+
+
+if __name__ == '__main__':
+    unittest.main()
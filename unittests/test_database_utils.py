@@ -0,0 +1,100 @@
+import os
+import unittest
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from utils.database_utils import upsert_to_database, write_to_database, write_to_normalized_database
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+@unittest.skipIf(TEST_DATABASE_URL is None, "TEST_DATABASE_URL is not set")
+class TestUpsertToDatabase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.engine = sqlalchemy.create_engine(TEST_DATABASE_URL)
+        self.table_name = "test_user_test_playlist"
+        self.df = pd.DataFrame({"id": [1, 2, 3],
+                                "rating": [5, 6, 7],
+                                "title": ["Film, with comma", 'Film "quoted"', np.nan],
+                                "year": [1950.0, np.nan, 2000.0],
+                                "director": ["a", "b", np.nan],
+                                "actors": ["c", "d", np.nan],
+                                "countries": ["e", "f", "g"]})
+
+    def tearDown(self) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(sqlalchemy.text(f'DROP TABLE IF EXISTS "{self.table_name}"'))
+        self.engine.dispose()
+
+    def read_table(self) -> pd.DataFrame:
+        return pd.read_sql(f'SELECT * FROM "{self.table_name}" ORDER BY id', self.engine)
+
+    def test_only_writes_changes(self) -> None:
+        row_counts = upsert_to_database(engine=self.engine, df=self.df, table_name=self.table_name)
+        self.assertEqual(row_counts, {"upserted": 3, "deleted": 0})
+        row_counts = upsert_to_database(engine=self.engine, df=self.df, table_name=self.table_name)
+        self.assertEqual(row_counts, {"upserted": 0, "deleted": 0})
+
+        changed_df = self.df.iloc[[0, 2]].copy()
+        changed_df.loc[0, "rating"] = 9
+        row_counts = upsert_to_database(engine=self.engine, df=changed_df, table_name=self.table_name)
+        self.assertEqual(row_counts, {"upserted": 1, "deleted": 1})
+
+        table = self.read_table()
+        self.assertEqual(table["id"].tolist(), [1, 3])
+        self.assertEqual(table["rating"].tolist(), [9, 7])
+        self.assertEqual(table.loc[0, "title"], "Film, with comma")
+
+    def test_upgrades_replaced_tables(self) -> None:
+        self.df.to_sql(name=self.table_name, con=self.engine, index=False)
+        write_to_database(engine=self.engine, df=self.df, table_name=self.table_name)
+        row_counts = upsert_to_database(engine=self.engine, df=self.df.iloc[:2], table_name=self.table_name)
+        self.assertEqual(row_counts, {"upserted": 0, "deleted": 1})
+        self.assertEqual(len(self.read_table()), 2)
+
+
+@unittest.skipIf(TEST_DATABASE_URL is None, "TEST_DATABASE_URL is not set")
+class TestWriteToNormalizedDatabase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.engine = sqlalchemy.create_engine(TEST_DATABASE_URL)
+        self.tearDown()
+        self.df = pd.DataFrame({"id": [1, 2],
+                                "rating": [8, 10],
+                                "title": ["a", "b"],
+                                "year": [1950, 1960],
+                                "director": ["Director", "Director;Other Director"],
+                                "actors": ["Actor;Director", "Actor"],
+                                "countries": ["Italy", np.nan]})
+
+    def tearDown(self) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(sqlalchemy.text("DROP TABLE IF EXISTS rating_changes, ratings, playlists, film_actors, "
+                                               "film_directors, film_countries, people, countries, films"))
+        self.engine.dispose()
+
+    def query(self, statement: str) -> list[tuple]:
+        with self.engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(sqlalchemy.text(statement))]
+
+    def test_links_films_to_people_and_countries(self) -> None:
+        metadata = {"user": "test_user", "title": "test_playlist"}
+        row_counts = write_to_normalized_database(engine=self.engine, df=self.df, playlist_metadata=metadata)
+        self.assertEqual(row_counts, {"upserted": 2, "deleted": 0})
+        self.assertEqual(self.query("SELECT name FROM people ORDER BY name"),
+                         [("Actor",), ("Director",), ("Other Director",)])
+        self.assertEqual(self.query("SELECT f.film_id, p.name, f.billing FROM film_actors f "
+                                    "JOIN people p ON p.id = f.person_id ORDER BY f.film_id, f.billing"),
+                         [(1, "Actor", 1), (1, "Director", 2), (2, "Actor", 1)])
+        self.assertEqual(self.query("SELECT film_id FROM film_countries"), [(1,)])
+
+        self.df.loc[1, "director"] = "Director"
+        row_counts = write_to_normalized_database(engine=self.engine, df=self.df.iloc[1:], playlist_metadata=metadata)
+        self.assertEqual(row_counts, {"upserted": 0, "deleted": 1})
+        self.assertEqual(self.query("SELECT film_id, person_id FROM film_directors WHERE film_id = 2"),
+                         self.query("SELECT 2, id FROM people WHERE name = 'Director'"))
+
+
+if __name__ == '__main__':
+    unittest.main()
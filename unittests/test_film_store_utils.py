@@ -0,0 +1,33 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from utils.film_store_utils import FilmStore
+
+
+class TestFilmStore(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.film_store = FilmStore(path=os.path.join(self.directory.name, "films.sqlite3"))
+
+    def tearDown(self) -> None:
+        self.film_store.close()
+        self.directory.cleanup()
+
+    def test_round_trip(self) -> None:
+        self.film_store.put_records([(1, "Stalker", 1979, "Andrei Tarkovsky", "Alisa Freyndlikh", "USSR"),
+                                     (2, "Untitled", np.nan, np.nan, np.nan, np.nan)])
+        records = sorted(self.film_store.get_records(film_ids=[1, 2, 3]))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0], (1, "Stalker", 1979, "Andrei Tarkovsky", "Alisa Freyndlikh", "USSR"))
+        self.assertTrue(all(np.isnan(value) for value in records[1][2:]))
+
+    def test_put_replaces_previous_version(self) -> None:
+        self.film_store.put_records([(1, "Stalker", 1979, "Andrei Tarkovsky", "", "USSR")])
+        self.film_store.put_records([(1, "Stalker", 1979, "Andrei Tarkovsky", "", "Soviet Union")])
+        self.assertEqual(self.film_store.get_records(film_ids=[1])[0][-1], "Soviet Union")
+
+
+if __name__ == '__main__':
+    unittest.main()
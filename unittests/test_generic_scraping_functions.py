@@ -0,0 +1,124 @@
+import os
+import asyncio
+import unittest
+import concurrent.futures
+from unittest import mock
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from utils.enums_classes import ParallelTechnique
+from utils.http_utils import FetchConfig, get_client_session, get_fetcher
+from utils.generic_scraping_functions import choose_parse_strategy, resolve_parse_strategy, stream_urls,\
+    parse_url_synchronously, extract_records_multiprocessing, get_process_pool
+
+
+class TestChooseParseStrategy(unittest.TestCase):
+
+    def test_small_batches_are_parsed_synchronously(self) -> None:
+        strategy = choose_parse_strategy(n_pages=2, average_page_size=70_000, n_cpus=8)
+        self.assertEqual(strategy.parallel_technique, ParallelTechnique.SYNCHRONOUS)
+        self.assertEqual(strategy.n_workers, 1)
+
+    def test_large_batches_are_parsed_in_worker_processes(self) -> None:
+        strategy = choose_parse_strategy(n_pages=3_000, average_page_size=70_000, n_cpus=8)
+        self.assertEqual(strategy.parallel_technique, ParallelTechnique.MULTIPROCESSING)
+        self.assertEqual(strategy.n_workers, 8)
+
+    def test_workers_grow_with_the_workload(self) -> None:
+        strategy = choose_parse_strategy(n_pages=10, average_page_size=70_000, n_cpus=8)
+        self.assertEqual(strategy.parallel_technique, ParallelTechnique.MULTIPROCESSING)
+        self.assertLess(strategy.n_workers, 8)
+
+    def test_single_cpu_is_always_synchronous(self) -> None:
+        strategy = choose_parse_strategy(n_pages=3_000, average_page_size=70_000, n_cpus=1)
+        self.assertEqual(strategy.parallel_technique, ParallelTechnique.SYNCHRONOUS)
+
+    def test_explicit_techniques_are_kept(self) -> None:
+        strategy = resolve_parse_strategy(parallel_technique=ParallelTechnique.MULTITHREADING, n_pages=2)
+        self.assertEqual(strategy.parallel_technique, ParallelTechnique.MULTITHREADING)
+
+
+def get_page_title(html_page: str) -> str:
+    return html_page.title()
+
+
+def fail_to_extract(html_page: str) -> str:
+    raise AttributeError(f"Unexpected page: {html_page}")
+
+
+class TestStreamUrls(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.config = FetchConfig(max_in_flight=2, rate_limit=0, max_retries=0)
+        self.requested = []
+
+    async def stream(self, n_pages: int, prefetched: dict, extract_func=get_page_title, queue_size: int = 1) -> list:
+        async def page(request):
+            self.requested.append(request.match_info["number"])
+            return web.Response(text=f"page {request.match_info['number']}")
+
+        app = web.Application()
+        app.router.add_get("/page/{number}/", page)
+
+        async with TestServer(app) as server:
+            async with get_client_session(config=self.config) as session:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                    return await stream_urls(fetcher=get_fetcher(session=session, config=self.config),
+                                             urls=[str(server.make_url(f"/page/{i}/")) for i in range(1, n_pages + 1)],
+                                             extract_func=extract_func,
+                                             executor=executor,
+                                             queue_size=queue_size,
+                                             n_parsers=1,
+                                             prefetched=prefetched)
+
+    def test_prefetched_pages_are_not_fetched_again(self) -> None:
+        records = asyncio.run(self.stream(n_pages=3, prefetched={0: "page 1"}))
+        self.assertEqual(records, ["Page 1", "Page 2", "Page 3"])
+        self.assertEqual(sorted(self.requested), ["2", "3"])
+
+    def test_all_pages_prefetched(self) -> None:
+        self.assertEqual(asyncio.run(self.stream(n_pages=1, prefetched={0: "page 1"})), ["Page 1"])
+        self.assertEqual(self.requested, [])
+
+    def test_parser_failure_is_raised(self) -> None:
+        stream = self.stream(n_pages=10, prefetched={}, extract_func=fail_to_extract, queue_size=2)
+        with self.assertRaises(AttributeError):
+            asyncio.run(asyncio.wait_for(stream, timeout=10))
+
+
+class TestParseUrlSynchronously(unittest.TestCase):
+
+    def test_returns_text_with_a_timeout(self) -> None:
+        response = mock.Mock(status_code=200, text="<html>x</html>", content=b"<html>x</html>", headers={})
+        with mock.patch("requests.get", return_value=response) as get:
+            self.assertEqual(parse_url_synchronously("https://letterboxd.com/film/x/", timeout=5.0), "<html>x</html>")
+        self.assertEqual(get.call_args.kwargs["timeout"], 5.0)
+
+
+def get_page_title_and_worker(html_page: str) -> tuple[str, int]:
+    return html_page.title(), os.getpid()
+
+
+class TestExtractRecordsMultiprocessing(unittest.TestCase):
+
+    def test_records_are_extracted_in_order_in_the_shared_pool(self) -> None:
+        with get_process_pool(parallel_technique=ParallelTechnique.MULTIPROCESSING) as executor:
+            records = extract_records_multiprocessing(html_pages=["page 1", "page 2", "page 3"],
+                                                      extract_func=get_page_title_and_worker,
+                                                      executor=executor,
+                                                      n_workers=2)
+            self.assertEqual([title for title, _worker in records], ["Page 1", "Page 2", "Page 3"])
+            more_records = extract_records_multiprocessing(html_pages=["page 4"],
+                                                           extract_func=get_page_title_and_worker,
+                                                           executor=executor,
+                                                           n_workers=2)
+            self.assertEqual(more_records[0][0], "Page 4")
+            self.assertNotEqual(more_records[0][1], os.getpid())
+
+    def test_only_parallel_techniques_get_a_process_pool(self) -> None:
+        self.assertIsNone(get_process_pool(parallel_technique=ParallelTechnique.LIGHTWEIGHT))
+        with get_process_pool(parallel_technique=ParallelTechnique.AUTO) as executor:
+            self.assertIsNotNone(executor)
+
+
+if __name__ == '__main__':
+    unittest.main()
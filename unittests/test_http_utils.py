@@ -0,0 +1,81 @@
+import os
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from utils.http_utils import FetchConfig, FetchError, get_backoff_delay, get_client_session, get_fetcher,\
+    fetch_with_retries
+from utils.cache_utils import ResponseCache
+
+
+class TestHttpUtils(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.config = FetchConfig(max_in_flight=2, rate_limit=0, max_retries=2, backoff_base=0.01, backoff_max=0.05)
+        self.calls = 0
+
+    async def fetch(self, path: str, cache: ResponseCache = None) -> str or None:
+        async def flaky(request):
+            self.calls += 1
+            return web.Response(text="ok") if self.calls > 2 else web.Response(status=503)
+
+        async def always_failing(request):
+            self.calls += 1
+            return web.Response(status=500)
+
+        async def missing(request):
+            self.calls += 1
+            return web.Response(status=404)
+
+        app = web.Application()
+        app.router.add_get("/flaky", flaky)
+        app.router.add_get("/failing", always_failing)
+        app.router.add_get("/missing", missing)
+
+        async with TestServer(app) as server:
+            async with get_client_session(config=self.config) as session:
+                fetcher = get_fetcher(session=session, config=self.config, cache=cache)
+                return await fetch_with_retries(fetcher=fetcher, url=str(server.make_url(path)))
+
+    def test_retries_until_success(self) -> None:
+        self.assertEqual(asyncio.run(self.fetch("/flaky")), "ok")
+        self.assertEqual(self.calls, 3)
+
+    def test_raises_after_retries_are_exhausted(self) -> None:
+        with self.assertRaises(FetchError):
+            asyncio.run(self.fetch("/failing"))
+        self.assertEqual(self.calls, self.config.max_retries + 1)
+
+    def test_does_not_retry_client_errors(self) -> None:
+        self.assertIsNone(asyncio.run(self.fetch("/missing")))
+        self.assertEqual(self.calls, 1)
+
+    def test_cache_writes_run_off_the_event_loop_thread(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(path=os.path.join(directory, "responses.sqlite3"), ttl=3600, max_size=1_000_000)
+            writer_threads = []
+            put = cache.put
+
+            def recording_put(**kwargs) -> None:
+                writer_threads.append(threading.current_thread())
+                put(**kwargs)
+
+            with mock.patch.object(cache, "put", side_effect=recording_put):
+                self.assertEqual(asyncio.run(self.fetch("/flaky", cache=cache)), "ok")
+            self.assertEqual(len(writer_threads), 1)
+            self.assertIsNot(writer_threads[0], threading.main_thread())
+            self.assertEqual(cache.connection.execute("SELECT COUNT(*) FROM responses").fetchone(), (1,))
+            cache.close()
+
+    def test_get_backoff_delay(self) -> None:
+        self.assertEqual(get_backoff_delay(attempt=0, config=self.config, retry_after="0.02"), 0.02)
+        self.assertEqual(get_backoff_delay(attempt=0, config=self.config, retry_after="120"), 0.05)
+        for attempt in range(10):
+            self.assertLessEqual(get_backoff_delay(attempt=attempt, config=self.config), self.config.backoff_max)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import time
+import unittest
+import pandas as pd
+from utils.incremental_utils import get_newest_first_page_url, is_full_refresh_due, get_full_refresh_metadata,\
+    get_stored_ratings, page_is_unchanged, merge_incremental_records, has_removed_films,\
+    LAST_FULL_REFRESH_KEY
+
+
+class TestIncrementalUtils(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.current_df = pd.DataFrame({"id": [1, 2, 3], "rating": [8, 6, 10], "title": ["a", "b", "c"]})
+        self.stored_ratings = get_stored_ratings(current_df=self.current_df)
+
+    def test_get_newest_first_page_url(self) -> None:
+        metadata = {"url": "https://letterboxd.com/sonochiara123/list/2021/by/added-earliest/", "title": "2021"}
+        self.assertEqual(get_newest_first_page_url(metadata=metadata, sort="added", page_number=2),
+                         "https://letterboxd.com/sonochiara123/list/2021/by/added/page/2/")
+
+    def test_full_refresh_schedule(self) -> None:
+        self.assertTrue(is_full_refresh_due(object_metadata=None, full_refresh_days=7))
+        recent = {LAST_FULL_REFRESH_KEY: str(int(time.time()) - 86400)}
+        old = {LAST_FULL_REFRESH_KEY: str(int(time.time()) - 8 * 86400)}
+        self.assertFalse(is_full_refresh_due(object_metadata=recent, full_refresh_days=7))
+        self.assertTrue(is_full_refresh_due(object_metadata=old, full_refresh_days=7))
+        self.assertEqual(get_full_refresh_metadata(object_metadata=recent, full_refresh=False), recent)
+        self.assertNotEqual(get_full_refresh_metadata(object_metadata=recent, full_refresh=True), recent)
+
+    def test_page_is_unchanged(self) -> None:
+        self.assertTrue(page_is_unchanged(page_record=([1, 2], [8, 6], ["u1", "u2"]),
+                                          stored_ratings=self.stored_ratings))
+        self.assertFalse(page_is_unchanged(page_record=([1, 2], [8, 7], ["u1", "u2"]),
+                                           stored_ratings=self.stored_ratings))
+        self.assertFalse(page_is_unchanged(page_record=([4, 1], [5, 8], ["u4", "u1"]),
+                                           stored_ratings=self.stored_ratings))
+
+    def test_merge_incremental_records(self) -> None:
+        merged = merge_incremental_records(page_records=[([4, 2], [5, 7], ["/film/d/", "/film/b/"])],
+                                           current_df=self.current_df)
+        self.assertEqual(merged["ids"].tolist(), [4, 2, 1, 3])
+        self.assertEqual(merged["ratings"].tolist(), [5, 7, 8, 10])
+        self.assertEqual(list(merged["urls"]),
+                         ["https://letterboxd.com/film/d/", "https://letterboxd.com/film/b/", None, None])
+
+    def test_has_removed_films(self) -> None:
+        self.assertFalse(has_removed_films(first_page_size=72, number_of_pages=3, n_merged=150))
+        self.assertTrue(has_removed_films(first_page_size=72, number_of_pages=2, n_merged=150))
+        self.assertFalse(has_removed_films(first_page_size=10, number_of_pages=1, n_merged=10))
+        self.assertTrue(has_removed_films(first_page_size=9, number_of_pages=1, n_merged=10))
+        self.assertTrue(has_removed_films(first_page_size=0, number_of_pages=1, n_merged=3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import tempfile
+import unittest
+import lambda_function
+from utils.enums_classes import ParallelTechnique
+from utils.scraping_context import ScrapingOptions
+
+
+class TestLambdaFunction(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        lambda_function.drop_warm_resources()
+        self.directory.cleanup()
+
+    def test_event_arguments(self) -> None:
+        event = {"urls": ["https://letterboxd.com/user/list/title/"],
+                 "arguments": {"storage_format": "parquet", "streaming": True}}
+        self.assertEqual(lambda_function.get_event_arguments(event),
+                         ["https://letterboxd.com/user/list/title/", "--storage-format", "parquet",
+                          "--streaming", "True"])
+
+    def test_memory_budget_from_event(self) -> None:
+        self.assertEqual(lambda_function.get_memory_budget({"memory_budget_mb": 512}), 512 * 1024 * 1024)
+
+    def test_queue_size_fits_memory_budget(self) -> None:
+        options = ScrapingOptions(queue_size=1000, parallel_technique=ParallelTechnique.LIGHTWEIGHT)
+        options = lambda_function.fit_options_to_memory_budget(options=options, memory_budget=64 * 1024 * 1024)
+        self.assertLess(options.queue_size, 1000)
+        self.assertGreaterEqual(options.queue_size, 1)
+        self.assertEqual(options.parallel_technique, ParallelTechnique.LIGHTWEIGHT)
+
+    def test_batch_runs_are_streamed_to_fit_memory_budget(self) -> None:
+        options = ScrapingOptions(streaming=False, parallel_technique=ParallelTechnique.LIGHTWEIGHT)
+        options = lambda_function.fit_options_to_memory_budget(options=options, memory_budget=64 * 1024 * 1024)
+        self.assertTrue(options.streaming)
+
+    def test_warm_resources_reused_until_options_change(self) -> None:
+        options = ScrapingOptions(output_dir=self.directory.name)
+        resources, reused = lambda_function.get_warm_resources(options)
+        self.assertFalse(reused)
+        same_resources, reused = lambda_function.get_warm_resources(ScrapingOptions(output_dir=self.directory.name))
+        self.assertTrue(reused)
+        self.assertIs(same_resources, resources)
+        other_resources, reused = lambda_function.get_warm_resources(ScrapingOptions(output_dir=self.directory.name,
+                                                                                     cache_ttl=0))
+        self.assertFalse(reused)
+        self.assertIsNot(other_resources, resources)
@@ -4,7 +4,6 @@ from utils.letterboxd_scraping_functions import *
 from utils.generic_scraping_functions import ParallelTechnique
 from utils.s3_utils import get_s3_key, read_current_df_from_s3
 from utils.config import config_dict
-from utils.data_wrangling_utils import get_new_records
 
 
 class TestLetterboxdFunctions(unittest.TestCase):
@@ -35,10 +34,6 @@ class TestLetterboxdFunctions(unittest.TestCase):
 
     current_df, runtime = read_current_df_from_s3(configs=config_dict, key=df_key)
 
-    new_records = get_new_records(current_df=current_df,
-                                  film_ids=ids_ratings_urls["ids"],
-                                  film_urls=ids_ratings_urls["urls"])
-
     film_htmls_none, runtime = parse_film_urls_as_html(current_df=current_df,
                                                        new_records=None,
                                                        film_urls=urls,
@@ -0,0 +1,27 @@
+import unittest
+from utils import letterboxd_scraping_functions, lightweight_scraping_functions
+from benchmarks.html_fixtures import get_playlist_page_html, get_film_page_html
+
+
+class TestLightweightScrapingFunctions(unittest.TestCase):
+
+    def test_playlist_pages_match_beautifulsoup(self) -> None:
+        for rated in (True, False):
+            html_page = get_playlist_page_html(first_film_id=1, n_films=72, n_pages=3, rated=rated)
+            self.assertEqual(lightweight_scraping_functions.extract_ids_ratings_and_urls(html_page),
+                             letterboxd_scraping_functions.extract_ids_ratings_and_urls(html_page))
+
+    def test_film_pages_match_beautifulsoup(self) -> None:
+        for film_id in (1, 50, 99):
+            html_page = get_film_page_html(film_id=film_id)
+            self.assertEqual(str(lightweight_scraping_functions.extract_film_data(html_page)),
+                             str(letterboxd_scraping_functions.extract_film_data(html_page)))
+
+    def test_accepts_bytes(self) -> None:
+        html_page = get_film_page_html(film_id=7)
+        self.assertEqual(lightweight_scraping_functions.extract_film_data(html_page.encode("utf-8")),
+                         lightweight_scraping_functions.extract_film_data(html_page))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import gc
+import tempfile
+import unittest
+import warnings
+import numpy as np
+import pandas as pd
+from utils.enums_classes import StorageFormat
+from utils.local_storage_utils import LocalObjectStore
+from utils.s3_utils import read_dataframe_from_s3, write_dataframe_to_s3, get_s3_object_metadata,\
+    update_s3_object_metadata, get_s3_metadata_key
+
+
+class TestLocalObjectStore(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = LocalObjectStore()
+        self.df = pd.DataFrame({"id": np.arange(6),
+                                "rating": np.arange(6) + 1,
+                                "title": [f"Film {i}" for i in range(6)],
+                                "year": pd.array([1990, 1990, 2000, None, 2010, 2010], dtype="Int64"),
+                                "director": ["Director"] * 6,
+                                "actors": ["Actor"] * 6,
+                                "countries": ["Italy"] * 6})
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def round_trip(self, key: str, storage_format: StorageFormat) -> pd.DataFrame:
+        write_dataframe_to_s3(bucket=self.directory.name, s3_client=self.store, filename=key, df=self.df,
+                              storage_format=storage_format, metadata={"content-hash": "abc"})
+        return read_dataframe_from_s3(bucket=self.directory.name, s3_client=self.store, key=key,
+                                      storage_format=storage_format)
+
+    def test_csv_round_trip(self) -> None:
+        df = self.round_trip(key="user/title/title.csv", storage_format=StorageFormat.CSV)
+        pd.testing.assert_frame_equal(df, self.df, check_dtype=False)
+
+    def test_partitioned_parquet_round_trip(self) -> None:
+        df = self.round_trip(key="user/title/title/", storage_format=StorageFormat.PARQUET)
+        pd.testing.assert_frame_equal(df.sort_values("id", ignore_index=True), self.df, check_dtype=False)
+
+    def test_metadata(self) -> None:
+        self.round_trip(key="user/title/title/", storage_format=StorageFormat.PARQUET)
+        key = get_s3_metadata_key("user/title/title/")
+        self.assertEqual(get_s3_object_metadata(bucket=self.directory.name, s3_client=self.store, key=key),
+                         {"content-hash": "abc"})
+        update_s3_object_metadata(bucket=self.directory.name, s3_client=self.store, key=key,
+                                  metadata={"content-hash": "def"})
+        self.assertEqual(get_s3_object_metadata(bucket=self.directory.name, s3_client=self.store, key=key),
+                         {"content-hash": "def"})
+
+    def test_reads_leave_no_file_open(self) -> None:
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always", ResourceWarning)
+            self.round_trip(key="user/title/title.csv", storage_format=StorageFormat.CSV)
+            gc.collect()
+        self.assertEqual([warning for warning in caught_warnings if warning.category is ResourceWarning], [])
+
+    def test_missing_objects(self) -> None:
+        self.assertIsNone(read_dataframe_from_s3(bucket=self.directory.name, s3_client=self.store,
+                                                 key="user/title/title.csv", storage_format=StorageFormat.CSV))
+        self.assertIsNone(get_s3_object_metadata(bucket=self.directory.name, s3_client=self.store,
+                                                 key="user/title/title.csv"))
+
+
+if __name__ == '__main__':
+    unittest.main()
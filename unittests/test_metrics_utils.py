@@ -0,0 +1,59 @@
+import os
+import json
+import tempfile
+import unittest
+from utils.enums_classes import MetricsFormat
+from utils.metrics_utils import metrics, timed, extract_pages, get_prometheus_text, export_metrics
+
+
+@timed("double")
+def double(x: int) -> int:
+    return 2 * x
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self) -> None:
+        metrics.reset()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        metrics.reset()
+        self.directory.cleanup()
+
+    def test_timed_keeps_return_value(self) -> None:
+        self.assertEqual(double(2), 4)
+        self.assertEqual(double(3), 6)
+        summary = metrics.summaries[("stage_seconds", (("stage", "double"),))]
+        self.assertEqual(summary.count, 2)
+        self.assertGreater(metrics.get_last_duration(), 0)
+        self.assertEqual([span["name"] for span in metrics.spans], ["double", "double"])
+
+    def test_extract_pages_records_parse_time(self) -> None:
+        self.assertEqual(extract_pages(len, ["a", "bb"]), [1, 2])
+        self.assertEqual(metrics.summaries[("page_parse_seconds", (("extractor", "builtins.len"),))].count, 2)
+
+    def test_prometheus_text(self) -> None:
+        metrics.increment("pages_fetched_total", 3)
+        metrics.increment("http_responses_total", status="429")
+        metrics.observe("fetch_seconds", 0.5)
+        text = get_prometheus_text()
+        self.assertIn("# TYPE letterboxd_pages_fetched_total counter\nletterboxd_pages_fetched_total 3\n", text)
+        self.assertIn('letterboxd_http_responses_total{status="429"} 1\n', text)
+        self.assertIn("letterboxd_fetch_seconds_count 1\nletterboxd_fetch_seconds_sum 0.5\n", text)
+        self.assertIn("letterboxd_fetch_seconds_max 0.5\n", text)
+
+    def test_export_jsonl(self) -> None:
+        path = os.path.join(self.directory.name, "metrics.jsonl")
+        double(1)
+        metrics.increment("pages_fetched_total")
+        export_metrics(path=path, metrics_format=MetricsFormat.JSONL)
+        export_metrics(path=path, metrics_format=MetricsFormat.JSONL)
+        with open(path) as f:
+            samples = [json.loads(line) for line in f]
+        self.assertEqual(len(samples), 6)
+        self.assertEqual({sample["type"] for sample in samples}, {"counter", "summary", "span"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from utils.enums_classes import StorageFormat
+from utils.local_storage_utils import LocalObjectStore, LocalObjectPaginator
+from utils.s3_utils import write_dataframe_to_s3
+from utils import ratings_matrix_utils
+from utils.ratings_matrix_utils import update_ratings_matrix, read_ratings_matrix
+
+
+class TestRatingsMatrixUtils(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = LocalObjectStore()
+        self.write_playlist(user="bob", title="ratings", ids=[3, 1], ratings=[6, 8], content_hash="b1")
+        self.write_playlist(user="alice", title="ratings", ids=[2], ratings=[10], content_hash="a1")
+        self.write_playlist(user="alice", title="my_list", ids=[4], ratings=[2], content_hash="l1")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_playlist(self, user: str, title: str, ids: list[int], ratings: list[int],
+                       content_hash: str or None) -> None:
+        df = pd.DataFrame({"id": ids, "rating": ratings, "title": [f"Film {film_id}" for film_id in ids],
+                           "year": [2000] * len(ids)})
+        metadata = {} if content_hash is None else {"content-hash": content_hash}
+        write_dataframe_to_s3(bucket=self.directory.name, s3_client=self.store, filename=f"{user}/{title}/{title}.csv",
+                              df=df, storage_format=StorageFormat.CSV, metadata=metadata)
+
+    def update(self):
+        return update_ratings_matrix(bucket=self.directory.name, s3_client=self.store,
+                                     storage_format=StorageFormat.CSV, partition_by_year=False)
+
+    def read_ratings(self) -> list[tuple]:
+        ratings = read_ratings_matrix(bucket=self.directory.name, s3_client=self.store).ratings
+        return list(zip(ratings["user"].cat.codes, ratings["user"], ratings["film_id"], ratings["rating"]))
+
+    def test_build(self) -> None:
+        self.update()
+        self.assertEqual(self.read_ratings(), [(0, "alice", 2, 10), (1, "bob", 1, 8), (1, "bob", 3, 6)])
+        self.assertEqual(read_ratings_matrix(bucket=self.directory.name, s3_client=self.store).content_hashes,
+                         {"alice": "a1", "bob": "b1"})
+
+    def test_only_changed_playlists_are_read(self) -> None:
+        self.update()
+        self.write_playlist(user="bob", title="ratings", ids=[1, 5], ratings=[4, 2], content_hash="b2")
+        with mock.patch.object(ratings_matrix_utils, "read_dataframe_from_s3",
+                               wraps=ratings_matrix_utils.read_dataframe_from_s3) as read_dataframe:
+            self.update()
+        self.assertEqual([call.kwargs["key"] for call in read_dataframe.call_args_list], ["bob/ratings/ratings.csv"])
+        self.assertEqual(self.read_ratings(), [(0, "alice", 2, 10), (1, "bob", 1, 4), (1, "bob", 5, 2)])
+
+    def test_unchanged_matrix_is_not_rewritten(self) -> None:
+        self.update()
+        with mock.patch.object(ratings_matrix_utils, "write_ratings_matrix") as write_ratings_matrix:
+            self.update()
+        write_ratings_matrix.assert_not_called()
+
+    def test_removed_playlists_are_dropped(self) -> None:
+        self.update()
+        self.store.delete_object(Bucket=self.directory.name, Key="alice/ratings/ratings.csv")
+        self.update()
+        self.assertEqual(self.read_ratings(), [(0, "bob", 1, 8), (0, "bob", 3, 6)])
+
+    def test_change_logs_are_not_listed(self) -> None:
+        self.store.put_object(Bucket=self.directory.name, Key="bob/ratings/changes/20240101T000000000000Z.csv",
+                              Body=b"changed_at,change,id,previous_rating,rating\n")
+        with mock.patch.object(LocalObjectPaginator, "paginate", autospec=True,
+                               side_effect=LocalObjectPaginator.paginate) as paginate:
+            self.update()
+        self.assertEqual([call.kwargs["Delimiter"] for call in paginate.call_args_list], ["/"])
+        self.assertEqual(self.read_ratings(), [(0, "alice", 2, 10), (1, "bob", 1, 8), (1, "bob", 3, 6)])
+
+    def test_missing_content_hash_is_stored_once(self) -> None:
+        self.write_playlist(user="carol", title="ratings", ids=[5], ratings=[7], content_hash=None)
+        self.update()
+        content_hash = read_ratings_matrix(bucket=self.directory.name, s3_client=self.store).content_hashes["carol"]
+        self.assertIsNotNone(content_hash)
+        metadata = self.store.head_object(Bucket=self.directory.name, Key="carol/ratings/ratings.csv")["Metadata"]
+        self.assertEqual(metadata, {"content-hash": content_hash})
+        with mock.patch.object(ratings_matrix_utils, "read_dataframe_from_s3") as read_dataframe:
+            self.update()
+        read_dataframe.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
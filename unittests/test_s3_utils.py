@@ -0,0 +1,35 @@
+import io
+import unittest
+import numpy as np
+import pandas as pd
+from utils.s3_utils import ChunkReader, iter_csv_chunks, iter_parquet_chunks
+
+
+class TestStreamingSerializers(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.df = pd.DataFrame({"id": np.arange(25),
+                                "rating": np.arange(25) % 10,
+                                "title": [f"Film {i}" for i in range(25)],
+                                "year": pd.array([1950 + i if i % 5 else None for i in range(25)], dtype="Int64")})
+
+    def test_csv_chunks_round_trip(self) -> None:
+        chunks = list(iter_csv_chunks(self.df, rows_per_chunk=10))
+        self.assertEqual(len(chunks), 3)
+        df = pd.read_csv(io.BytesIO(b"".join(chunks)), dtype={"year": "Int64"})
+        pd.testing.assert_frame_equal(df, self.df, check_dtype=False)
+
+    def test_parquet_chunks_round_trip(self) -> None:
+        chunks = list(iter_parquet_chunks(self.df, rows_per_chunk=10))
+        self.assertEqual(len(chunks), 4)
+        reader = io.BufferedReader(ChunkReader(iter(chunks)), buffer_size=7)
+        df = pd.read_parquet(io.BytesIO(reader.read()))
+        pd.testing.assert_frame_equal(df, self.df, check_dtype=False)
+
+    def test_empty_dataframe_keeps_header(self) -> None:
+        self.assertEqual(b"".join(iter_csv_chunks(self.df.head(0))), b"id,rating,title,year\n")
+        self.assertEqual(len(pd.read_parquet(io.BytesIO(b"".join(iter_parquet_chunks(self.df.head(0)))))), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,17 @@
-from utils.enums_classes import ParallelTechnique
+import argparse
+from utils.enums_classes import ParallelTechnique, StorageFormat, DatabaseWriteMode, DatabaseSchema, MetricsFormat
+from utils.http_utils import FetchConfig
+from utils.scraping_context import ScrapingOptions
+
+
+def format_bool_argument(value: str) -> bool:
+    """Turns a true/false, yes/no, on/off or 1/0 command line value into a bool"""
+    if value.lower() in ("y", "yes", "t", "true", "on", "1"):
+        return True
+    elif value.lower() in ("n", "no", "f", "false", "off", "0"):
+        return False
+    else:
+        raise ValueError(f"Invalid boolean value {value!r}")
 
 
 def format_soupification_argument(soupification: str) -> ParallelTechnique:
@@ -8,5 +21,145 @@ def format_soupification_argument(soupification: str) -> ParallelTechnique:
         return ParallelTechnique.MULTITHREADING
     elif soupification == "synchronous":
         return ParallelTechnique.SYNCHRONOUS
+    elif soupification == "lightweight":
+        return ParallelTechnique.LIGHTWEIGHT
+    elif soupification == "auto":
+        return ParallelTechnique.AUTO
     else:
         raise ValueError("Invalid value supplied to the --soupification argument")
+
+
+def format_storage_format_argument(storage_format: str, partition_by_year: bool) -> StorageFormat:
+    """Turns the --storage-format argument into a StorageFormat, checking it is compatible with
+    --partition-by-year"""
+    if storage_format == "csv":
+        if partition_by_year:
+            raise ValueError("--partition-by-year requires --storage-format parquet")
+        return StorageFormat.CSV
+    elif storage_format == "parquet":
+        return StorageFormat.PARQUET
+    else:
+        raise ValueError("Invalid value supplied to the --storage-format argument")
+
+
+def format_resume_argument(resume: bool, work_dir: str or None) -> bool:
+    if resume and work_dir is None:
+        raise ValueError("--resume requires --work-dir")
+    return resume
+
+
+def format_rate_limit_argument(rate_limit: float) -> float:
+    if rate_limit < 0:
+        raise ValueError("--rate-limit must not be negative")
+    return rate_limit
+
+
+def format_burst_argument(burst: int) -> int:
+    if burst < 1:
+        raise ValueError("--burst must be at least 1, a bucket holding no tokens never lets a request through")
+    return burst
+
+
+def format_queue_size_argument(queue_size: int) -> int:
+    if queue_size < 1:
+        raise ValueError("--queue-size must be at least 1, a queue without a maximum size would not bound memory")
+    return queue_size
+
+
+def format_max_in_flight_argument(max_in_flight: int) -> int:
+    if max_in_flight < 1:
+        raise ValueError("--max-in-flight must be at least 1, no request could ever be sent otherwise")
+    return max_in_flight
+
+
+def format_max_retries_argument(max_retries: int) -> int:
+    if max_retries < 0:
+        raise ValueError("--max-retries must not be negative")
+    return max_retries
+
+
+def format_timeout_argument(timeout: float) -> float:
+    if timeout <= 0:
+        raise ValueError("--timeout must be greater than 0")
+    return timeout
+
+
+def format_database_mode_argument(database_mode: str) -> DatabaseWriteMode:
+    if database_mode == "replace":
+        return DatabaseWriteMode.REPLACE
+    elif database_mode == "upsert":
+        return DatabaseWriteMode.UPSERT
+    else:
+        raise ValueError("Invalid value supplied to the --database-mode argument")
+
+
+def format_database_schema_argument(database_schema: str) -> DatabaseSchema:
+    if database_schema == "flat":
+        return DatabaseSchema.FLAT
+    elif database_schema == "normalized":
+        return DatabaseSchema.NORMALIZED
+    else:
+        raise ValueError("Invalid value supplied to the --database-schema argument")
+
+
+def format_metrics_format_argument(metrics_format: str) -> MetricsFormat:
+    if metrics_format == "jsonl":
+        return MetricsFormat.JSONL
+    elif metrics_format == "prometheus":
+        return MetricsFormat.PROMETHEUS
+    else:
+        raise ValueError("Invalid value supplied to the --metrics-format argument")
+
+
+def get_fetch_config(args: argparse.Namespace) -> FetchConfig:
+    """Builds the HTTP fetch configuration out of the command line arguments"""
+    return FetchConfig(max_in_flight=format_max_in_flight_argument(args.max_in_flight),
+                       rate_limit=format_rate_limit_argument(args.rate_limit),
+                       burst=format_burst_argument(args.burst),
+                       max_retries=format_max_retries_argument(args.max_retries),
+                       backoff_base=args.backoff_base,
+                       timeout=format_timeout_argument(args.timeout),
+                       pool_size=args.pool_size)
+
+
+def get_scraping_options(args: argparse.Namespace) -> ScrapingOptions:
+    """Builds the scraping options out of the command line arguments"""
+    return ScrapingOptions(parallel_technique=format_soupification_argument(args.soupification),
+                           over_write=args.overwrite,
+                           write_to_local_db=args.database,
+                           database_mode=format_database_mode_argument(args.database_mode),
+                           database_schema=format_database_schema_argument(args.database_schema),
+                           change_log=args.change_log,
+                           streaming=args.streaming,
+                           queue_size=format_queue_size_argument(args.queue_size),
+                           fetch_config=get_fetch_config(args),
+                           cache_dir=args.cache_dir,
+                           cache_ttl=args.cache_ttl * 3600,
+                           cache_max_size=args.cache_max_size * 1024 * 1024,
+                           film_store_path=args.film_store,
+                           work_dir=args.work_dir,
+                           resume=format_resume_argument(args.resume, args.work_dir),
+                           incremental=args.incremental,
+                           incremental_sort=args.incremental_sort,
+                           full_refresh_days=args.full_refresh_days,
+                           storage_format=format_storage_format_argument(args.storage_format,
+                                                                         args.partition_by_year),
+                           partition_by_year=args.partition_by_year,
+                           output_dir=args.output_dir,
+                           ratings_matrix=args.ratings_matrix)
+
+
+def read_url_file(path: str) -> list[str]:
+    """Reads playlist URLs from a file, one per line, skipping blank lines and comments"""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+
+def get_playlist_urls(args: argparse.Namespace) -> list[str]:
+    """Returns the playlist URLs passed on the command line and in the URL file, without duplicates"""
+    urls = list(args.urls)
+    if args.url_file is not None:
+        urls += read_url_file(path=args.url_file)
+    if not urls:
+        raise ValueError("Supply at least one playlist URL, either as an argument or with --url-file")
+    return list(dict.fromkeys(urls))
@@ -0,0 +1,136 @@
+import os
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+import dataclasses
+from dataclasses import dataclass, field
+from utils.logging_utils import Logger
+
+info_log = Logger(name=__name__, level=logging.INFO).return_logger()
+
+ACCESS_FLUSH_INTERVAL = 1000
+
+
+@dataclass
+class CachedResponse:
+    body: str
+    etag: str or None
+    last_modified: str or None
+    fetched_at: float
+
+
+@dataclass
+class ResponseCache:
+    """On-disk cache of HTTP responses keyed by URL. Bodies are stored zlib-compressed alongside their ETag and
+    Last-Modified headers, entries younger than ttl seconds are served without touching the network and the least
+    recently used entries are evicted once the compressed bodies exceed max_size bytes. Reads are recorded in memory
+    and only written with the next put, so that a cache hit never waits on a commit"""
+    path: str
+    ttl: float
+    max_size: int
+    connection: sqlite3.Connection = field(default=None, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    size: list = field(default_factory=lambda: [0], repr=False)
+    accessed: dict = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                    "url TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT, last_modified TEXT, "
+                                    "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self.connection.commit()
+            self.size[0] = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def with_ttl(self, ttl: float) -> "ResponseCache":
+        """Returns a view of the same cache with a different time to live"""
+        return dataclasses.replace(self, ttl=ttl)
+
+    def get(self, url: str) -> CachedResponse or None:
+        """Returns the cached response for a URL, if any, and marks it as recently used"""
+        with self.lock:
+            row = self.connection.execute("SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?",
+                                          (url,)).fetchone()
+            if row is None:
+                return None
+            self.accessed[url] = time.time()
+            if len(self.accessed) >= ACCESS_FLUSH_INTERVAL:
+                self.flush_accessed()
+                self.connection.commit()
+        body, etag, last_modified, fetched_at = row
+        return CachedResponse(body=zlib.decompress(body).decode("utf-8"),
+                              etag=etag,
+                              last_modified=last_modified,
+                              fetched_at=fetched_at)
+
+    def is_fresh(self, response: CachedResponse) -> bool:
+        """Checks whether a cached response can be used without revalidating it"""
+        return time.time() - response.fetched_at < self.ttl
+
+    def put(self, url: str, body: str, etag: str or None, last_modified: str or None) -> None:
+        """Stores a response, evicting the least recently used entries if the cache grows too big"""
+        compressed_body = zlib.compress(body.encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (url, compressed_body, etag, last_modified, now, now, len(compressed_body)))
+            self.size[0] += len(compressed_body) - (previous[0] if previous else 0)
+            self.flush_accessed()
+            self.evict()
+            self.connection.commit()
+
+    def revalidate(self, url: str) -> None:
+        """Marks a cached response as fresh after the server answered 304 Not Modified"""
+        with self.lock:
+            self.connection.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self.connection.commit()
+
+    def flush_accessed(self) -> None:
+        """Writes the access times recorded by get, without committing them. Expects the lock to be held"""
+        if self.accessed:
+            self.connection.executemany("UPDATE responses SET accessed_at = ? WHERE url = ?",
+                                        [(accessed_at, url) for url, accessed_at in self.accessed.items()])
+            self.accessed.clear()
+
+    def evict(self) -> None:
+        """Deletes the least recently used entries until the cache fits in max_size. Expects the lock to be held"""
+        while self.size[0] > self.max_size:
+            rows = self.connection.execute("SELECT url, size FROM responses ORDER BY accessed_at LIMIT 100").fetchall()
+            if not rows:
+                self.size[0] = 0
+                return
+            for url, size in rows:
+                self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.size[0] -= size
+                if self.size[0] <= self.max_size:
+                    break
+
+    def close(self) -> None:
+        """Writes the pending access times and closes the underlying database"""
+        with self.lock:
+            self.flush_accessed()
+            self.connection.commit()
+            self.connection.close()
+
+
+def get_conditional_headers(response: CachedResponse or None) -> dict:
+    """Returns the headers that turn a GET into a conditional GET for a cached response"""
+    headers = {}
+    if response is not None:
+        if response.etag:
+            headers["If-None-Match"] = response.etag
+        if response.last_modified:
+            headers["If-Modified-Since"] = response.last_modified
+    return headers
+
+
+def get_response_cache(cache_dir: str or None, ttl: float, max_size: int) -> ResponseCache or None:
+    """Returns the response cache stored in cache_dir, or None if caching is disabled"""
+    if cache_dir is None:
+        return None
+    return ResponseCache(path=os.path.join(cache_dir, "responses.sqlite3"), ttl=ttl, max_size=max_size)
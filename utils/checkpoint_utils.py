@@ -0,0 +1,96 @@
+import os
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from utils.film_store_utils import FilmStore
+from utils.logging_utils import Logger
+
+info_log = Logger(name=__name__, level=logging.INFO).return_logger()
+
+CHECKPOINT_INTERVAL = 500
+
+
+@dataclass
+class Checkpoint:
+    """Progress of one playlist kept in a local work directory until the playlist is stored: the film IDs, ratings
+    and URLs scraped from its playlist pages and the records of the film pages scraped so far. The URL of a stored
+    film merged into an incremental run is None"""
+    directory: str
+    connection: sqlite3.Connection = field(default=None, repr=False)
+    film_store: FilmStore = field(default=None, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.connection is None:
+            self.connection = sqlite3.connect(os.path.join(self.directory, "playlist.sqlite3"),
+                                              check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS playlist_films ("
+                                    "position INTEGER PRIMARY KEY, id INTEGER NOT NULL, rating INTEGER NOT NULL, "
+                                    "url TEXT)")
+            self.connection.commit()
+        if self.film_store is None:
+            self.film_store = FilmStore(path=os.path.join(self.directory, "films.sqlite3"))
+
+    def get_ids_ratings_urls(self) -> dict or None:
+        """Returns the checkpointed film IDs, ratings and URLs of the playlist, or None if there are none"""
+        with self.lock:
+            rows = self.connection.execute("SELECT id, rating, url FROM playlist_films ORDER BY position").fetchall()
+        if not rows:
+            return None
+        ids, ratings, urls = (list(column) for column in zip(*rows))
+        return {"ids": ids, "ratings": ratings, "urls": urls}
+
+    def put_ids_ratings_urls(self, ids_ratings_urls_dict: dict) -> None:
+        """Checkpoints the film IDs, ratings and URLs of the playlist in a single transaction"""
+        rows = list(enumerate(zip(ids_ratings_urls_dict["ids"],
+                                  ids_ratings_urls_dict["ratings"],
+                                  ids_ratings_urls_dict["urls"])))
+        with self.lock:
+            self.connection.execute("DELETE FROM playlist_films")
+            self.connection.executemany("INSERT INTO playlist_films VALUES (?, ?, ?, ?)",
+                                        [(position, int(film_id), int(rating), url)
+                                         for position, (film_id, rating, url) in rows])
+            self.connection.commit()
+
+    def close(self) -> None:
+        """Closes the underlying databases"""
+        with self.lock:
+            self.connection.close()
+        self.film_store.close()
+
+    def remove(self) -> None:
+        """Closes the checkpoint and deletes it from the work directory"""
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def get_checkpoint_directory(work_dir: str, metadata: dict) -> str:
+    return os.path.join(work_dir, metadata["user"], metadata["title"])
+
+
+@contextmanager
+def open_checkpoint(work_dir: str or None, metadata: dict, resume: bool):
+    """Yields the checkpoint of a playlist, or None if no work directory was supplied. Unless resuming, any
+    checkpoint left by a previous run is discarded first. The checkpoint is deleted once the block completes and
+    kept for --resume if the block raises"""
+    if work_dir is None:
+        yield None
+        return
+
+    directory = get_checkpoint_directory(work_dir=work_dir, metadata=metadata)
+    if not resume and os.path.exists(directory):
+        info_log.info(f"Discarding the checkpoint in {directory}, pass --resume True to pick it up instead")
+        shutil.rmtree(directory)
+    checkpoint = Checkpoint(directory=directory)
+    try:
+        yield checkpoint
+    except BaseException:
+        checkpoint.close()
+        info_log.info(f"Kept the checkpoint in {directory}, rerun with --resume True to pick up where this run "
+                      f"stopped")
+        raise
+    checkpoint.remove()
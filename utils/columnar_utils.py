@@ -0,0 +1,107 @@
+import sys
+from collections.abc import Sequence
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+LETTERBOXD_URL = "https://letterboxd.com"
+
+
+def get_film_url(slug: str or None) -> str or None:
+    """Builds the URL of a film page out of its slug, keeping the None of stored films that have no URL"""
+    return None if slug is None else LETTERBOXD_URL + slug
+
+
+def intern_name(value):
+    """Interns director and country strings, which repeat across films, so that each distinct one is only held in
+    memory once. Missing values (np.nan) are returned as they are"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass
+class FilmUrls(Sequence):
+    """The film page URLs of a playlist, kept as their slugs. A full URL is only built when it is read, which for
+    most runs is just the handful of new films whose pages get scraped"""
+    slugs: list[str or None]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FilmUrls(slugs=self.slugs[index])
+        return get_film_url(self.slugs[index])
+
+    def __iter__(self):
+        return map(get_film_url, self.slugs)
+
+    def __len__(self) -> int:
+        return len(self.slugs)
+
+
+@dataclass
+class PlaylistColumns:
+    """Film IDs and ratings of a playlist in int64 arrays preallocated for the whole playlist, with the film slugs
+    next to them, which pandas takes over without copying"""
+    ids: np.ndarray
+    ratings: np.ndarray
+    slugs: list[str or None]
+    size: int = 0
+
+    @classmethod
+    def with_capacity(cls, capacity: int) -> "PlaylistColumns":
+        return cls(ids=np.empty(capacity, dtype="int64"), ratings=np.empty(capacity, dtype="int64"), slugs=[])
+
+    def append_page(self, ids: list[int], ratings: list[int], slugs: list[str or None]) -> None:
+        """Copies the IDs, ratings and slugs of one playlist page into the buffers"""
+        end = self.size + len(ids)
+        self.ids[self.size:end] = ids
+        self.ratings[self.size:end] = ratings
+        self.slugs.extend(slugs)
+        self.size = end
+
+    def to_dict(self) -> dict:
+        return {"ids": self.ids[:self.size], "ratings": self.ratings[:self.size], "urls": FilmUrls(slugs=self.slugs)}
+
+
+@dataclass
+class FilmColumns:
+    """Data scraped from film pages in preallocated arrays: IDs in int64 and years in int64 with a mask of missing
+    years, which becomes a nullable Int64 column without copying. Directors and countries, which repeat across films,
+    are interned, the joined cast of a film is not since it is unique to it"""
+    film_ids: np.ndarray
+    years: np.ndarray
+    missing_years: np.ndarray
+    titles: list[str]
+    directors: list[str or float]
+    actors: list[str or float]
+    countries: list[str or float]
+    size: int = 0
+
+    @classmethod
+    def with_capacity(cls, capacity: int) -> "FilmColumns":
+        return cls(film_ids=np.empty(capacity, dtype="int64"),
+                   years=np.zeros(capacity, dtype="int64"),
+                   missing_years=np.zeros(capacity, dtype="bool"),
+                   titles=[],
+                   directors=[],
+                   actors=[],
+                   countries=[])
+
+    def append(self, film_id: int, title: str, year: int or float, director, cast, country) -> None:
+        """Copies the record of one film into the buffers"""
+        self.film_ids[self.size] = film_id
+        if year is None or isinstance(year, float) and np.isnan(year):
+            self.missing_years[self.size] = True
+        else:
+            self.years[self.size] = year
+        self.titles.append(title)
+        self.directors.append(intern_name(director))
+        self.actors.append(cast)
+        self.countries.append(intern_name(country))
+        self.size += 1
+
+    def to_dict(self) -> dict:
+        return {"film_ids": self.film_ids[:self.size],
+                "titles": self.titles,
+                "years": pd.arrays.IntegerArray(self.years[:self.size], self.missing_years[:self.size]),
+                "directors": self.directors,
+                "actors": self.actors,
+                "countries": self.countries}
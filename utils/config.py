@@ -1,11 +1,32 @@
 import os
+from collections.abc import Mapping
 
+ENVIRONMENT_VARIABLES = {"local_db_username": "postgres_username",
+                         "local_db_password": "postgres_psw",
+                         "local_db_host": "postgres_host",
+                         "local_db_port": "postgres_port",
+                         "local_db_name": "postgres_letterboxd_db",
+                         "aws_access_key": "aws_access_key",
+                         "aws_secret_access_key": "aws_secret_access_key",
+                         "s3_bucket": "aws_s3_bucket"}
 
-config_dict = {"local_db_username": os.environ["postgres_username"],
-               "local_db_password": os.environ["postgres_psw"],
-               "local_db_host": os.environ["postgres_host"],
-               "local_db_port": os.environ["postgres_port"],
-               "local_db_name": os.environ["postgres_letterboxd_db"],
-               "aws_access_key": os.environ["aws_access_key"],
-               "aws_secret_access_key": os.environ["aws_secret_access_key"],
-               "s3_bucket": os.environ["aws_s3_bucket"]}
+
+class EnvironmentConfig(Mapping):
+    """Configuration read from the environment when a value is first needed rather than at import, so that runs
+    which never touch Postgres or S3 do not need their credentials"""
+
+    def __getitem__(self, key: str) -> str:
+        variable = ENVIRONMENT_VARIABLES[key]
+        try:
+            return os.environ[variable]
+        except KeyError:
+            raise KeyError(f"The {variable} environment variable is required to read {key}") from None
+
+    def __iter__(self):
+        return iter(ENVIRONMENT_VARIABLES)
+
+    def __len__(self) -> int:
+        return len(ENVIRONMENT_VARIABLES)
+
+
+config_dict = EnvironmentConfig()
@@ -1,3 +1,7 @@
+import hashlib
+from collections.abc import Sequence
+from dataclasses import dataclass
+import numpy as np
 import pandas as pd
 
 
@@ -7,30 +11,95 @@ def cast_id_and_year_as_numeric(current_df: pd.DataFrame) -> pd.DataFrame:
     return current_df
 
 
-def get_film_ids_in_current_df(current_df: pd.DataFrame) -> pd.Series:
-    """Extracts the IDs of the films currently present in the S3 bucket"""
-    return current_df["id"].unique()
-
-
-def get_new_records(current_film_ids: pd.Series,
-                    ids_ratings_urls_dict: dict) -> list[str]:
-    """Creates a list with all URLs of films that have been added to the playlist after the latest upload"""
-    new_entries = []
-    for film_id, url in zip(ids_ratings_urls_dict["ids"], ids_ratings_urls_dict["urls"]):
-        if film_id not in current_film_ids:
-            new_entries.append(url)
-    return new_entries
+def get_typed_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Casts the columns of the dataframe to their proper types, so that integers are stored as integers and missing
+    years as nulls rather than floats"""
+    return df.astype({"id": "int64", "rating": "int64", "year": "Int64"})
+
+
+def get_content_hash(df: pd.DataFrame) -> str:
+    """Returns a SHA-256 hash of the contents of the dataframe that does not depend on the order of its rows or on
+    whether it was read from CSV or Parquet"""
+    typed_df = get_typed_dataframe(df).sort_values("id")
+    content_hash = hashlib.sha256(",".join(typed_df.columns).encode("utf-8"))
+    content_hash.update(pd.util.hash_pandas_object(typed_df, index=False).to_numpy().tobytes())
+    return content_hash.hexdigest()
+
+
+def get_urls_at(urls: Sequence[str], mask: np.ndarray) -> list[str]:
+    """Returns the URLs where the mask is True, only reading those, so that the full URLs of the other films are
+    never built"""
+    return [urls[position] for position in np.flatnonzero(mask)]
+
+
+@dataclass
+class ChangeReport:
+    """Differences between the stored playlist and the one just scraped. added and removed hold the id and rating
+    of each film, rerated its id, previous_rating and rating, and new_urls the film pages still to be scraped"""
+    added: pd.DataFrame
+    removed: pd.DataFrame
+    rerated: pd.DataFrame
+    new_urls: list[str]
+
+    @property
+    def has_changes(self) -> bool:
+        return not (self.added.empty and self.removed.empty and self.rerated.empty)
+
+
+def get_change_report(current_df: pd.DataFrame or None, ids_ratings_urls_dict: dict) -> ChangeReport:
+    """Diffs the scraped IDs and ratings against the stored dataframe with hash-based lookups of film IDs, so the
+    cost grows linearly with the size of the playlist. Every film counts as added if nothing is stored yet"""
+    if current_df is None:
+        current_df = pd.DataFrame({"id": pd.Series(dtype="int64"), "rating": pd.Series(dtype="int64")})
+    scraped_ids = pd.Index(np.asarray(ids_ratings_urls_dict["ids"], dtype="int64"))
+    scraped_ratings = np.asarray(ids_ratings_urls_dict["ratings"], dtype="int64")
+    is_first = ~scraped_ids.duplicated()
+
+    stored_df = current_df[["id", "rating"]].astype("int64").drop_duplicates("id")
+    stored_ids = pd.Index(stored_df["id"].to_numpy())
+    stored_ratings = stored_df["rating"].to_numpy()
+
+    positions = stored_ids.get_indexer(scraped_ids)
+    # get_indexer returns -1 for films that are not stored, which picks the placeholder appended to stored_ratings
+    previous_ratings = np.append(stored_ratings, 0)[positions]
+    is_added = is_first & (positions == -1)
+    is_rerated = is_first & (positions != -1) & (scraped_ratings != previous_ratings)
+    is_removed = ~stored_ids.isin(scraped_ids)
+
+    return ChangeReport(added=pd.DataFrame({"id": scraped_ids[is_added], "rating": scraped_ratings[is_added]}),
+                        removed=pd.DataFrame({"id": stored_ids[is_removed], "rating": stored_ratings[is_removed]}),
+                        rerated=pd.DataFrame({"id": scraped_ids[is_rerated],
+                                              "previous_rating": previous_ratings[is_rerated],
+                                              "rating": scraped_ratings[is_rerated]}),
+                        new_urls=get_urls_at(urls=ids_ratings_urls_dict["urls"], mask=is_added))
+
+
+def get_change_log(change_report: ChangeReport, final_df: pd.DataFrame, changed_at: pd.Timestamp) -> pd.DataFrame:
+    """Turns a change report into change log entries stamped with the time of the run. Added and re-rated films
+    whose film page could not be scraped are left out, since they are not in the final dataframe either"""
+    added_df = change_report.added.assign(change="added", previous_rating=None)
+    removed_df = change_report.removed.rename(columns={"rating": "previous_rating"}).assign(change="removed",
+                                                                                            rating=None)
+    rerated_df = change_report.rerated.assign(change="rerated")
+    changes = [df for df in (added_df, removed_df, rerated_df) if not df.empty]
+    change_log = pd.concat(changes, ignore_index=True) if changes else \
+        pd.DataFrame(columns=["change", "id", "previous_rating", "rating"])
+    change_log = change_log[(change_log["change"] == "removed") | change_log["id"].isin(final_df["id"])]
+    change_log.insert(0, "changed_at", changed_at)
+    return change_log[["changed_at", "change", "id", "previous_rating", "rating"]]\
+        .astype({"id": "int64", "previous_rating": "Int64", "rating": "Int64"}).reset_index(drop=True)
 
 
 def get_ratings_dataframe(ids_ratings_urls_dict: dict) -> pd.DataFrame:
-    """Creates a dataframe out of the dictionary storing the IDs, rating and urls, renames two columns and drops the
-    url key/column"""
-    return pd.DataFrame(ids_ratings_urls_dict).rename(columns={'ids': 'id', 'ratings': 'rating'}).drop(columns='urls')
+    """Creates a dataframe out of the IDs and ratings of the dictionary, leaving out the URLs. The int64 arrays
+    scraped from the playlist pages become its columns without being copied"""
+    return pd.DataFrame({"id": ids_ratings_urls_dict["ids"], "rating": ids_ratings_urls_dict["ratings"]}, copy=False)
 
 
 def get_film_data_dataframe(additional_film_data: dict) -> pd.DataFrame:
-    """Stores the additional film data dictionary in a dataframe and renames some of its keys/columns"""
-    df = pd.DataFrame(additional_film_data)
+    """Stores the additional film data dictionary in a dataframe and renames some of its keys/columns. The ID and
+    year arrays become its columns without being copied"""
+    df = pd.DataFrame(additional_film_data, copy=False)
     return df.rename(columns={'film_ids': 'id', 'titles': 'title', 'years': 'year', 'directors': 'director'})
 
 
@@ -1,6 +1,21 @@
+import io
 import sqlalchemy
 import pandas as pd
-from utils.time_utils import time_it
+from utils.data_wrangling_utils import get_typed_dataframe
+from utils.metrics_utils import timed, metrics
+
+COLUMN_TYPES = {"id": sqlalchemy.BigInteger(),
+                "rating": sqlalchemy.SmallInteger(),
+                "title": sqlalchemy.Text(),
+                "year": sqlalchemy.Integer(),
+                "director": sqlalchemy.Text(),
+                "actors": sqlalchemy.Text(),
+                "countries": sqlalchemy.Text()}
+COLUMN_DEFINITIONS = "id BIGINT PRIMARY KEY, rating SMALLINT, title TEXT, year INTEGER, director TEXT, actors TEXT, " \
+                     "countries TEXT"
+NAME_SEPARATOR = ";"
+CHANGE_LOG_DEFINITIONS = "changed_at TIMESTAMPTZ NOT NULL, change TEXT NOT NULL, id BIGINT NOT NULL, " \
+                         "previous_rating SMALLINT, rating SMALLINT"
 
 
 def get_engine(config: dict) -> sqlalchemy.engine:
@@ -13,6 +28,234 @@ def get_table_name(playlist_metadata: dict) -> str:
     return playlist_metadata["user"] + "_" + playlist_metadata["title"]
 
 
-@time_it
+@timed("write_to_database")
 def write_to_database(engine: sqlalchemy.engine, df: pd.DataFrame, table_name: str):
-    df.to_sql(name=table_name, con=engine, if_exists='replace', index=False)
+    df.to_sql(name=table_name, con=engine, if_exists='replace', index=False, dtype=COLUMN_TYPES)
+    metrics.increment("rows_written_total", len(df), target="postgres", dataset="playlist")
+
+
+def quote_identifier(identifier: str) -> str:
+    """Double-quotes a table or index name for Postgres"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def create_playlist_table(connection: sqlalchemy.engine.Connection, table_name: str) -> None:
+    """Creates the playlist table with typed columns and a primary key on id if it does not exist. Tables created by
+    earlier runs with if_exists='replace' have no key, so a unique index on id is added to them"""
+    table = quote_identifier(table_name)
+    connection.execute(sqlalchemy.text(f"CREATE TABLE IF NOT EXISTS {table} ({COLUMN_DEFINITIONS})"))
+    has_unique_id = connection.execute(sqlalchemy.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_index i JOIN pg_attribute a "
+        "ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+        "WHERE i.indrelid = to_regclass(:table) AND i.indisunique AND i.indnatts = 1 AND a.attname = 'id')"),
+        {"table": table}).scalar()
+    if not has_unique_id:
+        connection.execute(sqlalchemy.text(f"CREATE UNIQUE INDEX {quote_identifier(table_name + '_id_key')} "
+                                           f"ON {table} (id)"))
+
+
+def copy_dataframe(connection: sqlalchemy.engine.Connection, df: pd.DataFrame, table_name: str) -> None:
+    """Bulk-loads a dataframe into a table with COPY, using either psycopg2 or psycopg 3"""
+    csv_buffer = io.StringIO()
+    df.to_csv(csv_buffer, index=False, header=False)
+    columns = ", ".join(quote_identifier(column) for column in df.columns)
+    statement = f"COPY {quote_identifier(table_name)} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+    cursor = connection.connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            csv_buffer.seek(0)
+            cursor.copy_expert(statement, csv_buffer)
+        else:
+            with cursor.copy(statement) as copy:
+                copy.write(csv_buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+def create_staging_table(connection: sqlalchemy.engine.Connection, df: pd.DataFrame, staging_table: str) -> None:
+    """Copies the playlist dataframe into a temporary table dropped at the end of the transaction"""
+    connection.execute(sqlalchemy.text(f"CREATE TEMPORARY TABLE {quote_identifier(staging_table)} "
+                                       f"({COLUMN_DEFINITIONS}) ON COMMIT DROP"))
+    copy_dataframe(connection=connection, df=get_typed_dataframe(df[list(COLUMN_TYPES)]), table_name=staging_table)
+
+
+def append_change_log(connection: sqlalchemy.engine.Connection, change_log: pd.DataFrame, table_name: str) -> None:
+    """Appends change log entries to a playlist's change log table, creating it if it does not exist"""
+    table = quote_identifier(table_name)
+    connection.execute(sqlalchemy.text(f"CREATE TABLE IF NOT EXISTS {table} ({CHANGE_LOG_DEFINITIONS})"))
+    connection.execute(sqlalchemy.text(f"CREATE INDEX IF NOT EXISTS {quote_identifier(table_name + '_changed_at_idx')} "
+                                       f"ON {table} (changed_at)"))
+    if not change_log.empty:
+        copy_dataframe(connection=connection, df=change_log, table_name=table_name)
+
+
+@timed("write_change_log_to_database")
+def write_change_log_to_database(engine: sqlalchemy.engine, change_log: pd.DataFrame, table_name: str):
+    """Appends the change log entries of a run to the {user}_{title}_changes table"""
+    with engine.begin() as connection:
+        append_change_log(connection=connection, change_log=change_log, table_name=table_name)
+    metrics.increment("rows_written_total", len(change_log), target="postgres", dataset="change_log")
+
+
+@timed("upsert_to_database")
+def upsert_to_database(engine: sqlalchemy.engine, df: pd.DataFrame, table_name: str) -> dict:
+    """Synchronises the playlist table with the dataframe in a single transaction: the dataframe is copied into a
+    staging table, then only new and changed rows are upserted on id and rows no longer in the playlist are deleted.
+    Returns the number of upserted and deleted rows"""
+    table = quote_identifier(table_name)
+    staging_table = table_name + "_staging"
+    columns = list(COLUMN_TYPES)
+    column_list = ", ".join(columns)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column != "id")
+    current_values = ", ".join(f"{table}.{column}" for column in columns if column != "id")
+    new_values = ", ".join(f"EXCLUDED.{column}" for column in columns if column != "id")
+
+    with engine.begin() as connection:
+        create_playlist_table(connection=connection, table_name=table_name)
+        create_staging_table(connection=connection, df=df, staging_table=staging_table)
+        upserted = connection.execute(sqlalchemy.text(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {quote_identifier(staging_table)} "
+            f"ON CONFLICT (id) DO UPDATE SET {updates} "
+            f"WHERE ({current_values}) IS DISTINCT FROM ({new_values})")).rowcount
+        deleted = connection.execute(sqlalchemy.text(
+            f"DELETE FROM {table} WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {quote_identifier(staging_table)} s WHERE s.id = {table}.id)")).rowcount
+
+    metrics.increment("rows_written_total", upserted + deleted, target="postgres", dataset="playlist")
+    return {"upserted": upserted, "deleted": deleted}
+
+
+NORMALIZED_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS films (id BIGINT PRIMARY KEY, title TEXT, year INTEGER)",
+    "CREATE INDEX IF NOT EXISTS films_year_idx ON films (year)",
+    "CREATE TABLE IF NOT EXISTS people (id SERIAL PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS countries (id SERIAL PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS film_directors ("
+    "film_id BIGINT NOT NULL REFERENCES films (id) ON DELETE CASCADE, "
+    "person_id INTEGER NOT NULL REFERENCES people (id), "
+    "PRIMARY KEY (film_id, person_id))",
+    "CREATE INDEX IF NOT EXISTS film_directors_person_id_idx ON film_directors (person_id)",
+    "CREATE TABLE IF NOT EXISTS film_actors ("
+    "film_id BIGINT NOT NULL REFERENCES films (id) ON DELETE CASCADE, "
+    "person_id INTEGER NOT NULL REFERENCES people (id), "
+    "billing SMALLINT NOT NULL, "
+    "PRIMARY KEY (film_id, person_id))",
+    "CREATE INDEX IF NOT EXISTS film_actors_person_id_idx ON film_actors (person_id)",
+    "CREATE TABLE IF NOT EXISTS film_countries ("
+    "film_id BIGINT NOT NULL REFERENCES films (id) ON DELETE CASCADE, "
+    "country_id INTEGER NOT NULL REFERENCES countries (id), "
+    "PRIMARY KEY (film_id, country_id))",
+    "CREATE INDEX IF NOT EXISTS film_countries_country_id_idx ON film_countries (country_id)",
+    "CREATE TABLE IF NOT EXISTS playlists ("
+    "id SERIAL PRIMARY KEY, user_name TEXT NOT NULL, title TEXT NOT NULL, UNIQUE (user_name, title))",
+    "CREATE TABLE IF NOT EXISTS ratings ("
+    "playlist_id INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE, "
+    "film_id BIGINT NOT NULL REFERENCES films (id), "
+    "rating SMALLINT, "
+    "PRIMARY KEY (playlist_id, film_id))",
+    "CREATE INDEX IF NOT EXISTS ratings_film_id_idx ON ratings (film_id)",
+    "CREATE TABLE IF NOT EXISTS rating_changes ("
+    "playlist_id INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE, "
+    "changed_at TIMESTAMPTZ NOT NULL, "
+    "change TEXT NOT NULL, "
+    "film_id BIGINT NOT NULL, "
+    "previous_rating SMALLINT, "
+    "rating SMALLINT)",
+    "CREATE INDEX IF NOT EXISTS rating_changes_playlist_id_changed_at_idx ON rating_changes (playlist_id, changed_at)",
+)
+
+
+def create_normalized_schema(connection: sqlalchemy.engine.Connection) -> None:
+    """Creates the tables and indexes of the normalized schema shared by every playlist. Concurrent writers are
+    serialised on a transaction-level advisory lock so that only one of them creates the schema"""
+    connection.execute(sqlalchemy.text("SELECT pg_advisory_xact_lock(hashtext('letterboxd_normalized_schema'))"))
+    for statement in NORMALIZED_SCHEMA:
+        connection.execute(sqlalchemy.text(statement))
+
+
+def split_names_query(column: str, staging_table: str) -> str:
+    """Returns a query unnesting the semicolon-joined names of a staging table column into one (film_id, name,
+    position) row per name"""
+    return f"SELECT s.id AS film_id, btrim(n.name) AS name, n.position FROM {quote_identifier(staging_table)} s " \
+           f"CROSS JOIN LATERAL unnest(string_to_array(s.{column}, '{NAME_SEPARATOR}')) " \
+           f"WITH ORDINALITY AS n (name, position) WHERE btrim(n.name) <> ''"
+
+
+def write_film_links(connection: sqlalchemy.engine.Connection, staging_table: str, column: str, link_table: str,
+                     lookup_table: str, lookup_column: str, with_billing: bool = False) -> None:
+    """Synchronises the links between the staged films and the people or countries named in one of their columns,
+    only inserting the links that are new and deleting the ones that disappeared"""
+    names = split_names_query(column=column, staging_table=staging_table)
+    staged_links = quote_identifier(f"{link_table}_staging")
+    connection.execute(sqlalchemy.text(f"INSERT INTO {lookup_table} (name) SELECT DISTINCT name FROM ({names}) n "
+                                       "ORDER BY name ON CONFLICT (name) DO NOTHING"))
+    connection.execute(sqlalchemy.text(f"CREATE TEMPORARY TABLE {staged_links} ON COMMIT DROP AS "
+                                       f"SELECT n.film_id, l.id AS {lookup_column}, MIN(n.position) AS billing "
+                                       f"FROM ({names}) n JOIN {lookup_table} l ON l.name = n.name "
+                                       "GROUP BY n.film_id, l.id"))
+
+    if with_billing:
+        connection.execute(sqlalchemy.text(
+            f"INSERT INTO {link_table} (film_id, {lookup_column}, billing) "
+            f"SELECT film_id, {lookup_column}, billing FROM {staged_links} "
+            f"ON CONFLICT (film_id, {lookup_column}) DO UPDATE SET billing = EXCLUDED.billing "
+            f"WHERE {link_table}.billing IS DISTINCT FROM EXCLUDED.billing"))
+    else:
+        connection.execute(sqlalchemy.text(
+            f"INSERT INTO {link_table} (film_id, {lookup_column}) SELECT film_id, {lookup_column} FROM {staged_links} "
+            f"ON CONFLICT (film_id, {lookup_column}) DO NOTHING"))
+    connection.execute(sqlalchemy.text(
+        f"DELETE FROM {link_table} k USING {quote_identifier(staging_table)} staged WHERE k.film_id = staged.id "
+        f"AND NOT EXISTS (SELECT 1 FROM {staged_links} n "
+        f"WHERE n.film_id = k.film_id AND n.{lookup_column} = k.{lookup_column})"))
+    connection.execute(sqlalchemy.text(f"DROP TABLE {staged_links}"))
+
+
+@timed("write_to_normalized_database")
+def write_to_normalized_database(engine: sqlalchemy.engine,
+                                 df: pd.DataFrame,
+                                 playlist_metadata: dict,
+                                 change_log: pd.DataFrame = None) -> dict:
+    """Writes the playlist to the normalized schema in a single transaction: films, their directors, actors and
+    countries are upserted into tables shared by every playlist, the playlist's ratings are synchronised with the
+    dataframe and the change log entries, if any, are appended to rating_changes. Returns the number of ratings
+    upserted and deleted"""
+    staging_table = "playlist_staging"
+
+    with engine.begin() as connection:
+        create_normalized_schema(connection=connection)
+        create_staging_table(connection=connection, df=df, staging_table=staging_table)
+        staging = quote_identifier(staging_table)
+
+        connection.execute(sqlalchemy.text(
+            f"INSERT INTO films (id, title, year) SELECT id, title, year FROM {staging} "
+            "ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, year = EXCLUDED.year "
+            "WHERE (films.title, films.year) IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.year)"))
+        write_film_links(connection=connection, staging_table=staging_table, column="director",
+                         link_table="film_directors", lookup_table="people", lookup_column="person_id")
+        write_film_links(connection=connection, staging_table=staging_table, column="actors",
+                         link_table="film_actors", lookup_table="people", lookup_column="person_id",
+                         with_billing=True)
+        write_film_links(connection=connection, staging_table=staging_table, column="countries",
+                         link_table="film_countries", lookup_table="countries", lookup_column="country_id")
+
+        playlist_id = connection.execute(sqlalchemy.text(
+            "INSERT INTO playlists (user_name, title) VALUES (:user_name, :title) "
+            "ON CONFLICT (user_name, title) DO UPDATE SET title = EXCLUDED.title RETURNING id"),
+            {"user_name": playlist_metadata["user"], "title": playlist_metadata["title"]}).scalar()
+        upserted = connection.execute(sqlalchemy.text(
+            f"INSERT INTO ratings (playlist_id, film_id, rating) SELECT :playlist_id, id, rating FROM {staging} "
+            "ON CONFLICT (playlist_id, film_id) DO UPDATE SET rating = EXCLUDED.rating "
+            "WHERE ratings.rating IS DISTINCT FROM EXCLUDED.rating"), {"playlist_id": playlist_id}).rowcount
+        deleted = connection.execute(sqlalchemy.text(
+            f"DELETE FROM ratings r WHERE r.playlist_id = :playlist_id AND NOT EXISTS "
+            f"(SELECT 1 FROM {staging} s WHERE s.id = r.film_id)"), {"playlist_id": playlist_id}).rowcount
+        if change_log is not None and not change_log.empty:
+            copy_dataframe(connection=connection,
+                           df=change_log.rename(columns={"id": "film_id"}).assign(playlist_id=playlist_id),
+                           table_name="rating_changes")
+            metrics.increment("rows_written_total", len(change_log), target="postgres", dataset="change_log")
+
+    metrics.increment("rows_written_total", upserted + deleted, target="postgres", dataset="playlist")
+    return {"upserted": upserted, "deleted": deleted}
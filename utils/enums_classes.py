@@ -5,4 +5,25 @@ class ParallelTechnique(Enum):
     MULTIPROCESSING = "multiprocessing"
     MULTITHREADING = "multithreading"
     SYNCHRONOUS = "synchronous"
+    LIGHTWEIGHT = "lightweight"
+    AUTO = "auto"
 
+
+class StorageFormat(Enum):
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+class DatabaseWriteMode(Enum):
+    REPLACE = "replace"
+    UPSERT = "upsert"
+
+
+class MetricsFormat(Enum):
+    JSONL = "jsonl"
+    PROMETHEUS = "prometheus"
+
+
+class DatabaseSchema(Enum):
+    FLAT = "flat"
+    NORMALIZED = "normalized"
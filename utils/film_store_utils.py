@@ -0,0 +1,72 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass, field
+import numpy as np
+from utils.logging_utils import Logger
+
+info_log = Logger(name=__name__, level=logging.INFO).return_logger()
+
+
+def to_sql_value(value):
+    """Stores missing film data (np.nan) as NULL"""
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def from_sql_value(value):
+    """Turns NULLs back into the np.nan the scraping functions return for missing film data"""
+    return np.nan if value is None else value
+
+
+@dataclass
+class FilmStore:
+    """Local SQLite store of the data scraped from film pages, keyed by Letterboxd film ID and shared by every
+    playlist, so that each film page only ever needs to be scraped once"""
+    path: str
+    connection: sqlite3.Connection = field(default=None, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS films ("
+                                    "id INTEGER PRIMARY KEY, title TEXT, year INTEGER, director TEXT, actors TEXT, "
+                                    "countries TEXT, scraped_at REAL NOT NULL)")
+            self.connection.commit()
+
+    def get_records(self, film_ids: list[int]) -> list[tuple]:
+        """Returns the stored (id, title, year, director, cast, countries) records of the supplied films"""
+        records = []
+        with self.lock:
+            for start in range(0, len(film_ids), 500):
+                chunk = [int(film_id) for film_id in film_ids[start:start + 500]]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self.connection.execute("SELECT id, title, year, director, actors, countries FROM films "
+                                               f"WHERE id IN ({placeholders})", chunk).fetchall()
+                records.extend(tuple(from_sql_value(value) for value in row) for row in rows)
+        return records
+
+    def put_records(self, film_records: list[tuple]) -> None:
+        """Stores (id, title, year, director, cast, countries) records, replacing any previous version"""
+        now = time.time()
+        rows = [tuple(to_sql_value(value) for value in record) + (now,) for record in film_records]
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO films VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.connection.commit()
+
+    def close(self) -> None:
+        """Closes the underlying database"""
+        with self.lock:
+            self.connection.close()
+
+
+def get_film_store(path: str or None) -> FilmStore or None:
+    """Returns the film store saved at path, or None if no path was supplied"""
+    if path is None:
+        return None
+    return FilmStore(path=path)
@@ -1,58 +1,181 @@
-import bs4
-import requests
-import aiohttp
+from __future__ import annotations
 import asyncio
+import os
+import sys
+import logging
+import contextlib
+import functools
 import concurrent.futures
-from utils.time_utils import time_it
+from dataclasses import dataclass
+from typing import Any, Callable, TYPE_CHECKING
+from utils.metrics_utils import timed, metrics, extract_with_timing, observe_page_parse
+from utils.enums_classes import ParallelTechnique
+from utils.http_utils import FetchConfig, Fetcher, HttpClient, get_client_session, get_fetcher, fetch_with_retries
+from utils.cache_utils import ResponseCache, get_conditional_headers
+from utils.logging_utils import Logger
 
+if TYPE_CHECKING:
+    import bs4
 
-def parse_url_synchronously(url: str) -> str:
+info_log = Logger(name=__name__, level=logging.INFO).return_logger()
+
+PARSE_SECONDS_PER_BYTE = 1e-6
+WORKER_STARTUP_SECONDS = 0.05
+ESTIMATED_PAGE_SIZE = 100_000
+
+
+@dataclass
+class ParseStrategy:
+    parallel_technique: ParallelTechnique
+    n_workers: int
+
+
+def parse_url_synchronously(url: str, cache: ResponseCache = None, timeout: float = FetchConfig.timeout) -> str:
     """Parse a URL string into HTML code in a synchronous way"""
-    return requests.get(url).content
+    import requests
+    cached = cache.get(url) if cache is not None else None
+    if cached is not None and cache.is_fresh(cached):
+        metrics.increment("cache_hits_total", result="fresh")
+        return cached.body
+    r = requests.get(url, headers=get_conditional_headers(cached), timeout=timeout)
+    metrics.increment("http_responses_total", status=str(r.status_code))
+    if r.status_code == 304 and cached is not None:
+        metrics.increment("cache_hits_total", result="revalidated")
+        cache.revalidate(url)
+        return cached.body
+    if r.status_code == 200:
+        metrics.increment("pages_fetched_total")
+        metrics.increment("bytes_downloaded_total", len(r.content))
+        if cache is not None:
+            cache.put(url=url, body=r.text, etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
+    return r.text
 
 
 def get_soup_object_out_of_parsed_html(html_page: str) -> bs4.BeautifulSoup:
-    """Returns a BeautifulSoup object out of a parsed HTML page"""
+    """Returns a BeautifulSoup object out of a parsed HTML page. bs4 is only imported by the techniques building
+    BeautifulSoup objects"""
+    import bs4
     return bs4.BeautifulSoup(html_page, 'lxml')
 
 
-async def parse_url_asynchronously(session, url: str) -> list[str]:
+async def parse_url_asynchronously(fetcher: Fetcher, url: str) -> str or None:
     """Asynchronously gets the HTML code out of a URL"""
-    async with session.get(url) as r:
-        if r.status != 200:
-            print(f"{r.status} for {url}")
-        else:
-            return await r.text()
+    return await fetch_with_retries(fetcher=fetcher, url=url)
+
 
+async def fetch_all_urls(fetcher: Fetcher, urls: list[str]) -> list[str or None]:
+    """Downloads every URL with the supplied fetcher"""
+    tasks = [parse_url_asynchronously(fetcher, url) for url in urls]
+    return await asyncio.gather(*tasks)
 
-async def event_loop(urls: list[str]):
+
+async def event_loop(urls: list[str], fetch_config: FetchConfig, cache: ResponseCache = None):
     """Creates an event loop to parse a list of URLs as HTML code"""
-    async with aiohttp.ClientSession() as session:
-        tasks = [parse_url_asynchronously(session, url) for url in urls]
-        return await asyncio.gather(*tasks)
+    async with get_client_session(config=fetch_config) as session:
+        fetcher = get_fetcher(session=session, config=fetch_config, cache=cache)
+        return await fetch_all_urls(fetcher=fetcher, urls=urls)
 
 
 def set_windows_event_loop_policy() -> None:
-    """Sets the event loop policy for Windows systems"""
-    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    """Sets the selector event loop policy on Windows, where the default proactor loop does not suit aiohttp. The
+    policy only exists on Windows, so other systems are left alone"""
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
-@time_it
-def parse_all_urls_asynchronously(urls: list[str]) -> list[str]:
-    """Runs the event loop to get the HTML code for each url in the urls list"""
-    return asyncio.run(event_loop(urls))
+@timed("parse_all_urls_asynchronously")
+def parse_all_urls_asynchronously(urls: list[str],
+                                  fetch_config: FetchConfig = None,
+                                  cache: ResponseCache = None,
+                                  http_client: HttpClient = None) -> list[str]:
+    """Runs the event loop to get the HTML code for each url in the urls list. If an HTTP client is supplied its
+    shared session and limits are used instead of opening a new session"""
+    if http_client is not None:
+        return http_client.run(fetch_all_urls(fetcher=http_client.get_fetcher(cache=cache), urls=urls))
+    return asyncio.run(event_loop(urls, fetch_config or FetchConfig(), cache))
 
 
-@time_it
-def get_soup_objects_multiprocessing(html_pages: list[str]) -> list[bs4.BeautifulSoup]:
-    """Uses multiprocessing to get BeautifulSoup objects out of a list of HTML pages"""
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        soups = executor.map(get_soup_object_out_of_parsed_html, html_pages)
+def remove_missing_pages(html_pages: list[str or None]) -> list[str]:
+    """Drops the pages that could not be downloaded, logging how many were lost"""
+    downloaded_pages = [html_page for html_page in html_pages if html_page is not None]
+    if len(downloaded_pages) < len(html_pages):
+        info_log.warning(f"{len(html_pages) - len(downloaded_pages)} pages could not be downloaded and were skipped")
+    return downloaded_pages
+
+
+def get_process_pool(parallel_technique: ParallelTechnique) -> concurrent.futures.ProcessPoolExecutor or None:
+    """Returns the process pool shared by all stages of a multiprocessing run, or None for the other techniques. The
+    auto technique gets one too, whose workers are only started if a stage ends up being parsed in parallel"""
+    if parallel_technique in (ParallelTechnique.MULTIPROCESSING, ParallelTechnique.AUTO):
+        return concurrent.futures.ProcessPoolExecutor(max_workers=get_available_cpus())
+    return None
+
+
+def get_chunksize(n_pages: int, n_workers: int) -> int:
+    """Returns how many pages are sent to a worker process at once, so that each worker gets about four chunks"""
+    return max(1, n_pages // (n_workers * 4))
+
+
+def get_available_cpus() -> int:
+    """Returns how many CPUs the process may run on, which in a container can be fewer than the machine has"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_average_page_size(html_pages: list[str]) -> float:
+    """Returns the average length of the HTML pages, or 0 if there are none"""
+    return sum(len(html_page) for html_page in html_pages) / len(html_pages) if html_pages else 0.0
+
+
+def choose_parse_strategy(n_pages: int, average_page_size: float, n_cpus: int = None) -> ParseStrategy:
+    """Picks how to parse a batch of pages for the auto technique. Parsing with BeautifulSoup holds the GIL, so
+    threads never beat a single thread and the choice is between parsing synchronously and in worker processes.
+    The parse time is estimated from the bytes to parse, and n workers are worth it when the parse time divided by
+    n plus the start-up cost of n workers beats parsing synchronously. The chosen strategy is logged"""
+    n_cpus = n_cpus or get_available_cpus()
+    parse_seconds = n_pages * average_page_size * PARSE_SECONDS_PER_BYTE
+    n_workers = int(min(n_cpus, n_pages, (parse_seconds / WORKER_STARTUP_SECONDS) ** 0.5))
+    if n_workers >= 2 and parse_seconds / n_workers + n_workers * WORKER_STARTUP_SECONDS < parse_seconds:
+        strategy = ParseStrategy(parallel_technique=ParallelTechnique.MULTIPROCESSING, n_workers=n_workers)
+    else:
+        strategy = ParseStrategy(parallel_technique=ParallelTechnique.SYNCHRONOUS, n_workers=1)
+    info_log.info(f"Parsing {n_pages} pages of {average_page_size / 1024:.0f} KiB on average with {n_cpus} CPUs "
+                  f"(about {parse_seconds:.2f}s of parsing): chose {strategy.parallel_technique.value} with "
+                  f"{strategy.n_workers} workers")
+    return strategy
+
+
+def resolve_parse_strategy(parallel_technique: ParallelTechnique,
+                           n_pages: int,
+                           average_page_size: float = ESTIMATED_PAGE_SIZE) -> ParseStrategy:
+    """Returns the strategy to parse a batch of pages with: the one chosen for the batch under the auto technique,
+    otherwise the requested technique with its usual number of parsers. The streaming pipeline resolves the
+    strategy before any page is downloaded, so it relies on the estimated page size"""
+    if parallel_technique == ParallelTechnique.AUTO:
+        return choose_parse_strategy(n_pages=n_pages, average_page_size=average_page_size)
+    return ParseStrategy(parallel_technique=parallel_technique,
+                         n_workers=get_number_of_parsers(parallel_technique=parallel_technique))
 
-    return list(soups)
 
+@timed("extract_records_multiprocessing")
+def extract_records_multiprocessing(html_pages: list[str],
+                                    extract_func: Callable[[str], Any],
+                                    executor: concurrent.futures.ProcessPoolExecutor,
+                                    n_workers: int = None) -> list[Any]:
+    """Parses the HTML pages and extracts their records in worker processes, so that only small flat tuples are
+    pickled back instead of whole BeautifulSoup objects"""
+    n_workers = n_workers or get_number_of_parsers(parallel_technique=ParallelTechnique.MULTIPROCESSING)
+    chunksize = get_chunksize(n_pages=len(html_pages), n_workers=n_workers)
+    records = []
+    for duration, record in executor.map(functools.partial(extract_with_timing, extract_func), html_pages,
+                                         chunksize=chunksize):
+        observe_page_parse(extract_func, duration)
+        records.append(record)
+    return records
 
-@time_it
+
+@timed("get_soup_objects_multithreading")
 def get_soup_objects_multithreading(html_pages: list[str]) -> list[bs4.BeautifulSoup]:
     """Uses multithreading to get BeautifulSoup objects out of a list of HTML pages"""
     with concurrent.futures.ThreadPoolExecutor() as executor:
@@ -61,7 +184,160 @@ def get_soup_objects_multithreading(html_pages: list[str]) -> list[bs4.Beautiful
     return list(soups)
 
 
-@time_it
+@timed("get_soup_objects_synchronously")
 def get_soup_objects_synchronously(html_pages: list[str]) -> list[bs4.BeautifulSoup]:
     """Synchronously gets BeautifulSoup objects out of a list of HTML pages"""
     return [get_soup_object_out_of_parsed_html(html_page=html_page) for html_page in html_pages]
+
+
+def get_number_of_parsers(parallel_technique: ParallelTechnique) -> int:
+    """Returns how many pages the streaming pipeline parses at the same time"""
+    if parallel_technique in (ParallelTechnique.SYNCHRONOUS, ParallelTechnique.LIGHTWEIGHT):
+        return 1
+    return get_available_cpus()
+
+
+def get_parsing_executor(parallel_technique: ParallelTechnique, n_parsers: int) -> concurrent.futures.Executor:
+    """Returns the executor used by the streaming pipeline to turn HTML pages into records"""
+    if parallel_technique == ParallelTechnique.MULTIPROCESSING:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=n_parsers)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=n_parsers)
+
+
+async def fetch_worker(fetcher: Fetcher, urls_queue: asyncio.Queue, html_queue: asyncio.Queue) -> None:
+    """Downloads URLs from the urls queue and puts their HTML code on the bounded html queue"""
+    while True:
+        item = await urls_queue.get()
+        if item is None:
+            return
+        index, url = item
+        html_page = await parse_url_asynchronously(fetcher, url)
+        await html_queue.put((index, html_page))
+
+
+async def parse_worker(html_queue: asyncio.Queue,
+                       extract_func: Callable[[str], Any],
+                       executor: concurrent.futures.Executor,
+                       records: list) -> None:
+    """Takes HTML pages off the html queue and extracts their records in the executor"""
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await html_queue.get()
+        if item is None:
+            return
+        index, html_page = item
+        if html_page is not None:
+            duration, records[index] = await loop.run_in_executor(executor, extract_with_timing, extract_func,
+                                                                  html_page)
+            observe_page_parse(extract_func, duration)
+
+
+async def feed_parse_workers(html_queue: asyncio.Queue,
+                             prefetched: dict[int, str],
+                             fetchers: list[asyncio.Task],
+                             n_parsers: int) -> None:
+    """Puts the pages already downloaded on the html queue, waits for the fetchers to download the others and then
+    tells every parser to stop"""
+    for item in prefetched.items():
+        await html_queue.put(item)
+    await asyncio.gather(*fetchers)
+    for _ in range(n_parsers):
+        await html_queue.put(None)
+
+
+async def stream_urls(fetcher: Fetcher,
+                      urls: list[str],
+                      extract_func: Callable[[str], Any],
+                      executor: concurrent.futures.Executor,
+                      queue_size: int,
+                      n_parsers: int,
+                      prefetched: dict[int, str] = None) -> list[Any]:
+    """Streams every URL through fetching, parsing and extraction, with a bounded queue between the stages so that
+    only queue_size HTML pages are held in memory at any time. Pages already downloaded, keyed by their index in
+    urls, go straight to the parsers. If a fetcher or a parser raises, every other task is cancelled and the
+    exception is raised, rather than leaving the fetchers blocked on a queue nobody drains"""
+    prefetched = prefetched or {}
+    urls_queue = asyncio.Queue()
+    html_queue = asyncio.Queue(maxsize=queue_size)
+    records = [None] * len(urls)
+
+    for index, url in enumerate(urls):
+        if index not in prefetched:
+            urls_queue.put_nowait((index, url))
+
+    n_fetchers = max(1, min(fetcher.config.max_in_flight, urls_queue.qsize()))
+    for _ in range(n_fetchers):
+        urls_queue.put_nowait(None)
+
+    fetchers = [asyncio.create_task(fetch_worker(fetcher, urls_queue, html_queue)) for _ in range(n_fetchers)]
+    parsers = [asyncio.create_task(parse_worker(html_queue, extract_func, executor, records))
+               for _ in range(n_parsers)]
+    feeder = asyncio.create_task(feed_parse_workers(html_queue, prefetched, fetchers, n_parsers))
+    try:
+        done, _pending = await asyncio.wait([feeder] + parsers, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        for task in fetchers + parsers + [feeder]:
+            task.cancel()
+
+    return records
+
+
+async def streaming_event_loop(urls: list[str],
+                               extract_func: Callable[[str], Any],
+                               executor: concurrent.futures.Executor,
+                               queue_size: int,
+                               n_parsers: int,
+                               fetch_config: FetchConfig,
+                               cache: ResponseCache = None,
+                               prefetched: dict[int, str] = None) -> list[Any]:
+    """Opens a session and streams every URL through fetching, parsing and extraction"""
+    async with get_client_session(config=fetch_config) as session:
+        fetcher = get_fetcher(session=session, config=fetch_config, cache=cache)
+        return await stream_urls(fetcher=fetcher,
+                                 urls=urls,
+                                 extract_func=extract_func,
+                                 executor=executor,
+                                 queue_size=queue_size,
+                                 n_parsers=n_parsers,
+                                 prefetched=prefetched)
+
+
+@timed("stream_all_urls")
+def stream_all_urls(urls: list[str],
+                    extract_func: Callable[[str], Any],
+                    parallel_technique: ParallelTechnique,
+                    queue_size: int,
+                    fetch_config: FetchConfig = None,
+                    cache: ResponseCache = None,
+                    executor: concurrent.futures.Executor = None,
+                    http_client: HttpClient = None,
+                    n_parsers: int = None,
+                    prefetched: dict[int, str] = None) -> list[Any]:
+    """Fetches, parses and extracts the records of each URL as soon as its page arrives, returning one record per
+    URL in the same order as the urls list (None for pages that could not be downloaded). An existing executor and
+    HTTP client can be supplied to reuse their workers and connections across calls, and pages already downloaded
+    can be supplied by their index in urls so that they are not fetched again"""
+    n_parsers = n_parsers or get_number_of_parsers(parallel_technique=parallel_technique)
+    if executor is None:
+        executor_context = get_parsing_executor(parallel_technique=parallel_technique, n_parsers=n_parsers)
+    else:
+        executor_context = contextlib.nullcontext(executor)
+    with executor_context as executor:
+        if http_client is not None:
+            return http_client.run(stream_urls(fetcher=http_client.get_fetcher(cache=cache),
+                                               urls=urls,
+                                               extract_func=extract_func,
+                                               executor=executor,
+                                               queue_size=queue_size,
+                                               n_parsers=n_parsers,
+                                               prefetched=prefetched))
+        return asyncio.run(streaming_event_loop(urls=urls,
+                                                extract_func=extract_func,
+                                                executor=executor,
+                                                queue_size=queue_size,
+                                                n_parsers=n_parsers,
+                                                fetch_config=fetch_config or FetchConfig(),
+                                                cache=cache,
+                                                prefetched=prefetched))
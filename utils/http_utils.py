@@ -0,0 +1,207 @@
+from __future__ import annotations
+import time
+import random
+import asyncio
+import logging
+import threading
+import dataclasses
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+from utils.cache_utils import ResponseCache, get_conditional_headers
+from utils.metrics_utils import metrics
+from utils.logging_utils import Logger
+
+if TYPE_CHECKING:
+    import aiohttp
+
+info_log = Logger(name=__name__, level=logging.INFO).return_logger()
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class FetchError(Exception):
+    """Raised when a URL could not be downloaded after all retries"""
+
+
+@dataclass
+class FetchConfig:
+    max_in_flight: int = 32
+    rate_limit: float = 10.0
+    burst: int = 10
+    max_retries: int = 5
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    timeout: float = 30.0
+    pool_size: int = 100
+    pool_size_per_host: int = 0
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self) -> None:
+        """Adds the tokens accumulated since the last refill"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        """Waits until a token is available and takes it"""
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            self.refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+
+
+@dataclass
+class HostRateLimiter:
+    rate: float
+    capacity: int
+    buckets: dict = field(default_factory=dict)
+
+    async def acquire(self, url: str) -> None:
+        """Waits for a token from the bucket of the URL's host"""
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(rate=self.rate, capacity=self.capacity)
+        await self.buckets[host].acquire()
+
+
+@dataclass
+class Fetcher:
+    session: aiohttp.ClientSession
+    config: FetchConfig
+    semaphore: asyncio.Semaphore
+    rate_limiter: HostRateLimiter
+    cache: ResponseCache or None = None
+
+
+def get_client_session(config: FetchConfig) -> aiohttp.ClientSession:
+    """Returns an aiohttp session with a tuned connection pool and timeouts. aiohttp is only imported here and by the
+    fetches, so that parsing the command line never loads it"""
+    import aiohttp
+    connector = aiohttp.TCPConnector(limit=config.pool_size,
+                                     limit_per_host=config.pool_size_per_host,
+                                     ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=config.timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def get_fetcher(session: aiohttp.ClientSession, config: FetchConfig, cache: ResponseCache = None) -> Fetcher:
+    """Returns a fetcher bounding the requests in flight and rate limiting each host. Must be called from inside
+    the event loop the session runs on"""
+    return Fetcher(session=session,
+                   config=config,
+                   semaphore=asyncio.Semaphore(config.max_in_flight),
+                   rate_limiter=HostRateLimiter(rate=config.rate_limit, capacity=config.burst),
+                   cache=cache)
+
+
+class HttpClient:
+    """Runs a single aiohttp session on a background event loop, so that every playlist scraped by the process shares
+    the same connection pool, in-flight limit and per-host rate limits"""
+
+    def __init__(self, config: FetchConfig):
+        self.config = config
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="http-client", daemon=True)
+        self.thread.start()
+        self.fetcher = self.run(self.open())
+
+    async def open(self) -> Fetcher:
+        """Creates the session and the fetcher on the background event loop"""
+        return get_fetcher(session=get_client_session(config=self.config), config=self.config)
+
+    def run(self, coroutine):
+        """Runs a coroutine on the background event loop and waits for its result. Safe to call from any thread"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get_fetcher(self, cache: ResponseCache = None) -> Fetcher:
+        """Returns the shared fetcher reading from and writing to the supplied cache"""
+        return dataclasses.replace(self.fetcher, cache=cache)
+
+    def close(self) -> None:
+        """Closes the session and stops the background event loop"""
+        self.run(self.fetcher.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def get_backoff_delay(attempt: int, config: FetchConfig, retry_after: str or None = None) -> float:
+    """Returns how long to wait before the next attempt: the server's Retry-After if it sent one, otherwise an
+    exponential backoff with full jitter"""
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), config.backoff_max)
+        except ValueError:
+            pass
+    return random.uniform(0, min(config.backoff_max, config.backoff_base * 2 ** attempt))
+
+
+async def fetch_with_retries(fetcher: Fetcher, url: str) -> str or None:
+    """Downloads a URL, retrying on 429, 5xx and connection errors. Returns None for any other non-200 status and
+    raises a FetchError once the retries are exhausted. Fresh cached pages are served without a request and stale
+    ones are revalidated with a conditional GET. Cache writes, which compress the page and commit, run in a thread
+    so that they never stall the other fetches of the event loop"""
+    import aiohttp
+    config = fetcher.config
+    cached = fetcher.cache.get(url) if fetcher.cache is not None else None
+    if cached is not None and fetcher.cache.is_fresh(cached):
+        metrics.increment("cache_hits_total", result="fresh")
+        return cached.body
+    headers = get_conditional_headers(cached)
+
+    for attempt in range(config.max_retries + 1):
+        await fetcher.rate_limiter.acquire(url)
+        retry_after = None
+        try:
+            async with fetcher.semaphore:
+                start = time.perf_counter()
+                async with fetcher.session.get(url, headers=headers) as r:
+                    metrics.increment("http_responses_total", status=str(r.status))
+                    if r.status == 200:
+                        raw_body = await r.read()
+                        body = raw_body.decode(r.get_encoding())
+                        metrics.observe("fetch_seconds", time.perf_counter() - start)
+                        metrics.increment("pages_fetched_total")
+                        metrics.increment("bytes_downloaded_total", len(raw_body))
+                        if fetcher.cache is not None:
+                            await asyncio.to_thread(fetcher.cache.put,
+                                                    url=url,
+                                                    body=body,
+                                                    etag=r.headers.get("ETag"),
+                                                    last_modified=r.headers.get("Last-Modified"))
+                        return body
+                    if r.status == 304 and cached is not None:
+                        metrics.increment("cache_hits_total", result="revalidated")
+                        await asyncio.to_thread(fetcher.cache.revalidate, url)
+                        return cached.body
+                    if r.status not in RETRYABLE_STATUSES:
+                        info_log.warning(f"{r.status} for {url}, skipping it")
+                        return None
+                    retry_after = r.headers.get("Retry-After")
+                    reason = f"status {r.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            reason = repr(e)
+
+        if attempt == config.max_retries:
+            metrics.increment("fetch_failures_total")
+            raise FetchError(f"Could not download {url} after {config.max_retries + 1} attempts ({reason})")
+
+        delay = get_backoff_delay(attempt=attempt, config=config, retry_after=retry_after)
+        metrics.increment("fetch_retries_total")
+        info_log.warning(f"Retrying {url} in {delay:.2f}s after {reason}")
+        await asyncio.sleep(delay)
@@ -0,0 +1,70 @@
+import time
+import pandas as pd
+from utils.string_utils import get_all_capturing_groups, get_sorted_playlist_url
+from utils.columnar_utils import PlaylistColumns
+
+LAST_FULL_REFRESH_KEY = "last-full-refresh"
+
+
+def get_default_incremental_sort(metadata: dict) -> str:
+    """Returns the sort order that lists the most recently changed films of a playlist first: by rating date for
+    ratings playlists and by date added for lists"""
+    return "rated-date" if metadata["title"] == "ratings" else "added"
+
+
+def get_newest_first_page_url(metadata: dict, sort: str, page_number: int) -> str:
+    """Returns the URL of a page of the playlist sorted newest first"""
+    groups = get_all_capturing_groups(url=metadata["url"])
+    return get_sorted_playlist_url(groups=groups, sort=sort) + f"page/{page_number}/"
+
+
+def is_full_refresh_due(object_metadata: dict or None, full_refresh_days: float) -> bool:
+    """Checks whether the stored dataset is older than the full refresh schedule allows, or was never fully
+    refreshed at all"""
+    if not object_metadata or LAST_FULL_REFRESH_KEY not in object_metadata:
+        return True
+    return time.time() - float(object_metadata[LAST_FULL_REFRESH_KEY]) >= full_refresh_days * 86400
+
+
+def get_full_refresh_metadata(object_metadata: dict or None, full_refresh: bool) -> dict:
+    """Returns the S3 metadata recording when the dataset was last fully refreshed"""
+    if full_refresh or not object_metadata or LAST_FULL_REFRESH_KEY not in object_metadata:
+        return {LAST_FULL_REFRESH_KEY: str(int(time.time()))}
+    return {LAST_FULL_REFRESH_KEY: object_metadata[LAST_FULL_REFRESH_KEY]}
+
+
+def get_stored_ratings(current_df: pd.DataFrame) -> set[tuple[int, int]]:
+    """Returns the (film ID, rating) pairs of the stored dataset"""
+    return set(zip(current_df["id"].astype(int), current_df["rating"].astype(int)))
+
+
+def page_is_unchanged(page_record: tuple[list[int], list[int], list[str]],
+                      stored_ratings: set[tuple[int, int]]) -> bool:
+    """Checks whether every film on a playlist page is already stored with the same rating"""
+    ids, ratings, _urls = page_record
+    return all((film_id, rating) in stored_ratings for film_id, rating in zip(ids, ratings))
+
+
+def has_removed_films(first_page_size: int, number_of_pages: int, n_merged: int) -> bool:
+    """Checks whether the merged records hold more films than the playlist can, which means that films were removed
+    from it. The first page is full whenever there are others, so the number of pages bounds how many films the
+    playlist has. Removals that leave the number of pages unchanged go unnoticed until the next full refresh"""
+    if number_of_pages == 1:
+        return n_merged != first_page_size
+    return n_merged > number_of_pages * first_page_size
+
+
+def merge_incremental_records(page_records: list[tuple[list[int], list[int], list[str]]],
+                              current_df: pd.DataFrame) -> dict:
+    """Combines the IDs, ratings and URLs scraped from the newest pages with the ratings of the stored films that
+    were not on those pages. Stored films have no URL since their film pages never need to be scraped again"""
+    scraped_ids = [film_id for page_ids, _page_ratings, _page_slugs in page_records for film_id in page_ids]
+    stored_df = current_df[~current_df["id"].isin(set(scraped_ids))]
+
+    columns = PlaylistColumns.with_capacity(len(scraped_ids) + len(stored_df))
+    for page_ids, page_ratings, page_slugs in page_records:
+        columns.append_page(ids=page_ids, ratings=page_ratings, slugs=page_slugs)
+    columns.append_page(ids=stored_df["id"].to_numpy(dtype="int64"),
+                        ratings=stored_df["rating"].to_numpy(dtype="int64"),
+                        slugs=[None] * len(stored_df))
+    return columns.to_dict()
@@ -1,42 +1,39 @@
+from __future__ import annotations
 import re
-import bs4
-import itertools
-from collections import defaultdict
-from typing import Any
+from typing import Any, TYPE_CHECKING
 from dataclasses import dataclass
+from functools import cached_property
 import numpy as np
 import json
 import logging
-from utils.generic_scraping_functions import parse_url_synchronously, get_soup_object_out_of_parsed_html
-from utils.time_utils import time_it
+from utils.generic_scraping_functions import get_soup_object_out_of_parsed_html
+from utils.metrics_utils import timed
+from utils.columnar_utils import PlaylistColumns, FilmColumns
 from utils.logging_utils import Logger
 
+if TYPE_CHECKING:
+    import bs4
+
 info_log = Logger(name=__name__, level=logging.INFO).return_logger()
 
+PAGINATE_PAGE_PATTERN = re.compile(r'<li class="paginate-page[^"]*">\s*(?:<a[^>]*>|<span>)?\s*(\d+)\s*<')
 
-def get_number_of_pages(url: str) -> int:
-    """Returns the total number of pages in a playlist by scraping it from the first page.
-    Later, we're going to loop over all pages in the playlist. To do so we need to create a URL for
-    each page in the playlist"""
 
-    html = parse_url_synchronously(url=url)
-    soup = get_soup_object_out_of_parsed_html(html_page=html)
-    try:
-        last_li = soup.find_all("li", class_="paginate-page")[-1]
-        return int(last_li.text)
-    except IndexError:
-        return 1
+def get_number_of_pages(html_page: str) -> int:
+    """Returns the total number of pages in a playlist out of the pagination of its first page. The page numbers are
+    read with a regular expression, so no soup has to be built for the page"""
+    page_numbers = PAGINATE_PAGE_PATTERN.findall(html_page)
+    return max((int(page_number) for page_number in page_numbers), default=1)
 
 
-def get_url_for_each_page(metadata: dict) -> list[str]:
-    """Returns the URL for all pages in the playlist"""
-    url_with_page_number = metadata["url"] + "/page/{}/"
-    return [url_with_page_number.format(i) for i in range(1, metadata["number_of_pages"] + 1)]
+def get_page_url(metadata: dict, page_number: int) -> str:
+    """Returns the URL of a single page of the playlist"""
+    return metadata["url"] + f"/page/{page_number}/"
 
 
-def unnest_list(lst: list[list[Any]]) -> list[Any]:
-    """Unlists a nested list"""
-    return list(itertools.chain(*lst))
+def get_url_for_each_page(metadata: dict) -> list[str]:
+    """Returns the URL for all pages in the playlist"""
+    return [get_page_url(metadata=metadata, page_number=i) for i in range(1, metadata["number_of_pages"] + 1)]
 
 
 def get_ids(soup: bs4.BeautifulSoup) -> list[int]:
@@ -55,115 +52,146 @@ def get_ratings(soup: bs4.BeautifulSoup) -> list[int]:
         return [int(re.findall(string=span, pattern=r"\d+")[0]) for span in spans]
 
 
-def get_film_urls(soup: bs4.BeautifulSoup) -> list[str]:
-    """Scrapes all film URLs from a playlist page"""
+def get_film_slugs(soup: bs4.BeautifulSoup) -> list[str]:
+    """Scrapes all film slugs from a playlist page, from which the film URLs are built when needed"""
     films = soup.find_all("div", class_="really-lazy-load")
-    return ["https://letterboxd.com" + film.get("data-film-slug") for film in films]
+    return [film.get("data-film-slug") for film in films]
+
+
+def extract_ids_ratings_and_urls(html_page: str) -> tuple[list[int], list[int], list[str]]:
+    """Parses a single playlist page and scrapes its film IDs, ratings and slugs"""
+    soup = get_soup_object_out_of_parsed_html(html_page=html_page)
+    return get_ids(soup), get_ratings(soup), get_film_slugs(soup)
 
 
-@time_it
+def collect_ids_ratings_and_urls(page_records: list[tuple[list[int], list[int], list[str]]]) -> dict:
+    """Stores the IDs, ratings and slugs scraped from each playlist page in buffers preallocated for the whole
+    playlist, returning the IDs and ratings as int64 arrays and the URLs as a FilmUrls view of the slugs"""
+    page_records = [record for record in page_records if record is not None]
+    columns = PlaylistColumns.with_capacity(sum(len(record[0]) for record in page_records))
+    for ids, ratings, slugs in page_records:
+        columns.append_page(ids=ids, ratings=ratings, slugs=slugs)
+    return columns.to_dict()
+
+
+@timed("scrape_ids_ratings_and_urls")
 def scrape_ids_ratings_and_urls(pages_soups: list[bs4.BeautifulSoup]) -> dict:
     """Scrapes all film IDs, ratings and urls from a playlist and stores them in a dictionary"""
-    ids, ratings, film_urls = [], [], []
+    page_records = [(get_ids(soup), get_ratings(soup), get_film_slugs(soup)) for soup in pages_soups]
+    return collect_ids_ratings_and_urls(page_records=page_records)
+
+
+def decode_structured_data(script: str) -> dict:
+    """Strips the CDATA markers out of the content of a JSON-LD script and decodes it"""
+    script = script.replace('\n/* <![CDATA[ */\n', '').replace('\n/* ]]> */\n', '')
+    return json.loads(script)
 
-    for soup in pages_soups:
-        id_list, rating_list, url_list = get_ids(soup), get_ratings(soup), get_film_urls(soup)
-        ids.append(id_list)
-        ratings.append(rating_list)
-        film_urls.append(url_list)
 
-    ids_ratings_urls_dict = defaultdict()
-    ids_ratings_urls_dict["ids"] = unnest_list(ids)
-    ids_ratings_urls_dict["ratings"] = unnest_list(ratings)
-    ids_ratings_urls_dict["urls"] = unnest_list(film_urls)
-    return ids_ratings_urls_dict
+def get_structured_data(soup: bs4.BeautifulSoup) -> dict:
+    """Decodes the JSON-LD block of a film page"""
+    return decode_structured_data(soup.find("script", {"type": "application/ld+json"}).string)
+
+
+def join_names(structured_data: dict, key: str) -> str or np.nan:
+    """Joins the names listed under a key of the JSON-LD block with semicolons"""
+    try:
+        return ';'.join([item['name'] for item in structured_data[key]])
+    except KeyError:
+        return np.nan
+
+
+@dataclass
+class FilmData:
+    """Film fields derived from the JSON-LD block of a film page"""
+    __slots__ = ("title", "year", "director", "cast", "country")
+    title: str
+    year: int or np.nan
+    director: str or np.nan
+    cast: str or np.nan
+    country: str or np.nan
+
+
+def get_film_data(structured_data: dict) -> FilmData:
+    """Derives all film fields from the decoded JSON-LD block"""
+    try:
+        year = int(structured_data['releasedEvent'][0]['startDate'])
+    except KeyError:
+        year = np.nan
+    return FilmData(title=structured_data['name'],
+                    year=year,
+                    director=join_names(structured_data, 'director'),
+                    cast=join_names(structured_data, 'actors'),
+                    country=join_names(structured_data, 'countryOfOrigin'))
 
 
 @dataclass
 class FilmSoup:
     soup: bs4.BeautifulSoup
 
+    @cached_property
+    def film_data(self) -> FilmData:
+        """Finds and decodes the JSON-LD block once, the first time any of its fields is needed"""
+        return get_film_data(get_structured_data(self.soup))
+
     def get_id(self) -> int:
         """Scrapes the film ID"""
         return int(self.soup.find("div", class_="really-lazy-load").get("data-film-id"))
 
     def get_title(self) -> str:
-        s = self.soup.find("script", {"type": "application/ld+json"}).string
-        s = s.replace('\n/* <![CDATA[ */\n', '').replace('\n/* ]]> */\n', '')
-        d = json.loads(s)
-        return d['name']
+        """Scrapes the title"""
+        return self.film_data.title
 
     def get_year(self) -> int or np.nan:
         """Scrapes the year"""
-        try:
-            s = self.soup.find("script", {"type": "application/ld+json"}).string
-            s = s.replace('\n/* <![CDATA[ */\n', '').replace('\n/* ]]> */\n', '')
-            d = json.loads(s)
-            return int(d['releasedEvent'][0]['startDate'])
-        except KeyError:
-            return np.nan
+        return self.film_data.year
 
     def get_director(self) -> str or np.nan:
         """Scrapes the director"""
-        try:
-            s = self.soup.find("script", {"type": "application/ld+json"}).string
-            s = s.replace('\n/* <![CDATA[ */\n', '').replace('\n/* ]]> */\n', '')
-            d = json.loads(s)
-            names = [director['name'] for director in d['director']]
-            return ';'.join(names)
-        except KeyError:
-            return np.nan
+        return self.film_data.director
 
     def get_cast(self) -> str or np.nan:
         """Scrapes the cast"""
-        try:
-            s = self.soup.find("script", {"type": "application/ld+json"}).string
-            s = s.replace('\n/* <![CDATA[ */\n', '').replace('\n/* ]]> */\n', '')
-            d = json.loads(s)
-            actors = [actor['name'] for actor in d['actors']]
-            return ';'.join(actors)
-        except KeyError:
-            return np.nan
+        return self.film_data.cast
 
     def get_country(self) -> str or np.nan:
         """Scrapes the countries"""
-        try:
-            s = self.soup.find("script", {"type": "application/ld+json"}).string
-            s = s.replace('\n/* <![CDATA[ */\n', '').replace('\n/* ]]> */\n', '')
-            d = json.loads(s)
-            countries_of_origin = [country['name'] for country in d['countryOfOrigin']]
-            return ';'.join(countries_of_origin)
-        except KeyError:
-            return np.nan
+        return self.film_data.country
+
+
+def get_film_record(film: FilmSoup) -> tuple:
+    """Scrapes the ID, title, year, director, cast and countries of a film"""
+    return film.get_id(), film.get_title(), film.get_year(), film.get_director(), film.get_cast(), film.get_country()
 
 
-@time_it
+def extract_film_data(html_page: str) -> tuple:
+    """Parses a single film page and scrapes its ID, title, year, director, cast and countries"""
+    return get_film_record(FilmSoup(get_soup_object_out_of_parsed_html(html_page=html_page)))
+
+
+def collect_remaining_film_data(film_records: list[tuple]) -> dict:
+    """Stores all IDs, titles, years, directors, actors and countries in buffers preallocated for every film and
+    returns them in a dictionary, with the IDs as an int64 array and the years as a nullable Int64 array"""
+    film_records = [record for record in film_records if record]
+    columns = FilmColumns.with_capacity(len(film_records))
+    for film_id, title, year, director, cast, country in film_records:
+        columns.append(film_id=film_id, title=title, year=year, director=director, cast=cast, country=country)
+    return columns.to_dict()
+
+
+def get_film_records(remaining_film_data: dict) -> list[tuple]:
+    """Turns the remaining film data dictionary back into one (id, title, year, director, cast, countries) record
+    per film, with plain Python values and np.nan for missing years"""
+    years = remaining_film_data["years"].to_numpy(dtype="object", na_value=np.nan)
+    return list(zip(remaining_film_data["film_ids"].tolist(),
+                    remaining_film_data["titles"],
+                    [year if year is np.nan else int(year) for year in years],
+                    remaining_film_data["directors"],
+                    remaining_film_data["actors"],
+                    remaining_film_data["countries"]))
+
+
+@timed("scrape_remaining_film_data")
 def scrape_remaining_film_data(film_soups: list[bs4.BeautifulSoup, Any]) -> dict or None:
     """Stores all IDs, titles, years, directors, actors and countries in a dictionary"""
-
-    film_ids, titles, years, directors, actors, countries = [], [], [], [], [], []
-    for film_soup in film_soups:
-        film = FilmSoup(film_soup)
-        film_id = film.get_id()
-        title = film.get_title()
-        year = film.get_year()
-        director = film.get_director()
-        cast = film.get_cast()
-        country = film.get_country()
-
-        film_ids.append(film_id)
-        titles.append(title)
-        years.append(year)
-        directors.append(director)
-        actors.append(cast)
-        countries.append(country)
-
-    remaining_film_data = defaultdict()
-    remaining_film_data["film_ids"] = film_ids
-    remaining_film_data["titles"] = titles
-    remaining_film_data["years"] = years
-    remaining_film_data["directors"] = directors
-    remaining_film_data["actors"] = actors
-    remaining_film_data["countries"] = countries
-
-    return remaining_film_data
+    film_records = [get_film_record(FilmSoup(film_soup)) for film_soup in film_soups]
+    return collect_remaining_film_data(film_records=film_records)
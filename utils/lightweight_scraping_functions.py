@@ -0,0 +1,66 @@
+import re
+from lxml import etree
+from utils.letterboxd_scraping_functions import decode_structured_data, get_film_data, collect_ids_ratings_and_urls,\
+    collect_remaining_film_data
+from utils.metrics_utils import timed, extract_pages
+
+HTML_PARSER = etree.HTMLParser(encoding="utf-8", remove_comments=True)
+
+LAZY_LOAD_DIVS = etree.XPath("//div[contains(concat(' ', normalize-space(@class), ' '), ' really-lazy-load ')]")
+POSTER_CONTAINERS = etree.XPath("//li[contains(concat(' ', normalize-space(@class), ' '), ' poster-container ')]")
+RATING_SPANS = etree.XPath("//span[contains(normalize-space(@class), 'rating -tiny -darker rated')]")
+STRUCTURED_DATA_SCRIPT = etree.XPath("//script[@type='application/ld+json'][1]")
+
+
+def get_tree(html_page: str or bytes) -> etree._Element:
+    """Parses an HTML page into an lxml tree, which is built in C and is far lighter than a BeautifulSoup one"""
+    if isinstance(html_page, str):
+        html_page = html_page.encode("utf-8")
+    return etree.fromstring(html_page, HTML_PARSER)
+
+
+def get_ids(tree: etree._Element) -> list[int]:
+    """Scrapes all film IDs from a playlist page"""
+    return [int(film.get("data-film-id")) for film in LAZY_LOAD_DIVS(tree)]
+
+
+def get_ratings(tree: etree._Element) -> list[int]:
+    """Scrapes all ratings from a playlist page"""
+    try:
+        return [int(film.get("data-owner-rating")) for film in POSTER_CONTAINERS(tree)]
+    except TypeError:
+        spans = [etree.tostring(span, encoding=str, with_tail=False) for span in RATING_SPANS(tree)]
+        return [int(re.findall(string=span, pattern=r"\d+")[0]) for span in spans]
+
+
+def get_film_slugs(tree: etree._Element) -> list[str]:
+    """Scrapes all film slugs from a playlist page, from which the film URLs are built when needed"""
+    return [film.get("data-film-slug") for film in LAZY_LOAD_DIVS(tree)]
+
+
+def extract_ids_ratings_and_urls(html_page: str) -> tuple[list[int], list[int], list[str]]:
+    """Parses a single playlist page with lxml and scrapes its film IDs, ratings and slugs"""
+    tree = get_tree(html_page=html_page)
+    return get_ids(tree), get_ratings(tree), get_film_slugs(tree)
+
+
+def extract_film_data(html_page: str) -> tuple:
+    """Parses a single film page with lxml and scrapes its ID, title, year, director, cast and countries"""
+    tree = get_tree(html_page=html_page)
+    film_id = int(LAZY_LOAD_DIVS(tree)[0].get("data-film-id"))
+    film = get_film_data(decode_structured_data(STRUCTURED_DATA_SCRIPT(tree)[0].text))
+    return film_id, film.title, film.year, film.director, film.cast, film.country
+
+
+@timed("lightweight_scrape_ids_ratings_and_urls")
+def scrape_ids_ratings_and_urls(html_pages: list[str]) -> dict:
+    """Scrapes all film IDs, ratings and urls from the HTML pages of a playlist without building BeautifulSoup
+    objects"""
+    return collect_ids_ratings_and_urls(page_records=extract_pages(extract_ids_ratings_and_urls, html_pages))
+
+
+@timed("lightweight_scrape_remaining_film_data")
+def scrape_remaining_film_data(html_pages: list[str]) -> dict:
+    """Stores all IDs, titles, years, directors, actors and countries scraped from the HTML film pages in a
+    dictionary without building BeautifulSoup objects"""
+    return collect_remaining_film_data(film_records=extract_pages(extract_film_data, html_pages))
@@ -0,0 +1,119 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+from dataclasses import dataclass
+
+METADATA_DIRECTORY = ".metadata"
+
+
+class LocalObjectStoreError(Exception):
+    """Raised for missing objects, where S3 raises a ClientError"""
+
+
+class LocalObjectStoreExceptions:
+    ClientError = LocalObjectStoreError
+
+
+@dataclass
+class LocalObjectPaginator:
+    store: "LocalObjectStore"
+
+    def paginate(self, Bucket: str, Prefix: str, Delimiter: str = None):
+        """Yields a single page of results. With a delimiter, keys containing it after the prefix are rolled up into
+        common prefixes like S3 does"""
+        keys = self.store.list_keys(bucket=Bucket, prefix=Prefix)
+        if Delimiter is None:
+            yield {"Contents": [{"Key": key} for key in keys]}
+            return
+        rolled_up = [key for key in keys if Delimiter in key[len(Prefix):]]
+        common_prefixes = sorted({Prefix + key[len(Prefix):].split(Delimiter)[0] + Delimiter for key in rolled_up})
+        yield {"Contents": [{"Key": key} for key in keys if Delimiter not in key[len(Prefix):]],
+               "CommonPrefixes": [{"Prefix": common_prefix} for common_prefix in common_prefixes]}
+
+
+class LocalObjectStore:
+    """Stand-in for an S3 client keeping objects as files under the bucket directory, with their user metadata in
+    JSON files under its .metadata directory. Implements the calls made by s3_utils, so that the playlists can be
+    written to a local directory without boto3 or AWS credentials"""
+    exceptions = LocalObjectStoreExceptions
+
+    @staticmethod
+    def get_path(bucket: str, key: str) -> str:
+        return os.path.join(bucket, *key.split("/"))
+
+    @staticmethod
+    def get_metadata_path(bucket: str, key: str) -> str:
+        return os.path.join(bucket, METADATA_DIRECTORY, *key.split("/")) + ".json"
+
+    def check_exists(self, bucket: str, key: str) -> str:
+        path = self.get_path(bucket=bucket, key=key)
+        if not os.path.isfile(path):
+            raise LocalObjectStoreError(f"{path} does not exist")
+        return path
+
+    @staticmethod
+    def write_atomically(path: str, fileobj) -> None:
+        """Copies a file object to path through a temporary file, so that readers never see a partial object"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+            shutil.copyfileobj(fileobj, f)
+        os.replace(f.name, path)
+
+    def put_metadata(self, bucket: str, key: str, metadata: dict) -> None:
+        self.write_atomically(path=self.get_metadata_path(bucket=bucket, key=key),
+                              fileobj=io.BytesIO(json.dumps(metadata or {}).encode("utf-8")))
+
+    def get_object(self, Bucket: str, Key: str, Range: str = None) -> dict:
+        """Returns the object, or the byte range of it, read into memory, so that no file is left open for the
+        caller to close"""
+        path = self.check_exists(bucket=Bucket, key=Key)
+        with open(path, "rb") as f:
+            if Range is None:
+                return {"Body": io.BytesIO(f.read())}
+            start, end = (int(position) for position in Range.removeprefix("bytes=").split("-"))
+            f.seek(start)
+            return {"Body": io.BytesIO(f.read(end - start + 1))}
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        path = self.check_exists(bucket=Bucket, key=Key)
+        metadata_path = self.get_metadata_path(bucket=Bucket, key=Key)
+        metadata = {}
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+        return {"ContentLength": os.path.getsize(path), "Metadata": metadata}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, Metadata: dict = None) -> None:
+        self.write_atomically(path=self.get_path(bucket=Bucket, key=Key), fileobj=io.BytesIO(Body))
+        self.put_metadata(bucket=Bucket, key=Key, metadata=Metadata)
+
+    def upload_fileobj(self, Fileobj, Bucket: str, Key: str, ExtraArgs: dict = None, Config=None) -> None:
+        self.write_atomically(path=self.get_path(bucket=Bucket, key=Key), fileobj=Fileobj)
+        self.put_metadata(bucket=Bucket, key=Key, metadata=(ExtraArgs or {}).get("Metadata"))
+
+    def copy_object(self, Bucket: str, Key: str, CopySource: dict, Metadata: dict, MetadataDirective: str) -> None:
+        """Only supports replacing the metadata of an object, which is how s3_utils uses it"""
+        self.check_exists(bucket=Bucket, key=Key)
+        self.put_metadata(bucket=Bucket, key=Key, metadata=Metadata)
+
+    def delete_object(self, Bucket: str, Key: str) -> None:
+        for path in (self.get_path(bucket=Bucket, key=Key), self.get_metadata_path(bucket=Bucket, key=Key)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def list_keys(self, bucket: str, prefix: str) -> list[str]:
+        """Returns the keys of every object under a prefix, in lexicographic order like S3"""
+        keys = []
+        for directory, directories, files in os.walk(bucket):
+            if directory == bucket and METADATA_DIRECTORY in directories:
+                directories.remove(METADATA_DIRECTORY)
+            relative_directory = os.path.relpath(directory, bucket).replace(os.sep, "/")
+            keys += [name if relative_directory == "." else f"{relative_directory}/{name}" for name in files]
+        return sorted(key for key in keys if key.startswith(prefix))
+
+    def get_paginator(self, operation_name: str) -> LocalObjectPaginator:
+        if operation_name != "list_objects_v2":
+            raise ValueError(f"{operation_name} is not supported by the local object store")
+        return LocalObjectPaginator(store=self)
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import threading
+import functools
+import collections
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable
+from utils.enums_classes import MetricsFormat
+
+METRIC_PREFIX = "letterboxd_"
+MAX_SPANS = 10_000
+
+
+@dataclass
+class Summary:
+    count: int = 0
+    sum: float = 0.0
+    max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+@dataclass
+class MetricsRegistry:
+    """Process-wide counters, timing summaries and trace spans, safe to update from any thread. Metrics are keyed by
+    name and a sorted tuple of label pairs"""
+    counters: dict = field(default_factory=dict)
+    summaries: dict = field(default_factory=dict)
+    spans: collections.deque = field(default_factory=lambda: collections.deque(maxlen=MAX_SPANS))
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    local: threading.local = field(default_factory=threading.local, repr=False)
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        """Adds value to a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Records one observation, usually a duration in seconds, in a summary"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.summaries.setdefault(key, Summary()).observe(value)
+
+    def record_span(self, name: str, start: float, duration: float) -> None:
+        """Records a timed stage as a trace span and remembers its duration as the last one of the calling thread"""
+        self.local.last_duration = duration
+        with self.lock:
+            self.spans.append({"name": name,
+                               "start": start,
+                               "duration": duration,
+                               "thread": threading.current_thread().name})
+
+    def get_last_duration(self) -> float:
+        """Returns the duration of the last stage timed on the calling thread"""
+        return getattr(self.local, "last_duration", 0.0)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.summaries.clear()
+            self.spans.clear()
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Times a block of code with a high-resolution clock, recording it in the stage_seconds summary and as a span"""
+    start_time = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe("stage_seconds", duration, stage=stage)
+        metrics.record_span(name=stage, start=start_time, duration=duration)
+
+
+def timed(stage: str):
+    """Decorator timing every call of a function as a stage, without changing what the function returns"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def extract_with_timing(extract_func: Callable[[str], Any], html_page: str) -> tuple[float, Any]:
+    """Extracts the record of a page and measures how long it took. Module-level so that it can be sent to worker
+    processes, whose own metrics would otherwise be lost"""
+    start = time.perf_counter()
+    record = extract_func(html_page)
+    return time.perf_counter() - start, record
+
+
+def observe_page_parse(extract_func: Callable[[str], Any], duration: float) -> None:
+    """Records how long extracting the record of one page took"""
+    metrics.observe("page_parse_seconds", duration, extractor=f"{extract_func.__module__}.{extract_func.__name__}")
+
+
+def extract_pages(extract_func: Callable[[str], Any], html_pages: list[str]) -> list[Any]:
+    """Extracts the record of every page in the current process, recording the parse time of each one"""
+    records = []
+    for html_page in html_pages:
+        duration, record = extract_with_timing(extract_func, html_page)
+        observe_page_parse(extract_func, duration)
+        records.append(record)
+    return records
+
+
+def format_duration(seconds: float) -> str:
+    """Formats a duration for the logs, with millisecond resolution"""
+    if seconds < 60:
+        return f"{seconds:.3f}s"
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}:{minutes:02d}:{seconds:06.3f}"
+
+
+def get_last_runtime() -> str:
+    """Returns the formatted duration of the last stage timed on the calling thread"""
+    return format_duration(metrics.get_last_duration())
+
+
+def get_metric_samples(registry: MetricsRegistry) -> list[dict]:
+    """Flattens the registry into one sample per counter, summary and span"""
+    with registry.lock:
+        samples = [{"type": "counter", "name": name, "labels": dict(labels), "value": value}
+                   for (name, labels), value in registry.counters.items()]
+        samples += [{"type": "summary", "name": name, "labels": dict(labels),
+                     "count": summary.count, "sum": summary.sum, "max": summary.max}
+                    for (name, labels), summary in registry.summaries.items()]
+        samples += [{"type": "span", **span} for span in registry.spans]
+    return samples
+
+
+def write_metrics_jsonl(path: str, registry: MetricsRegistry = metrics) -> None:
+    """Appends one JSON line per metric sample and span to path, each stamped with the export time"""
+    exported_at = time.time()
+    with open(path, "a") as f:
+        for sample in get_metric_samples(registry):
+            f.write(json.dumps({"exported_at": exported_at, **sample}) + "\n")
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels.items()) + "}"
+
+
+def get_prometheus_text(registry: MetricsRegistry = metrics) -> str:
+    """Renders counters and summaries in the Prometheus text exposition format. Spans are left out"""
+    lines = []
+    samples = get_metric_samples(registry)
+    for metric_type in ("counter", "summary"):
+        typed_samples = sorted((s for s in samples if s["type"] == metric_type), key=lambda s: s["name"])
+        for name in dict.fromkeys(s["name"] for s in typed_samples):
+            metric_name = METRIC_PREFIX + name
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            for sample in (s for s in typed_samples if s["name"] == name):
+                labels = format_labels(sample["labels"])
+                if metric_type == "counter":
+                    lines.append(f"{metric_name}{labels} {sample['value']}")
+                else:
+                    lines.append(f"{metric_name}_count{labels} {sample['count']}")
+                    lines.append(f"{metric_name}_sum{labels} {sample['sum']}")
+            if metric_type == "summary":
+                lines.append(f"# TYPE {metric_name}_max gauge")
+                lines += [f"{metric_name}_max{format_labels(s['labels'])} {s['max']}"
+                          for s in typed_samples if s["name"] == name]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_prometheus(path: str, registry: MetricsRegistry = metrics) -> None:
+    """Writes the metrics to a Prometheus node exporter textfile, atomically so that the exporter never reads a
+    partial file"""
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as f:
+        f.write(get_prometheus_text(registry))
+    os.replace(temporary_path, path)
+
+
+def export_metrics(path: str or None, metrics_format: MetricsFormat) -> None:
+    """Exports the metrics of the process to path in the supplied format, if a path was supplied"""
+    if path is None:
+        return
+    if metrics_format == MetricsFormat.PROMETHEUS:
+        write_metrics_prometheus(path)
+    else:
+        write_metrics_jsonl(path)
@@ -1,7 +1,6 @@
 from dataclasses import dataclass
 from collections import defaultdict
 from utils.string_utils import get_all_capturing_groups, get_username, get_playlist_title
-from utils.letterboxd_scraping_functions import get_number_of_pages
 
 
 @dataclass
@@ -9,11 +8,12 @@ class Playlist:
     url: str
 
     def get_playlist_metadata(self) -> dict:
-        """Returns a dictionary storing all metadata about the playlist"""
+        """Returns a dictionary storing all metadata about the playlist. The number of pages is only known once the
+        first page has been downloaded with the others, so it starts out as None"""
         groups = get_all_capturing_groups(url=self.url)
         metadata = defaultdict()
         metadata["url"] = self.url
         metadata["user"] = get_username(groups)
         metadata["title"] = get_playlist_title(groups)
-        metadata["number_of_pages"] = get_number_of_pages(url=self.url)
+        metadata["number_of_pages"] = None
         return metadata
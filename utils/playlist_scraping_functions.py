@@ -0,0 +1,481 @@
+import logging
+import concurrent.futures
+from typing import Callable
+import pandas as pd
+from utils.playlist_metadata import Playlist
+from utils.generic_scraping_functions import parse_all_urls_asynchronously, get_soup_objects_multithreading,\
+    get_soup_objects_synchronously, stream_all_urls, remove_missing_pages, extract_records_multiprocessing,\
+    ParseStrategy, resolve_parse_strategy, get_average_page_size
+from utils.letterboxd_scraping_functions import get_number_of_pages, get_page_url, get_url_for_each_page,\
+    scrape_ids_ratings_and_urls, scrape_remaining_film_data, extract_ids_ratings_and_urls, extract_film_data,\
+    collect_ids_ratings_and_urls, collect_remaining_film_data, get_film_records
+from utils.s3_utils import get_s3_key, get_s3_metadata_key, read_csv_from_s3, read_dataframe_from_s3,\
+    write_dataframe_to_s3, get_s3_object_metadata, is_content_unchanged, update_s3_object_metadata, CONTENT_HASH_KEY,\
+    get_change_log_key, write_change_log_to_s3
+from utils.data_wrangling_utils import cast_id_and_year_as_numeric, get_change_report,\
+    get_ratings_dataframe, get_film_data_dataframe, inner_join_two_dataframes_on_film_id,\
+    sort_dataframe_by_year_and_title, get_all_columns_except_ratings_from_current_dataframe,\
+    append_new_records_to_current_dataframe, get_content_hash, get_change_log
+from utils.incremental_utils import get_default_incremental_sort, get_newest_first_page_url, is_full_refresh_due,\
+    get_full_refresh_metadata, get_stored_ratings, page_is_unchanged, merge_incremental_records, has_removed_films
+from utils import lightweight_scraping_functions
+from utils.logging_utils import Logger
+from utils.metrics_utils import get_last_runtime
+from utils.enums_classes import ParallelTechnique, StorageFormat, DatabaseWriteMode, DatabaseSchema
+from utils.cache_utils import ResponseCache
+from utils.http_utils import FetchError
+from utils.checkpoint_utils import Checkpoint, CHECKPOINT_INTERVAL, open_checkpoint
+from utils.scraping_context import ScrapingOptions, ScrapingResources
+
+info_log = Logger(name=__name__, level=logging.INFO).return_logger()
+
+
+def get_soup_objects(html_pages: list[str], parallel_technique: ParallelTechnique, pages_name: str) -> list:
+    """Turns a list of HTML pages into BeautifulSoup objects with the requested parallel technique"""
+    if parallel_technique == ParallelTechnique.MULTITHREADING:
+        soups = get_soup_objects_multithreading(html_pages=html_pages)
+        info_log.info(f"Got BeautifulSoup objects out of {pages_name} with multithreading in {get_last_runtime()}")
+    else:
+        soups = get_soup_objects_synchronously(html_pages=html_pages)
+        info_log.info(f"Synchronously got BeautifulSoup objects out of {pages_name} in {get_last_runtime()}")
+    return soups
+
+
+def get_playlist_page_extractor(parallel_technique: ParallelTechnique) -> Callable[[str], tuple]:
+    """Returns the function scraping film IDs, ratings and URLs out of a single playlist page"""
+    if parallel_technique == ParallelTechnique.LIGHTWEIGHT:
+        return lightweight_scraping_functions.extract_ids_ratings_and_urls
+    return extract_ids_ratings_and_urls
+
+
+def get_film_page_extractor(parallel_technique: ParallelTechnique) -> Callable[[str], tuple]:
+    """Returns the function scraping the film data out of a single film page"""
+    if parallel_technique == ParallelTechnique.LIGHTWEIGHT:
+        return lightweight_scraping_functions.extract_film_data
+    return extract_film_data
+
+
+def get_stage_executor(strategy: ParseStrategy, resources: ScrapingResources) -> concurrent.futures.Executor or None:
+    """Returns the shared process pool if the stage is parsed in worker processes, otherwise None"""
+    if strategy.parallel_technique == ParallelTechnique.MULTIPROCESSING:
+        return resources.executor
+    return None
+
+
+def get_first_playlist_page(metadata: dict, resources: ScrapingResources, cache: ResponseCache = None) -> str:
+    """Downloads the first playlist page with the async engine and reads the number of pages out of it. Its body is
+    then reused by the playlist pages stage instead of being downloaded again"""
+    first_page_url = get_page_url(metadata=metadata, page_number=1)
+    [first_page] = parse_all_urls_asynchronously(urls=[first_page_url], cache=cache, http_client=resources.http_client)
+    if first_page is None:
+        raise FetchError(f"Could not download {first_page_url}, the first page of the playlist")
+    metadata["number_of_pages"] = get_number_of_pages(html_page=first_page)
+    info_log.info(f"Found {metadata['number_of_pages']} playlist pages in {get_last_runtime()}")
+    return first_page
+
+
+def scrape_playlist_pages(metadata: dict,
+                          options: ScrapingOptions,
+                          resources: ScrapingResources,
+                          cache: ResponseCache = None) -> dict:
+    """Scrapes film IDs, ratings and URLs out of every playlist page. The pages are discovered from the first one,
+    which is only downloaded once"""
+    first_page = get_first_playlist_page(metadata=metadata, resources=resources, cache=cache)
+    urls = get_url_for_each_page(metadata=metadata)
+    parallel_technique = options.parallel_technique
+    if options.streaming:
+        strategy = resolve_parse_strategy(parallel_technique=parallel_technique, n_pages=len(urls))
+        page_records = stream_all_urls(urls=urls,
+                                       extract_func=get_playlist_page_extractor(parallel_technique),
+                                       parallel_technique=strategy.parallel_technique,
+                                       queue_size=options.queue_size,
+                                       cache=cache,
+                                       executor=get_stage_executor(strategy=strategy, resources=resources),
+                                       http_client=resources.http_client,
+                                       n_parsers=strategy.n_workers,
+                                       prefetched={0: first_page})
+        info_log.info(f"Streamed playlist pages through fetching, parsing and scraping in {get_last_runtime()}")
+        return collect_ids_ratings_and_urls(page_records=page_records)
+
+    playlist_pages_html = [first_page] + parse_all_urls_asynchronously(urls=urls[1:],
+                                                                       cache=cache,
+                                                                       http_client=resources.http_client)
+    info_log.info(f"Asynchronously parsed playlist pages as HTML code in {get_last_runtime()}")
+    playlist_pages_html = remove_missing_pages(html_pages=playlist_pages_html)
+    strategy = resolve_parse_strategy(parallel_technique=parallel_technique,
+                                      n_pages=len(playlist_pages_html),
+                                      average_page_size=get_average_page_size(html_pages=playlist_pages_html))
+    parallel_technique = strategy.parallel_technique
+
+    if parallel_technique == ParallelTechnique.LIGHTWEIGHT:
+        ids_ratings_urls_dict = lightweight_scraping_functions.scrape_ids_ratings_and_urls(
+            html_pages=playlist_pages_html)
+        info_log.info(f"Scraped film IDs, ratings and URLs from playlist pages with lxml in {get_last_runtime()}")
+        return ids_ratings_urls_dict
+
+    if parallel_technique == ParallelTechnique.MULTIPROCESSING:
+        page_records = extract_records_multiprocessing(html_pages=playlist_pages_html,
+                                                       extract_func=extract_ids_ratings_and_urls,
+                                                       executor=resources.executor,
+                                                       n_workers=strategy.n_workers)
+        info_log.info(f"Scraped film IDs, ratings and URLs from playlist pages with multiprocessing in "
+                      f"{get_last_runtime()}")
+        return collect_ids_ratings_and_urls(page_records=page_records)
+
+    playlist_pages_soups = get_soup_objects(html_pages=playlist_pages_html,
+                                            parallel_technique=parallel_technique,
+                                            pages_name="playlist pages")
+
+    ids_ratings_urls_dict = scrape_ids_ratings_and_urls(pages_soups=playlist_pages_soups)
+    info_log.info(f"Scraped film IDs, ratings and URLs from playlist pages in {get_last_runtime()}")
+    return ids_ratings_urls_dict
+
+
+def scrape_film_pages(urls: list[str],
+                      options: ScrapingOptions,
+                      resources: ScrapingResources,
+                      cache: ResponseCache = None) -> dict:
+    """Scrapes IDs, titles, years, directors, actors and countries out of every film page"""
+    parallel_technique = options.parallel_technique
+    if options.streaming:
+        strategy = resolve_parse_strategy(parallel_technique=parallel_technique, n_pages=len(urls))
+        film_records = stream_all_urls(urls=urls,
+                                       extract_func=get_film_page_extractor(parallel_technique),
+                                       parallel_technique=strategy.parallel_technique,
+                                       queue_size=options.queue_size,
+                                       cache=cache,
+                                       executor=get_stage_executor(strategy=strategy, resources=resources),
+                                       http_client=resources.http_client,
+                                       n_parsers=strategy.n_workers)
+        info_log.info(f"Streamed film pages through fetching, parsing and scraping in {get_last_runtime()}")
+        return collect_remaining_film_data(film_records=film_records)
+
+    film_pages_html = parse_all_urls_asynchronously(urls=urls,
+                                                    cache=cache,
+                                                    http_client=resources.http_client)
+    info_log.info(f"Asynchronously parsed film pages as HTML code in {get_last_runtime()}")
+    film_pages_html = remove_missing_pages(html_pages=film_pages_html)
+    strategy = resolve_parse_strategy(parallel_technique=parallel_technique,
+                                      n_pages=len(film_pages_html),
+                                      average_page_size=get_average_page_size(html_pages=film_pages_html))
+    parallel_technique = strategy.parallel_technique
+
+    if parallel_technique == ParallelTechnique.LIGHTWEIGHT:
+        more_film_data = lightweight_scraping_functions.scrape_remaining_film_data(html_pages=film_pages_html)
+        info_log.info(f"Scraped all other film data with lxml in {get_last_runtime()}")
+        return more_film_data
+
+    if parallel_technique == ParallelTechnique.MULTIPROCESSING:
+        film_records = extract_records_multiprocessing(html_pages=film_pages_html,
+                                                       extract_func=extract_film_data,
+                                                       executor=resources.executor,
+                                                       n_workers=strategy.n_workers)
+        info_log.info(f"Scraped all other film data with multiprocessing in {get_last_runtime()}")
+        return collect_remaining_film_data(film_records=film_records)
+
+    film_pages_soups = get_soup_objects(html_pages=film_pages_html,
+                                        parallel_technique=parallel_technique,
+                                        pages_name="film pages")
+
+    more_film_data = scrape_remaining_film_data(film_soups=film_pages_soups)
+    info_log.info(f"Scraped all other film data in {get_last_runtime()}")
+    return more_film_data
+
+
+def scrape_newest_playlist_pages(metadata: dict,
+                                 current_df: pd.DataFrame,
+                                 options: ScrapingOptions,
+                                 resources: ScrapingResources,
+                                 cache: ResponseCache = None) -> dict or None:
+    """Scrapes the playlist sorted newest first one page at a time, stopping at the first page whose films are all
+    already stored with the same rating, and merges what it found with the stored ratings. Returns None if the
+    pagination of the first page shows that films were removed, which only a full pass picks up"""
+    sort = options.incremental_sort or get_default_incremental_sort(metadata=metadata)
+    stored_ratings = get_stored_ratings(current_df=current_df)
+    extract_func = get_playlist_page_extractor(options.parallel_technique)
+
+    page_records = []
+    page_number = 1
+    first_page_size, number_of_pages = None, None
+    while True:
+        url = get_newest_first_page_url(metadata=metadata, sort=sort, page_number=page_number)
+        [html_page] = parse_all_urls_asynchronously(urls=[url],
+                                                    cache=cache,
+                                                    http_client=resources.http_client)
+        if html_page is None:
+            break
+        page_record = extract_func(html_page)
+        if page_number == 1:
+            first_page_size, number_of_pages = len(page_record[0]), get_number_of_pages(html_page)
+        if not page_record[0]:
+            break
+        page_records.append(page_record)
+        if page_is_unchanged(page_record=page_record, stored_ratings=stored_ratings):
+            break
+        page_number += 1
+
+    info_log.info(f"Incrementally scraped {len(page_records)} playlist pages sorted by {sort}")
+    merged = merge_incremental_records(page_records=page_records, current_df=current_df)
+    if first_page_size is not None and has_removed_films(first_page_size=first_page_size,
+                                                         number_of_pages=number_of_pages,
+                                                         n_merged=len(merged["ids"])):
+        info_log.info(f"The playlist has {number_of_pages} pages of {first_page_size} films at most, fewer than the "
+                      f"{len(merged['ids'])} merged: films were removed, falling back to a full pass")
+        return None
+    return merged
+
+
+def get_film_data(urls: list[str],
+                  ids_ratings_urls_dict: dict,
+                  options: ScrapingOptions,
+                  resources: ScrapingResources,
+                  checkpoint: Checkpoint = None) -> dict:
+    """Gets the film data of every URL, only scraping the films that are neither in the film store nor in the
+    playlist's checkpoint. Film pages are then scraped in chunks, each saved to both before the next one starts, so
+    that an interrupted run loses at most one chunk"""
+    film_stores = [film_store for film_store in (resources.film_store, checkpoint and checkpoint.film_store)
+                   if film_store is not None]
+    if not film_stores:
+        return scrape_film_pages(urls=urls, options=options, resources=resources, cache=resources.cache)
+
+    requested_urls = set(urls)
+    ids_by_url = {url: film_id for url, film_id in zip(ids_ratings_urls_dict["urls"], ids_ratings_urls_dict["ids"])
+                  if url in requested_urls}
+    stored_records = []
+    stored_ids = set()
+    for film_store in film_stores:
+        film_ids = [ids_by_url[url] for url in urls if ids_by_url[url] not in stored_ids]
+        records = film_store.get_records(film_ids=film_ids)
+        stored_records += records
+        stored_ids.update(record[0] for record in records)
+    urls_to_scrape = [url for url in urls if ids_by_url[url] not in stored_ids]
+    info_log.info(f"Found {len(stored_records)} films already scraped, {len(urls_to_scrape)} left to scrape")
+
+    scraped_records = []
+    for start in range(0, len(urls_to_scrape), CHECKPOINT_INTERVAL):
+        scraped_film_data = scrape_film_pages(urls=urls_to_scrape[start:start + CHECKPOINT_INTERVAL],
+                                              options=options,
+                                              resources=resources,
+                                              cache=resources.cache)
+        chunk_records = get_film_records(remaining_film_data=scraped_film_data)
+        for film_store in film_stores:
+            film_store.put_records(film_records=chunk_records)
+        scraped_records += chunk_records
+
+    return collect_remaining_film_data(film_records=stored_records + scraped_records)
+
+
+def read_current_dataframe(metadata: dict,
+                           df_key: str,
+                           options: ScrapingOptions,
+                           resources: ScrapingResources) -> pd.DataFrame or None:
+    """Reads the stored playlist from S3. When a Parquet dataset does not exist yet, the CSV written by previous
+    runs is read instead, so that the next write migrates it to Parquet"""
+    current_df = read_dataframe_from_s3(bucket=resources.bucket,
+                                        s3_client=resources.s3_client,
+                                        key=df_key,
+                                        storage_format=options.storage_format)
+    if current_df is not None:
+        info_log.info(f"Read the current dataframe from S3 in {get_last_runtime()}")
+        return current_df
+
+    if options.storage_format != StorageFormat.CSV:
+        csv_key = get_s3_key(metadata=metadata)
+        current_df = read_csv_from_s3(bucket=resources.bucket,
+                                      s3_client=resources.s3_client,
+                                      key=csv_key)
+        if current_df is not None:
+            info_log.info(f"Read {csv_key} from S3 in {get_last_runtime()}, it will be migrated to {df_key}")
+    return current_df
+
+
+def scrape_playlist(url: str, options: ScrapingOptions, resources: ScrapingResources):
+    """Scrapes a playlist and stores it in S3 and, optionally, in the local database. With a work directory its
+    progress is checkpointed until it is stored"""
+
+    playlist_pages_cache = resources.cache.with_ttl(0) if resources.cache is not None else None
+
+    playlist = Playlist(url=url)
+    metadata = playlist.get_playlist_metadata()
+
+    info_log.info(f"Started scraping playlist {metadata['title'].upper()} from user {metadata['user'].upper()}")
+
+    with open_checkpoint(work_dir=options.work_dir, metadata=metadata, resume=options.resume) as checkpoint:
+        update_playlist(url=url,
+                        metadata=metadata,
+                        playlist_pages_cache=playlist_pages_cache,
+                        options=options,
+                        resources=resources,
+                        checkpoint=checkpoint)
+
+
+def update_playlist(url: str,
+                    metadata: dict,
+                    playlist_pages_cache: ResponseCache or None,
+                    options: ScrapingOptions,
+                    resources: ScrapingResources,
+                    checkpoint: Checkpoint = None):
+    """Scrapes what changed in a playlist since it was last stored and writes the result to S3 and, optionally, to
+    the local database. The database is written first, then the change log and finally the snapshot and its content
+    hash, so that a run failing in between writes the same changes again instead of seeing the playlist as
+    unchanged and leaving the log or the database behind. A failed database write leaves no change log object in S3
+    for the rerun to duplicate"""
+    df_key = get_s3_key(metadata=metadata,
+                        storage_format=options.storage_format,
+                        partition_by_year=options.partition_by_year)
+
+    if options.over_write:
+        current_df = None
+        info_log.info(f"Overwriting object {df_key} in {resources.bucket}")
+    else:
+        current_df = read_current_dataframe(metadata=metadata, df_key=df_key, options=options, resources=resources)
+
+    object_metadata = None
+    if current_df is not None:
+        object_metadata = get_s3_object_metadata(bucket=resources.bucket,
+                                                 s3_client=resources.s3_client,
+                                                 key=get_s3_metadata_key(df_key))
+    full_refresh = current_df is None or not options.incremental or \
+        is_full_refresh_due(object_metadata=object_metadata, full_refresh_days=options.full_refresh_days)
+
+    ids_ratings_urls_dict = checkpoint.get_ids_ratings_urls() if checkpoint is not None else None
+    if ids_ratings_urls_dict is not None:
+        info_log.info(f"Resumed {len(ids_ratings_urls_dict['ids'])} film IDs, ratings and URLs from the checkpoint")
+    else:
+        if not full_refresh:
+            ids_ratings_urls_dict = scrape_newest_playlist_pages(metadata=metadata,
+                                                                 current_df=current_df,
+                                                                 options=options,
+                                                                 resources=resources,
+                                                                 cache=playlist_pages_cache)
+            full_refresh = ids_ratings_urls_dict is None
+        if full_refresh:
+            ids_ratings_urls_dict = scrape_playlist_pages(metadata=metadata,
+                                                          options=options,
+                                                          resources=resources,
+                                                          cache=playlist_pages_cache)
+    if checkpoint is not None:
+        checkpoint.put_ids_ratings_urls(ids_ratings_urls_dict=ids_ratings_urls_dict)
+
+    if current_df is not None:
+        current_df = cast_id_and_year_as_numeric(current_df=current_df)
+        change_report = get_change_report(current_df=current_df, ids_ratings_urls_dict=ids_ratings_urls_dict)
+        new_records = change_report.new_urls
+        if new_records:
+            info_log.info(f"N. of new films to be added to the playlist: {len(new_records)}")
+        else:
+            info_log.info(f"No new films to be added to the playlist")
+        info_log.info(f"N. of films removed from the playlist: {len(change_report.removed)}, "
+                      f"n. of films re-rated: {len(change_report.rerated)}")
+    else:
+        change_report = get_change_report(current_df=None, ids_ratings_urls_dict=ids_ratings_urls_dict)
+        new_records = None
+
+    if new_records or current_df is None:
+        more_film_data = get_film_data(urls=new_records or ids_ratings_urls_dict["urls"],
+                                       ids_ratings_urls_dict=ids_ratings_urls_dict,
+                                       options=options,
+                                       resources=resources,
+                                       checkpoint=checkpoint)
+    else:
+        more_film_data = None
+
+    ratings_df = get_ratings_dataframe(ids_ratings_urls_dict=ids_ratings_urls_dict)
+
+    if current_df is None:
+        film_data_df = get_film_data_dataframe(additional_film_data=more_film_data)
+        joined_df = inner_join_two_dataframes_on_film_id(left_dataframe=ratings_df,
+                                                         right_dataframe=film_data_df)
+        info_log.info("Created final dataframe from scratch")
+
+    else:
+        if new_records:
+            new_records_dataframe = get_film_data_dataframe(additional_film_data=more_film_data)
+            current_df_no_ratings = get_all_columns_except_ratings_from_current_dataframe(current_df=current_df)
+            appended_df = append_new_records_to_current_dataframe(current_df_no_ratings=current_df_no_ratings,
+                                                                  new_records_dataframe=new_records_dataframe)
+            joined_df = inner_join_two_dataframes_on_film_id(left_dataframe=ratings_df,
+                                                             right_dataframe=appended_df)
+            info_log.info(f"Created final dataframe by adding new films and updating all results")
+        else:
+            current_df_no_ratings = get_all_columns_except_ratings_from_current_dataframe(current_df=current_df)
+            joined_df = inner_join_two_dataframes_on_film_id(left_dataframe=ratings_df,
+                                                             right_dataframe=current_df_no_ratings)
+            info_log.info(f"Created final dataframe by updating all ratings")
+
+    final_df = sort_dataframe_by_year_and_title(final_dataframe=joined_df)
+    content_hash = get_content_hash(df=final_df)
+    object_metadata_to_write = get_full_refresh_metadata(object_metadata=object_metadata, full_refresh=full_refresh)
+    object_metadata_to_write[CONTENT_HASH_KEY] = content_hash
+
+    if is_content_unchanged(object_metadata=object_metadata, content_hash=content_hash):
+        if object_metadata != object_metadata_to_write:
+            update_s3_object_metadata(bucket=resources.bucket,
+                                      s3_client=resources.s3_client,
+                                      key=get_s3_metadata_key(df_key),
+                                      metadata=object_metadata_to_write)
+        info_log.info(f"{df_key} is unchanged (content hash {content_hash[:12]}), skipping the S3 and database "
+                      f"writes")
+        return
+
+    change_log = None
+    if options.change_log:
+        changed_at = pd.Timestamp.now(tz="UTC")
+        change_log = get_change_log(change_report=change_report, final_df=final_df, changed_at=changed_at)
+
+    if options.write_to_local_db:
+        write_playlist_to_database(final_df=final_df,
+                                   change_log=change_log,
+                                   metadata=metadata,
+                                   options=options,
+                                   engine=resources.engine)
+
+    if change_log is not None:
+        if not change_log.empty:
+            write_change_log_to_s3(bucket=resources.bucket,
+                                   s3_client=resources.s3_client,
+                                   filename=get_change_log_key(metadata=metadata,
+                                                               changed_at=changed_at,
+                                                               storage_format=options.storage_format),
+                                   change_log=change_log,
+                                   storage_format=options.storage_format)
+            info_log.info(f"Wrote {len(change_log)} change log entries to S3 bucket in {get_last_runtime()}")
+        if not full_refresh:
+            info_log.info("Films removed from the playlist are only logged by a full pass, this run was incremental")
+
+    write_dataframe_to_s3(bucket=resources.bucket,
+                          s3_client=resources.s3_client,
+                          filename=df_key,
+                          df=final_df,
+                          storage_format=options.storage_format,
+                          metadata=object_metadata_to_write)
+    info_log.info(f"Dataframe in S3 bucket will have {len(final_df)} records")
+    info_log.info(f"Wrote final dataframe to S3 bucket in {get_last_runtime()}")
+
+
+def write_playlist_to_database(final_df: pd.DataFrame,
+                               change_log: pd.DataFrame or None,
+                               metadata: dict,
+                               options: ScrapingOptions,
+                               engine) -> None:
+    """Writes the playlist and its change log to the local Postgres database through the shared engine. SQLAlchemy
+    is only imported here, so that runs without --database never load it"""
+    from utils.database_utils import get_table_name, write_to_database, upsert_to_database,\
+        write_to_normalized_database, write_change_log_to_database
+    table_name = get_table_name(playlist_metadata=metadata)
+    if options.database_schema == DatabaseSchema.NORMALIZED:
+        row_counts = write_to_normalized_database(engine=engine,
+                                                  df=final_df,
+                                                  playlist_metadata=metadata,
+                                                  change_log=change_log)
+        info_log.info(f"Upserted {row_counts['upserted']} and deleted {row_counts['deleted']} ratings of "
+                      f"{table_name} in the normalized local Postgres schema in {get_last_runtime()}")
+    elif options.database_mode == DatabaseWriteMode.UPSERT:
+        row_counts = upsert_to_database(engine=engine, df=final_df, table_name=table_name)
+        info_log.info(f"Upserted {row_counts['upserted']} and deleted {row_counts['deleted']} rows of "
+                      f"{table_name} in the local Postgres database in {get_last_runtime()}")
+    else:
+        write_to_database(engine=engine, df=final_df, table_name=table_name)
+        info_log.info(f"Wrote dataframe to local Postgres database in {get_last_runtime()}")
+    if options.database_schema == DatabaseSchema.FLAT and change_log is not None and not change_log.empty:
+        write_change_log_to_database(engine=engine, change_log=change_log, table_name=table_name + "_changes")
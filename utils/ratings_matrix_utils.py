@@ -0,0 +1,178 @@
+from __future__ import annotations
+import json
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+import numpy as np
+import pandas as pd
+from utils.enums_classes import StorageFormat
+from utils.s3_utils import CONTENT_HASH_KEY, get_s3_key, get_s3_metadata_key, get_s3_object_metadata,\
+    list_s3_prefixes, update_s3_object_metadata, read_dataframe_from_s3, get_s3_range_reader, upload_chunks_to_s3,\
+    iter_parquet_chunks
+from utils.data_wrangling_utils import get_content_hash
+from utils.metrics_utils import timed, metrics
+from utils.logging_utils import Logger
+
+if TYPE_CHECKING:
+    import boto3
+
+info_log = Logger(name=__name__, level=logging.INFO).return_logger()
+
+RATINGS_MATRIX_PREFIX = "ratings_matrix/"
+RATINGS_MATRIX_KEY = RATINGS_MATRIX_PREFIX + "ratings.parquet"
+RATINGS_PLAYLIST_TITLE = "ratings"
+CONTENT_HASHES_METADATA_KEY = b"content_hashes"
+
+
+@dataclass
+class RatingsMatrix:
+    """The ratings in coordinate format, with the content hash of the playlist each user's rows were built from"""
+    ratings: pd.DataFrame
+    content_hashes: dict
+
+
+def get_empty_ratings(users: list[str] = ()) -> pd.DataFrame:
+    return pd.DataFrame({"user": pd.Categorical([], categories=sorted(users)),
+                         "film_id": pd.Series(dtype="int64"),
+                         "rating": pd.Series(dtype="int8")})
+
+
+def get_users(bucket: str, s3_client: boto3.session.Session.client) -> list[str]:
+    """Returns the users with playlists stored in the bucket out of its top-level prefixes, so that the change logs
+    and partitions under them are never listed"""
+    prefixes = list_s3_prefixes(bucket=bucket, s3_client=s3_client, prefix="")
+    return sorted(prefix.rstrip("/") for prefix in prefixes if prefix != RATINGS_MATRIX_PREFIX)
+
+
+def get_ratings_playlist_key(bucket: str,
+                             s3_client: boto3.session.Session.client,
+                             user: str,
+                             storage_format: StorageFormat,
+                             partition_by_year: bool) -> tuple[str, StorageFormat, dict] or None:
+    """Returns the key, storage format and metadata of a user's ratings playlist, looking for it in the storage
+    format of the run first and as a CSV written by earlier runs second, or None if it is in neither"""
+    metadata = {"user": user, "title": RATINGS_PLAYLIST_TITLE}
+    candidates = [(get_s3_key(metadata=metadata, storage_format=storage_format, partition_by_year=partition_by_year),
+                   storage_format),
+                  (get_s3_key(metadata=metadata), StorageFormat.CSV)]
+    for key, key_storage_format in candidates:
+        object_metadata = get_s3_object_metadata(bucket=bucket, s3_client=s3_client, key=get_s3_metadata_key(key))
+        if object_metadata is not None:
+            return key, key_storage_format, object_metadata
+    return None
+
+
+def store_content_hash(bucket: str,
+                       s3_client: boto3.session.Session.client,
+                       key: str,
+                       object_metadata: dict,
+                       playlist_df: pd.DataFrame) -> str:
+    """Computes the content hash of a playlist stored without one and adds it to its metadata, so that it is only
+    read in full once"""
+    content_hash = get_content_hash(df=playlist_df)
+    update_s3_object_metadata(bucket=bucket,
+                              s3_client=s3_client,
+                              key=get_s3_metadata_key(key),
+                              metadata={**object_metadata, CONTENT_HASH_KEY: content_hash})
+    return content_hash
+
+
+@timed("read_ratings_matrix")
+def read_ratings_matrix(bucket: str, s3_client: boto3.session.Session.client) -> RatingsMatrix:
+    """Reads the stored ratings matrix, or returns an empty one if it does not exist yet"""
+    import pyarrow.parquet as pq
+    reader = get_s3_range_reader(bucket=bucket, s3_client=s3_client, key=RATINGS_MATRIX_KEY)
+    if reader is None:
+        return RatingsMatrix(ratings=get_empty_ratings(), content_hashes={})
+    with reader:
+        table = pq.read_table(reader)
+    content_hashes = json.loads(table.schema.metadata.get(CONTENT_HASHES_METADATA_KEY, b"{}"))
+    return RatingsMatrix(ratings=table.to_pandas(), content_hashes=content_hashes)
+
+
+def get_user_ratings(user: str, playlist_df: pd.DataFrame) -> pd.DataFrame:
+    """Turns a stored ratings playlist into the rows of its user in the ratings matrix"""
+    user_ratings = pd.DataFrame({"user": user,
+                                 "film_id": playlist_df["id"].to_numpy(dtype="int64"),
+                                 "rating": playlist_df["rating"].to_numpy(dtype="int8")})
+    return user_ratings.drop_duplicates("film_id")
+
+
+def combine_ratings(ratings: list[pd.DataFrame], users: list[str]) -> pd.DataFrame:
+    """Concatenates the rows of every user, encoding users as a categorical whose codes follow the sorted users, and
+    sorts them by user and film ID"""
+    ratings = [df.astype({"user": "str"}) for df in ratings if not df.empty]
+    if not ratings:
+        return get_empty_ratings(users=users)
+    combined = pd.concat(ratings, ignore_index=True)
+    combined["user"] = pd.Categorical(combined["user"], categories=sorted(users))
+    return combined.sort_values(["user", "film_id"], ignore_index=True)
+
+
+@timed("write_ratings_matrix")
+def write_ratings_matrix(bucket: str, s3_client: boto3.session.Session.client, ratings_matrix: RatingsMatrix) -> None:
+    """Writes the ratings matrix to S3 as a compressed Parquet object, with the content hashes in its footer"""
+    schema_metadata = {CONTENT_HASHES_METADATA_KEY: json.dumps(ratings_matrix.content_hashes).encode("utf-8")}
+    upload_chunks_to_s3(bucket=bucket,
+                        s3_client=s3_client,
+                        key=RATINGS_MATRIX_KEY,
+                        chunks=iter_parquet_chunks(ratings_matrix.ratings, schema_metadata=schema_metadata))
+    metrics.increment("rows_written_total", len(ratings_matrix.ratings), target="s3", dataset="ratings_matrix")
+
+
+@timed("update_ratings_matrix")
+def update_ratings_matrix(bucket: str,
+                          s3_client: boto3.session.Session.client,
+                          storage_format: StorageFormat,
+                          partition_by_year: bool) -> RatingsMatrix:
+    """Brings the ratings matrix up to date with the stored ratings playlists, only re-reading those whose content
+    hash changed and dropping users whose playlist is gone"""
+    stored_matrix = read_ratings_matrix(bucket=bucket, s3_client=s3_client)
+    content_hashes = {}
+    changed_users = set()
+    changed_ratings = []
+    for user in get_users(bucket=bucket, s3_client=s3_client):
+        playlist = get_ratings_playlist_key(bucket=bucket,
+                                            s3_client=s3_client,
+                                            user=user,
+                                            storage_format=storage_format,
+                                            partition_by_year=partition_by_year)
+        if playlist is None:
+            continue
+        key, key_storage_format, object_metadata = playlist
+        content_hash = object_metadata.get(CONTENT_HASH_KEY)
+        if content_hash is not None and stored_matrix.content_hashes.get(user) == content_hash:
+            content_hashes[user] = content_hash
+            continue
+        playlist_df = read_dataframe_from_s3(bucket=bucket,
+                                             s3_client=s3_client,
+                                             key=key,
+                                             storage_format=key_storage_format,
+                                             columns=None if content_hash is None else ["id", "rating"])
+        if playlist_df is None:
+            continue
+        if content_hash is None:
+            content_hash = store_content_hash(bucket=bucket,
+                                              s3_client=s3_client,
+                                              key=key,
+                                              object_metadata=object_metadata,
+                                              playlist_df=playlist_df)
+        changed_ratings.append(get_user_ratings(user=user, playlist_df=playlist_df))
+        changed_users.add(user)
+        content_hashes[user] = content_hash
+
+    removed_users = set(stored_matrix.content_hashes) - set(content_hashes)
+    if not changed_users and not removed_users:
+        info_log.info(f"The ratings matrix of {len(content_hashes)} users is up to date")
+        return stored_matrix
+
+    stored_ratings = stored_matrix.ratings
+    kept_ratings = stored_ratings[stored_ratings["user"].isin(set(content_hashes) - changed_users)]
+    ratings_matrix = RatingsMatrix(ratings=combine_ratings(ratings=[kept_ratings] + changed_ratings,
+                                                           users=list(content_hashes)),
+                                   content_hashes=content_hashes)
+    write_ratings_matrix(bucket=bucket, s3_client=s3_client, ratings_matrix=ratings_matrix)
+    info_log.info(f"Updated the ratings matrix of {len(content_hashes)} users and "
+                  f"{np.unique(ratings_matrix.ratings['film_id']).size} films: {len(changed_users)} users "
+                  f"re-read, {len(removed_users)} removed")
+    return ratings_matrix
@@ -1,17 +1,25 @@
+from __future__ import annotations
 import io
 import logging
-import boto3
-from botocore.exceptions import ClientError
+from typing import Iterator, TYPE_CHECKING
 import pandas as pd
-from utils.time_utils import time_it
+from utils.enums_classes import StorageFormat
+from utils.data_wrangling_utils import get_typed_dataframe
+from utils.local_storage_utils import LocalObjectStore
+from utils.metrics_utils import timed, metrics
 from utils.logging_utils import Logger
 
+if TYPE_CHECKING:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
 
 info_log = Logger(name=__name__, level=logging.INFO).return_logger()
 
 
 def get_boto_session(config: dict) -> boto3.session.Session:
-    """Returns a Boto3 session"""
+    """Returns a Boto3 session. boto3 is only imported here, so that runs writing to a local directory never load
+    it"""
+    import boto3
     return boto3.Session(aws_access_key_id=config["aws_access_key"],
                          aws_secret_access_key=config["aws_secret_access_key"])
 
@@ -21,36 +29,393 @@ def get_s3_client(session: boto3.session.Session) -> boto3.session.Session.clien
     return session.client('s3')
 
 
-def get_s3_resource(session: boto3.session.Session) -> boto3.session.Session.resource:
-    """Returns an s3 resource"""
-    return session.resource('s3')
+CONTENT_HASH_KEY = "content-hash"
+ROWS_PER_CHUNK = 50_000
+MULTIPART_SIZE = 8 * 1024 * 1024
+MAX_UPLOAD_CONCURRENCY = 8
 
 
-def get_s3_key(metadata: dict) -> str:
-    """Returns the S3 key to the dataframe"""
-    return metadata["user"] + "/" + metadata["title"] + "/" + metadata["title"] + ".csv"
+def get_transfer_config(s3_client) -> TransferConfig or None:
+    """Returns the multipart settings of uploads to S3, or None for a local object store, which writes files
+    directly"""
+    if isinstance(s3_client, LocalObjectStore):
+        return None
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=MULTIPART_SIZE,
+                          multipart_chunksize=MULTIPART_SIZE,
+                          max_concurrency=MAX_UPLOAD_CONCURRENCY)
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file object buffering what a serializer writes until it is drained. It reports the total number of
+    bytes written as its position, so that writers computing offsets, such as Parquet's, can stream into it"""
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.buffer += b
+        self.position += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        """Returns and forgets everything written since the last drain"""
+        chunk = bytes(self.buffer)
+        self.buffer.clear()
+        return chunk
+
+
+class ChunkReader(io.RawIOBase):
+    """Read-only file object over the byte chunks yielded by a serializer, consuming them as they are read"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        super().__init__()
+        self.chunks = chunks
+        self.chunk = b""
+        self.offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while self.offset == len(self.chunk):
+            self.chunk = next(self.chunks, None)
+            self.offset = 0
+            if self.chunk is None:
+                self.chunk = b""
+                return 0
+        size = min(len(b), len(self.chunk) - self.offset)
+        b[:size] = self.chunk[self.offset:self.offset + size]
+        self.offset += size
+        return size
+
+
+class S3RangeReader(io.RawIOBase):
+    """Seekable read-only file object over an S3 object, downloading only the byte ranges that are read. Lets
+    Parquet readers fetch the footer and the column chunks they need instead of the whole object"""
+
+    def __init__(self, bucket: str, s3_client: boto3.session.Session.client, key: str, size: int):
+        super().__init__()
+        self.bucket = bucket
+        self.s3_client = s3_client
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, b) -> int:
+        size = min(len(b), self.size - self.position)
+        if size <= 0:
+            return 0
+        obj = self.s3_client.get_object(Bucket=self.bucket,
+                                        Key=self.key,
+                                        Range=f"bytes={self.position}-{self.position + size - 1}")
+        data = obj["Body"].read()
+        b[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def get_s3_range_reader(bucket: str,
+                        s3_client: boto3.session.Session.client,
+                        key: str) -> io.BufferedReader or None:
+    """Returns a buffered, seekable reader over an S3 object, or None if the object does not exist"""
+    try:
+        size = s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    except s3_client.exceptions.ClientError:
+        return None
+    return io.BufferedReader(S3RangeReader(bucket=bucket, s3_client=s3_client, key=key, size=size),
+                             buffer_size=1024 * 1024)
+
+
+def iter_csv_chunks(df: pd.DataFrame, rows_per_chunk: int = ROWS_PER_CHUNK) -> Iterator[bytes]:
+    """Serializes a dataframe to CSV a few thousand rows at a time"""
+    for start in range(0, max(len(df), 1), rows_per_chunk):
+        yield df.iloc[start:start + rows_per_chunk].to_csv(index=False, header=start == 0).encode("utf-8")
+
+
+def iter_parquet_chunks(df: pd.DataFrame,
+                        rows_per_chunk: int = ROWS_PER_CHUNK,
+                        compression: str = "zstd",
+                        schema_metadata: dict = None) -> Iterator[bytes]:
+    """Serializes a dataframe to compressed Parquet one row group at a time, adding any schema metadata supplied to
+    the footer"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema_metadata:
+        table = table.replace_schema_metadata({**table.schema.metadata, **schema_metadata})
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, table.schema, compression=compression) as writer:
+        for start in range(0, max(table.num_rows, 1), rows_per_chunk):
+            writer.write_table(table.slice(start, rows_per_chunk))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def upload_chunks_to_s3(bucket: str,
+                        s3_client: boto3.session.Session.client,
+                        key: str,
+                        chunks: Iterator[bytes],
+                        metadata: dict = None) -> None:
+    """Streams the chunks yielded by a serializer to S3. Objects bigger than a part are sent as a multipart upload
+    whose parts are uploaded in parallel as soon as they fill up, so memory use does not grow with the object"""
+    s3_client.upload_fileobj(io.BufferedReader(ChunkReader(chunks)),
+                             bucket,
+                             key,
+                             ExtraArgs={"Metadata": metadata or {}},
+                             Config=get_transfer_config(s3_client))
+
+
+PARTITION_COLUMN = "year"
+MISSING_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+COLUMNS = ["id", "rating", "title", "year", "director", "actors", "countries"]
+
+
+def get_s3_key(metadata: dict,
+               storage_format: StorageFormat = StorageFormat.CSV,
+               partition_by_year: bool = False) -> str:
+    """Returns the S3 key to the dataframe. Year-partitioned Parquet datasets are stored under a prefix, which is
+    returned with a trailing slash"""
+    key = metadata["user"] + "/" + metadata["title"] + "/" + metadata["title"]
+    if partition_by_year:
+        return key + "/"
+    return key + "." + storage_format.value
+
+
+def get_change_log_key(metadata: dict, changed_at: pd.Timestamp, storage_format: StorageFormat) -> str:
+    """Returns the S3 key of the change log entries of a run. Each run writes its own object under the playlist's
+    changes/ prefix, so the log is append-only"""
+    return metadata["user"] + "/" + metadata["title"] + "/changes/" + changed_at.strftime("%Y%m%dT%H%M%S%fZ") + \
+        "." + storage_format.value
+
 
+def get_s3_metadata_key(key: str) -> str:
+    """Returns the key of the object carrying the metadata of a dataset: the object itself or, for partitioned
+    datasets, the _SUCCESS marker written after all partitions"""
+    return key + "_SUCCESS" if key.endswith("/") else key
 
-@time_it
+
+@timed("read_csv_from_s3")
 def read_csv_from_s3(bucket: str,
                      s3_client: boto3.session.Session.client,
                      key: str) -> pd.DataFrame or None:
-    """Reads the .csv file containing the playlist from S3"""
+    """Reads the .csv file containing the playlist from S3, parsing the body as it is downloaded"""
     try:
         obj = s3_client.get_object(Bucket=bucket, Key=key)
-        buffer = io.BytesIO(obj['Body'].read())
-        return pd.read_csv(buffer)
-    except ClientError:
+    except s3_client.exceptions.ClientError:
         info_log.info("Scraping this playlist for the first time.")
         return None
+    return pd.read_csv(obj['Body'])
+
+
+def list_s3_keys(bucket: str, s3_client: boto3.session.Session.client, prefix: str) -> list[str]:
+    """Lists every key under a prefix"""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [obj["Key"] for page in paginator.paginate(Bucket=bucket, Prefix=prefix) for obj in page.get("Contents", [])]
+
+
+def list_s3_prefixes(bucket: str, s3_client: boto3.session.Session.client, prefix: str) -> list[str]:
+    """Lists the prefixes one level below a prefix, like the directories right under a directory, without listing
+    the keys under them"""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [common_prefix["Prefix"] for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/")
+            for common_prefix in page.get("CommonPrefixes", [])]
+
+
+def get_s3_object_metadata(bucket: str,
+                           s3_client: boto3.session.Session.client,
+                           key: str) -> dict or None:
+    """Returns the user metadata stored with an S3 object through a HEAD request, or None if the object does not
+    exist"""
+    try:
+        return s3_client.head_object(Bucket=bucket, Key=key)["Metadata"]
+    except s3_client.exceptions.ClientError:
+        return None
+
 
+def is_content_unchanged(object_metadata: dict or None, content_hash: str) -> bool:
+    """Checks whether the stored dataset has the same content hash as the one about to be written"""
+    return bool(object_metadata) and object_metadata.get(CONTENT_HASH_KEY) == content_hash
 
-@time_it
+
+def update_s3_object_metadata(bucket: str,
+                              s3_client: boto3.session.Session.client,
+                              key: str,
+                              metadata: dict) -> None:
+    """Replaces the user metadata of an S3 object with a server-side copy onto itself, without uploading it again"""
+    s3_client.copy_object(Bucket=bucket,
+                          Key=key,
+                          CopySource={"Bucket": bucket, "Key": key},
+                          Metadata=metadata,
+                          MetadataDirective="REPLACE")
+
+
+@timed("write_csv_to_s3")
 def write_csv_to_s3(bucket: str,
-                    s3_resource: boto3.session.Session.resource,
+                    s3_client: boto3.session.Session.client,
                     filename: str,
-                    df: pd.DataFrame):
-    """Writes a Pandas dataframe to S3 as a .csv file"""
-    csv_buffer = io.BytesIO()
-    df.to_csv(csv_buffer, index=False)
-    s3_resource.Object(bucket, f'{filename}').put(Body=csv_buffer.getvalue())
+                    df: pd.DataFrame,
+                    metadata: dict = None):
+    """Writes a Pandas dataframe to S3 as a .csv file. Uses a client rather than a resource since clients, unlike
+    resources, can be shared between threads"""
+    upload_chunks_to_s3(bucket=bucket, s3_client=s3_client, key=filename, chunks=iter_csv_chunks(df), metadata=metadata)
+
+
+def read_parquet_object(bucket: str,
+                        s3_client: boto3.session.Session.client,
+                        key: str,
+                        columns: list[str] = None) -> pd.DataFrame or None:
+    """Reads a .parquet object through ranged requests, so that only the requested columns are downloaded"""
+    import pyarrow.parquet as pq
+    reader = get_s3_range_reader(bucket=bucket, s3_client=s3_client, key=key)
+    if reader is None:
+        return None
+    with reader:
+        return pq.read_table(reader, columns=columns).to_pandas()
+
+
+@timed("read_parquet_from_s3")
+def read_parquet_from_s3(bucket: str,
+                         s3_client: boto3.session.Session.client,
+                         key: str,
+                         columns: list[str] = None) -> pd.DataFrame or None:
+    """Reads the .parquet file containing the playlist from S3, or returns None if it does not exist"""
+    return read_parquet_object(bucket=bucket, s3_client=s3_client, key=key, columns=columns)
+
+
+@timed("write_parquet_to_s3")
+def write_parquet_to_s3(bucket: str,
+                        s3_client: boto3.session.Session.client,
+                        filename: str,
+                        df: pd.DataFrame,
+                        metadata: dict = None):
+    """Writes a Pandas dataframe to S3 as a typed, compressed .parquet file"""
+    upload_chunks_to_s3(bucket=bucket,
+                        s3_client=s3_client,
+                        key=filename,
+                        chunks=iter_parquet_chunks(get_typed_dataframe(df)),
+                        metadata=metadata)
+
+
+def get_partition_key(prefix: str, year) -> str:
+    """Returns the key of the Hive-style partition file of a year"""
+    return f"{prefix}{PARTITION_COLUMN}={MISSING_PARTITION if pd.isna(year) else int(year)}/part-0.parquet"
+
+
+def get_partition_year(key: str) -> float:
+    """Parses the year out of the key of a partition file"""
+    partition = key.split(f"{PARTITION_COLUMN}=")[-1].split("/")[0]
+    return float("nan") if partition == MISSING_PARTITION else int(partition)
+
+
+@timed("read_partitioned_parquet_from_s3")
+def read_partitioned_parquet_from_s3(bucket: str,
+                                     s3_client: boto3.session.Session.client,
+                                     key: str,
+                                     columns: list[str] = None) -> pd.DataFrame or None:
+    """Reads a year-partitioned Parquet dataset from S3, restoring the year column out of the partition keys, or
+    returns None if it does not exist"""
+    keys = [k for k in list_s3_keys(bucket=bucket, s3_client=s3_client, prefix=key) if k.endswith(".parquet")]
+    if not keys:
+        return None
+    file_columns = [column for column in columns if column != PARTITION_COLUMN] if columns else None
+    partitions = []
+    for partition_key in keys:
+        partition = read_parquet_object(bucket=bucket, s3_client=s3_client, key=partition_key, columns=file_columns)
+        partition[PARTITION_COLUMN] = pd.array([get_partition_year(partition_key)] * len(partition), dtype="Int64")
+        partitions.append(partition)
+    df = pd.concat(partitions, ignore_index=True)
+    return df[[column for column in (columns or COLUMNS) if column in df.columns]]
+
+
+@timed("write_partitioned_parquet_to_s3")
+def write_partitioned_parquet_to_s3(bucket: str,
+                                    s3_client: boto3.session.Session.client,
+                                    filename: str,
+                                    df: pd.DataFrame,
+                                    metadata: dict = None):
+    """Writes a Pandas dataframe to S3 as a Parquet dataset partitioned by year, deleting the partitions of years
+    that are no longer in the dataframe and writing a _SUCCESS marker carrying the metadata last"""
+    df = get_typed_dataframe(df)
+    written_keys = set()
+    for year, partition in df.groupby(PARTITION_COLUMN, dropna=False, sort=False):
+        partition_key = get_partition_key(prefix=filename, year=year)
+        upload_chunks_to_s3(bucket=bucket,
+                            s3_client=s3_client,
+                            key=partition_key,
+                            chunks=iter_parquet_chunks(partition.drop(columns=PARTITION_COLUMN)))
+        written_keys.add(partition_key)
+
+    stale_keys = [k for k in list_s3_keys(bucket=bucket, s3_client=s3_client, prefix=filename)
+                  if k.endswith(".parquet") and k not in written_keys]
+    for stale_key in stale_keys:
+        s3_client.delete_object(Bucket=bucket, Key=stale_key)
+
+    s3_client.put_object(Bucket=bucket, Key=get_s3_metadata_key(filename), Body=b"", Metadata=metadata or {})
+
+
+def read_dataframe_from_s3(bucket: str,
+                           s3_client: boto3.session.Session.client,
+                           key: str,
+                           storage_format: StorageFormat,
+                           columns: list[str] = None) -> pd.DataFrame or None:
+    """Reads the playlist from S3 in the supplied storage format"""
+    if storage_format == StorageFormat.CSV:
+        return read_csv_from_s3(bucket=bucket, s3_client=s3_client, key=key)
+    if key.endswith("/"):
+        return read_partitioned_parquet_from_s3(bucket=bucket, s3_client=s3_client, key=key, columns=columns)
+    return read_parquet_from_s3(bucket=bucket, s3_client=s3_client, key=key, columns=columns)
+
+
+def write_dataframe_to_s3(bucket: str,
+                          s3_client: boto3.session.Session.client,
+                          filename: str,
+                          df: pd.DataFrame,
+                          storage_format: StorageFormat,
+                          metadata: dict = None) -> None:
+    """Writes the playlist to S3 in the supplied storage format"""
+    if storage_format == StorageFormat.CSV:
+        write_csv_to_s3(bucket=bucket, s3_client=s3_client, filename=filename, df=df, metadata=metadata)
+    elif filename.endswith("/"):
+        write_partitioned_parquet_to_s3(bucket=bucket, s3_client=s3_client, filename=filename, df=df, metadata=metadata)
+    else:
+        write_parquet_to_s3(bucket=bucket, s3_client=s3_client, filename=filename, df=df, metadata=metadata)
+    metrics.increment("rows_written_total", len(df), target="s3", dataset="playlist")
+
+
+@timed("write_change_log_to_s3")
+def write_change_log_to_s3(bucket: str,
+                           s3_client: boto3.session.Session.client,
+                           filename: str,
+                           change_log: pd.DataFrame,
+                           storage_format: StorageFormat):
+    """Writes the change log entries of a run to S3 in the supplied storage format"""
+    chunks = iter_csv_chunks(change_log) if storage_format == StorageFormat.CSV else iter_parquet_chunks(change_log)
+    upload_chunks_to_s3(bucket=bucket, s3_client=s3_client, key=filename, chunks=chunks)
+    metrics.increment("rows_written_total", len(change_log), target="s3", dataset="change_log")
@@ -0,0 +1,102 @@
+from __future__ import annotations
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+from utils.enums_classes import ParallelTechnique, StorageFormat, DatabaseWriteMode, DatabaseSchema
+from utils.http_utils import FetchConfig
+from utils.cache_utils import ResponseCache, get_response_cache
+from utils.local_storage_utils import LocalObjectStore
+
+if TYPE_CHECKING:
+    import boto3
+    import sqlalchemy
+    from utils.http_utils import HttpClient
+    from utils.film_store_utils import FilmStore
+
+
+@dataclass
+class ScrapingOptions:
+    parallel_technique: ParallelTechnique = ParallelTechnique.SYNCHRONOUS
+    over_write: bool = False
+    write_to_local_db: bool = False
+    database_mode: DatabaseWriteMode = DatabaseWriteMode.UPSERT
+    database_schema: DatabaseSchema = DatabaseSchema.FLAT
+    change_log: bool = True
+    streaming: bool = False
+    queue_size: int = 16
+    fetch_config: FetchConfig = field(default_factory=FetchConfig)
+    cache_dir: str or None = None
+    cache_ttl: float = 168 * 3600
+    cache_max_size: int = 512 * 1024 * 1024
+    film_store_path: str or None = None
+    work_dir: str or None = None
+    resume: bool = False
+    incremental: bool = False
+    incremental_sort: str or None = None
+    full_refresh_days: float = 7.0
+    storage_format: StorageFormat = StorageFormat.CSV
+    partition_by_year: bool = False
+    output_dir: str or None = None
+    ratings_matrix: bool = False
+
+
+@dataclass
+class ScrapingResources:
+    """Clients and pools created once per process and shared by every playlist it scrapes"""
+    http_client: HttpClient
+    executor: concurrent.futures.Executor or None
+    boto_session: boto3.session.Session or None
+    s3_client: boto3.session.Session.client or LocalObjectStore
+    bucket: str
+    cache: ResponseCache or None = None
+    film_store: FilmStore or None = None
+    engine: sqlalchemy.engine.Engine or None = None
+
+    def close(self) -> None:
+        """Shuts down the pools and closes the clients and local stores"""
+        self.http_client.close()
+        if self.engine is not None:
+            self.engine.dispose()
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.cache is not None:
+            self.cache.close()
+        if self.film_store is not None:
+            self.film_store.close()
+
+
+def get_database_engine(options: ScrapingOptions, config: dict) -> sqlalchemy.engine.Engine or None:
+    """Returns the engine of the local Postgres database if the run writes to it. SQLAlchemy is only imported here,
+    so that runs without --database never load it"""
+    if not options.write_to_local_db:
+        return None
+    from utils.database_utils import get_engine
+    return get_engine(config=config)
+
+
+def get_scraping_resources(options: ScrapingOptions, config: dict) -> ScrapingResources:
+    """Creates the HTTP client, process pool, S3 client, response cache, film store and database engine used by a
+    run. With an output directory the playlists are written to a local object store instead of S3, and boto3 is never
+    imported. The scraping modules are only imported here, so that parsing the command line never loads them"""
+    from utils.http_utils import HttpClient
+    from utils.film_store_utils import get_film_store
+    from utils.generic_scraping_functions import get_process_pool
+    from utils.s3_utils import get_boto_session, get_s3_client
+    if options.output_dir is not None:
+        boto_session = None
+        s3_client = LocalObjectStore()
+        bucket = options.output_dir
+    else:
+        boto_session = get_boto_session(config=config)
+        s3_client = get_s3_client(session=boto_session)
+        bucket = config["s3_bucket"]
+    return ScrapingResources(http_client=HttpClient(config=options.fetch_config),
+                             executor=get_process_pool(parallel_technique=options.parallel_technique),
+                             boto_session=boto_session,
+                             s3_client=s3_client,
+                             bucket=bucket,
+                             cache=get_response_cache(cache_dir=options.cache_dir or options.work_dir,
+                                                      ttl=options.cache_ttl,
+                                                      max_size=options.cache_max_size),
+                             film_store=get_film_store(path=options.film_store_path),
+                             engine=get_database_engine(options=options, config=config))
@@ -21,3 +21,9 @@ def get_playlist_title(groups: list[str]) -> str:
         return "ratings"
     else:
         return groups[-1].replace("-", "_")
+
+
+def get_sorted_playlist_url(groups: list[str], sort: str) -> str:
+    """Rebuilds the playlist URL out of its capture groups, dropping any existing sort order and page number and
+    sorting it by the supplied Letterboxd sort slug instead"""
+    return f"{groups[0]}{groups[1]}/{groups[2]}/{groups[3]}/by/{sort}/"